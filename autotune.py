@@ -0,0 +1,458 @@
+"""吞吐量自动调优: batch_size、梯度累积、打包和分词进程数
+
+在训练数据的一个样本上做几步试训练(学习率为0，不改变模型权重)，测量每秒处理的有效token数
+(不含padding)和峰值内存，选出最快且不超过内存上限的组合:
+    num_proc     单独测量分词耗时，按数据总条数外推后取最快的进程数
+    use_packing  打包与不打包分别分词和试训练
+    batch_size / gradient_accumulation_steps
+                 保持有效批次 batch_size * gradient_accumulation_steps 不变，batch_size从小到大尝试，
+                 超出内存上限、OOM或按前两次结果预计会超出时停止增大；
+                 开启按长度分组时，不打包的试训练与训练相同，按 batch_size * max_length 的token预算组批
+有GPU且安装了unsloth时按训练引擎的方式加载模型；否则用transformers(和peft)加载，
+--tiny 使用随机初始化的小模型，没有GPU也可以完整运行。
+
+用法:
+    python -m autotune --config config.json --data train.jsonl --write
+    python -m autotune --config config.json --data train.jsonl --tiny --sample-size 256
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import time
+
+from formatting import format_dataset, resolve_template
+from memory_planner import available_memory, format_bytes
+from packing import collator_for
+from train_engine import (
+    DEFAULT_CONFIG, LORA_TARGET_MODULES, TrainingEngine, load_config, normalize_config, resolve_model_path,
+)
+from token_cache import tokenize_dataset
+
+# 吞吐相差不到该比例时选择内存占用更小的组合
+TIE_TOLERANCE = 0.03
+
+
+def _print_log(message):
+    sys.stdout.write(message)
+    sys.stdout.flush()
+
+
+def reset_peak_memory(device):
+    """重置峰值内存统计；CPU上通过 /proc/self/clear_refs 重置VmHWM(仅Linux)"""
+    import torch
+
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+        torch.cuda.reset_peak_memory_stats(device)
+        return
+    try:
+        with open("/proc/self/clear_refs", 'w') as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def peak_memory(device):
+    """上次重置以来的峰值内存字节数，无法获取时返回None"""
+    import torch
+
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+        return torch.cuda.max_memory_allocated(device)
+    try:
+        with open("/proc/self/status", 'r') as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def is_oom(error):
+    return "out of memory" in str(error).lower() or type(error).__name__ == "OutOfMemoryError"
+
+
+def candidate_batch_sizes(effective_batch, max_batch_size=64):
+    """有效批次的约数，从小到大"""
+    return [size for size in range(1, min(effective_batch, max_batch_size) + 1) if effective_batch % size == 0]
+
+
+def candidate_num_proc(current):
+    """1、2、4...直到CPU核数，另加当前设置"""
+    cpus = os.cpu_count() or 1
+    values = {current} if current <= cpus else set()
+    value = 1
+    while value <= cpus:
+        values.add(value)
+        value *= 2
+    return sorted(values)
+
+
+def tiny_tokenizer(texts, vocab_size=512):
+    """在样本文本上训练一个字节级BPE分词器，供随机小模型使用"""
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers, trainers
+    from transformers import PreTrainedTokenizerFast
+
+    backend = Tokenizer(models.BPE())
+    backend.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    backend.decoder = decoders.ByteLevel()
+    trainer = trainers.BpeTrainer(
+        vocab_size=vocab_size, special_tokens=["<pad>", "</s>"],
+        initial_alphabet=pre_tokenizers.ByteLevel.alphabet(), show_progress=False,
+    )
+    backend.train_from_iterator(texts, trainer=trainer)
+    return PreTrainedTokenizerFast(tokenizer_object=backend, pad_token="<pad>", eos_token="</s>")
+
+
+def tiny_model(tokenizer, max_length):
+    """随机初始化的小型Llama模型"""
+    from transformers import LlamaConfig, LlamaForCausalLM
+
+    config = LlamaConfig(
+        vocab_size=len(tokenizer), hidden_size=64, intermediate_size=176, num_hidden_layers=2,
+        num_attention_heads=4, num_key_value_heads=2, max_position_embeddings=max(max_length, 128),
+        pad_token_id=tokenizer.pad_token_id, eos_token_id=tokenizer.eos_token_id,
+    )
+    return LlamaForCausalLM(config)
+
+
+def _add_lora(model, cfg):
+    from peft import LoraConfig, get_peft_model
+
+    names = {name.rsplit(".", 1)[-1] for name, _ in model.named_modules()}
+    lora_config = LoraConfig(
+        r=cfg["lora_rank"], target_modules=[m for m in LORA_TARGET_MODULES if m in names],
+        bias="none", task_type="CAUSAL_LM",
+    )
+    # 与unsloth的默认设置一致，LoRA训练时开启梯度检查点
+    model.gradient_checkpointing_enable(gradient_checkpointing_kwargs={"use_reentrant": False})
+    model.enable_input_require_grads()
+    return get_peft_model(model, lora_config)
+
+
+def _has_unsloth():
+    try:
+        import unsloth  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def load_trial_model(engine, texts, tiny, log):
+    """返回 (模型, tokenizer, 设备)"""
+    import torch
+
+    cfg = engine.config
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    if tiny:
+        tokenizer = tiny_tokenizer(texts)
+        model = tiny_model(tokenizer, cfg["max_length"])
+        log(f"使用随机初始化的小模型，参数量 {sum(p.numel() for p in model.parameters()):,}\n")
+    elif device.type == "cuda" and _has_unsloth():
+        # 与正式训练相同的加载方式(量化、LoRA和梯度检查点)
+        model, tokenizer = engine.load_model()
+        return model, tokenizer, device
+    else:
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+
+        model_path = resolve_model_path(cfg)
+        if cfg["use_4bit"] or cfg["use_8bit"]:
+            log("没有可用的unsloth/GPU，试训练不使用量化，内存测量结果会偏大\n")
+        dtype = torch.float16 if device.type == "cuda" and cfg["use_fp16"] else torch.float32
+        tokenizer = AutoTokenizer.from_pretrained(model_path, local_files_only=cfg["offline_mode"])
+        model = AutoModelForCausalLM.from_pretrained(model_path, dtype=dtype, local_files_only=cfg["offline_mode"])
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    if cfg["use_lora"]:
+        model = _add_lora(model, cfg)
+    return model.to(device), tokenizer, device
+
+
+def time_tokenization(dataset, tokenizer, max_length, packing, num_proc):
+    start = time.perf_counter()
+    tokenize_dataset(dataset, tokenizer, max_length, packing=packing, num_proc=num_proc)
+    return time.perf_counter() - start
+
+
+def tune_num_proc(sample, total_rows, tokenizer, cfg, log):
+    """测量各进程数的分词耗时，按 固定开销 + 每条耗时 * 总条数 外推，返回 (最快的进程数, 各进程数的预计秒数)"""
+    small = sample.select(range(min(16, len(sample))))
+    predicted = {}
+    for num_proc in candidate_num_proc(cfg["num_proc"]):
+        if num_proc > len(sample):
+            continue
+        overhead = time_tokenization(small, tokenizer, cfg["max_length"], cfg["use_packing"], num_proc)
+        seconds = time_tokenization(sample, tokenizer, cfg["max_length"], cfg["use_packing"], num_proc)
+        per_row = max(seconds - overhead, 0.0) / max(len(sample) - len(small), 1)
+        predicted[num_proc] = overhead + per_row * total_rows
+        log(f"分词 num_proc={num_proc}: 样本 {seconds:.2f} 秒，预计全部数据 {predicted[num_proc]:.1f} 秒\n")
+    # 差距不大时选择进程数少的
+    fastest = min(predicted.values())
+    best = min(p for p, seconds in predicted.items() if seconds <= fastest * (1 + TIE_TOLERANCE))
+    return best, predicted
+
+
+def _index_batches(examples, batch_size, max_tokens, seed):
+    """循环产出样本下标列表；max_tokens不为None时与训练相同，按长度分组和token预算组批"""
+    if max_tokens:
+        from length_sampler import TokenBudgetBatchSampler
+
+        sampler = TokenBudgetBatchSampler([len(row["input_ids"]) for row in examples], max_tokens, seed=seed)
+        epoch = 0
+        while True:
+            sampler.set_epoch(epoch)
+            yield from sampler
+            epoch += 1
+    rng = random.Random(seed)
+    order = list(range(len(examples)))
+    while True:
+        rng.shuffle(order)
+        for start in range(0, len(order) - batch_size + 1, batch_size):
+            yield order[start:start + batch_size]
+
+
+def pad_collate(pad_id):
+    """padding到批内最长样本，与不打包时的训练批次相同"""
+    import torch
+
+    def collate(rows):
+        width = max(len(row["input_ids"]) for row in rows)
+        input_ids = torch.full((len(rows), width), pad_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(rows), width), dtype=torch.long)
+        for i, row in enumerate(rows):
+            input_ids[i, :len(row["input_ids"])] = torch.tensor(row["input_ids"], dtype=torch.long)
+            attention_mask[i, :len(row["input_ids"])] = 1
+        labels = input_ids.masked_fill(attention_mask == 0, -100)
+        return {"input_ids": input_ids, "attention_mask": attention_mask, "labels": labels}
+    return collate
+
+
+def _batches(examples, batch_size, collate, device, max_tokens=None, seed=0):
+    """循环产出 (批次, 真实token数)"""
+    for indices in _index_batches(examples, batch_size, max_tokens, seed):
+        rows = [examples[i] for i in indices]
+        batch = {key: value.to(device) if hasattr(value, "to") else value for key, value in collate(rows).items()}
+        yield batch, sum(len(row["input_ids"]) for row in rows)
+
+
+def run_trial(model, examples, batch_size, accum, collate, device, steps=3, warmup=1, max_seconds=60,
+              max_tokens=None):
+    """试训练warmup+steps个优化器步，返回 (有效token/秒, 样本/秒, 峰值内存字节数)"""
+    import torch
+
+    while len(examples) < batch_size:
+        examples = examples + examples
+    params = [p for p in model.parameters() if p.requires_grad]
+    # 学习率为0: 计算量和优化器状态与真实训练相同，但不改变权重
+    optimizer = torch.optim.AdamW(params, lr=0.0)
+    batches = _batches(examples, batch_size, collate, device, max_tokens=max_tokens)
+    model.train()
+    reset_peak_memory(device)
+    tokens = samples = 0
+    start = None
+    measured = 0
+    try:
+        for step in range(warmup + steps):
+            if step == warmup:
+                if device.type == "cuda":
+                    torch.cuda.synchronize(device)
+                start = time.perf_counter()
+            for _ in range(accum):
+                batch, real_tokens = next(batches)
+                loss = model(**batch).loss / accum
+                loss.backward()
+                if start is not None:
+                    tokens += real_tokens
+                    samples += len(batch["input_ids"])
+            optimizer.step()
+            optimizer.zero_grad(set_to_none=True)
+            if start is not None:
+                measured += 1
+                if time.perf_counter() - start > max_seconds:
+                    break
+        if device.type == "cuda":
+            torch.cuda.synchronize(device)
+        elapsed = max(time.perf_counter() - start, 1e-9)
+        return tokens / elapsed, samples / elapsed, peak_memory(device)
+    finally:
+        optimizer.zero_grad(set_to_none=True)
+        del optimizer, batches
+        gc.collect()
+        if device.type == "cuda":
+            torch.cuda.empty_cache()
+
+
+def _predicted_peak(trials, batch_size):
+    """按最近两次成功试训练的峰值内存对batch_size线性外推"""
+    ok = [t for t in trials if t["peak_memory"]]
+    if len(ok) < 2:
+        return None
+    a, b = ok[-2], ok[-1]
+    per_sample = (b["peak_memory"] - a["peak_memory"]) / (b["batch_size"] - a["batch_size"])
+    return b["peak_memory"] + per_sample * (batch_size - b["batch_size"])
+
+
+def autotune(config, tiny=False, sample_size=512, steps=3, effective_batch=None, max_batch_size=64,
+             packing_options=(False, True), memory_fraction=0.9, log=None, should_stop=None):
+    """搜索吞吐最高的设置，返回 {"best": 调优项, "trials": 试训练记录, "num_proc": 各进程数的预计分词秒数}"""
+    from datasets import Dataset
+
+    log = log or _print_log
+    should_stop = should_stop or (lambda: False)
+    engine = TrainingEngine(config, log=log)
+    cfg = engine.config
+    effective_batch = effective_batch or cfg["batch_size"] * cfg["gradient_accumulation_steps"]
+    limit, device_name = available_memory()
+    limit = limit * memory_fraction if limit else None
+    log(f"自动调优: 有效批次 {effective_batch}，内存上限 {format_bytes(limit) if limit else '未知'} ({device_name})\n")
+
+    template = resolve_template(cfg["data_path"], cfg["template"])
+    records = engine.load_records(template)
+    # 样本放在内存中，避免命中datasets的map缓存导致分词计时失真
+    sample = Dataset.from_dict(records.select(range(min(sample_size, len(records)))).to_dict())
+    if len(sample) == 0:
+        raise ValueError("训练数据为空")
+    # 小模型的tokenizer用样本的原始字段训练
+    texts = sample["text"] if template == "text" else [json.dumps(row, ensure_ascii=False) for row in sample]
+    model, tokenizer, device = load_trial_model(engine, texts, tiny, log)
+    sample = format_dataset(sample, template, tokenizer, log=log)
+
+    num_proc, tokenize_seconds = tune_num_proc(sample, len(records), tokenizer, cfg, log)
+    pad_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else 0
+
+    trials = []
+    for packing in packing_options:
+        tokenized = tokenize_dataset(sample, tokenizer, cfg["max_length"], packing=packing)
+        examples = [row for row in tokenized if len(row["input_ids"]) > 1]
+        if not examples:
+            continue
+        collate = collator_for(model, pad_id) if packing else pad_collate(pad_id)
+        ladder = []  # 本打包方式下成功的试训练，用于外推峰值内存
+        for batch_size in candidate_batch_sizes(effective_batch, max_batch_size):
+            # 与训练相同: 不打包且按长度分组时，batch_size决定token预算
+            max_tokens = None
+            if cfg["group_by_length"] and not packing:
+                max_tokens = cfg["token_budget"] or batch_size * cfg["max_length"]
+            if should_stop():
+                log("自动调优已停止\n")
+                break
+            trial = {
+                "use_packing": packing,
+                "batch_size": batch_size,
+                "gradient_accumulation_steps": effective_batch // batch_size,
+                "tokens_per_second": None,
+                "samples_per_second": None,
+                "peak_memory": None,
+            }
+            trials.append(trial)
+            predicted = _predicted_peak(ladder, batch_size)
+            if limit and predicted and predicted > limit:
+                trial["status"] = "skipped"
+                log(f"跳过 packing={packing} batch_size={batch_size}: 预计峰值内存 {format_bytes(predicted)} 超出上限\n")
+                break
+            try:
+                tps, sps, peak = run_trial(model, examples, batch_size, trial["gradient_accumulation_steps"],
+                                           collate, device, steps=steps, max_tokens=max_tokens)
+            except RuntimeError as e:
+                if not is_oom(e):
+                    raise
+                trial["status"] = "oom"
+                log(f"packing={packing} batch_size={batch_size}: 内存不足\n")
+                break
+            trial.update(tokens_per_second=round(tps, 1), samples_per_second=round(sps, 2), peak_memory=peak)
+            trial["status"] = "over_limit" if limit and peak and peak > limit else "ok"
+            log(f"packing={packing} batch_size={batch_size} grad_accum={trial['gradient_accumulation_steps']}: "
+                f"{tps:.0f} tokens/s, {sps:.1f} 样本/s, 峰值内存 {format_bytes(peak) if peak else '未知'}\n")
+            if trial["status"] == "over_limit":
+                break
+            ladder.append(trial)
+
+    ok = [t for t in trials if t["status"] == "ok"]
+    if not ok:
+        raise RuntimeError("没有可以运行的组合，请减小最大长度或有效批次")
+    fastest = max(t["tokens_per_second"] for t in ok)
+    close = [t for t in ok if t["tokens_per_second"] >= fastest * (1 - TIE_TOLERANCE)]
+    chosen = min(close, key=lambda t: (t["peak_memory"] or 0, -t["tokens_per_second"]))
+    best = {
+        "batch_size": str(chosen["batch_size"]),
+        "gradient_accumulation_steps": str(chosen["gradient_accumulation_steps"]),
+        "use_packing": chosen["use_packing"],
+        "num_proc": str(num_proc),
+    }
+    log(f"最佳设置: batch_size={best['batch_size']}, grad_accum={best['gradient_accumulation_steps']}, "
+        f"packing={best['use_packing']}, num_proc={best['num_proc']} ({chosen['tokens_per_second']:.0f} tokens/s)\n")
+
+    del model
+    gc.collect()
+    return {"best": best, "trials": trials, "num_proc": tokenize_seconds}
+
+
+def update_config_file(path, values):
+    """把调优结果合并写入配置文件(原子替换)，文件不存在时新建"""
+    config = {}
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+    config.update(values)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(config, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    return path
+
+
+def format_trials(trials):
+    lines = [f"{'packing':>8} {'batch':>6} {'accum':>6} {'tokens/s':>10} {'样本/s':>8} {'峰值内存':>10}  状态"]
+    for t in trials:
+        tps = f"{t['tokens_per_second']:.0f}" if t["tokens_per_second"] is not None else "-"
+        sps = f"{t['samples_per_second']:.1f}" if t["samples_per_second"] is not None else "-"
+        peak = format_bytes(t["peak_memory"]) if t["peak_memory"] else "-"
+        lines.append(f"{str(t['use_packing']):>8} {t['batch_size']:>6} {t['gradient_accumulation_steps']:>6} "
+                     f"{tps:>10} {sps:>8} {peak:>10}  {t['status']}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m autotune", description="训练吞吐量自动调优")
+    parser.add_argument("--config", help="配置文件路径，--write时结果写回该文件(默认config.json)")
+    parser.add_argument("--data", help="训练数据文件，覆盖配置中的data_path")
+    parser.add_argument("--tiny", action="store_true", help="使用随机初始化的小模型(无需GPU和下载模型)")
+    parser.add_argument("--sample-size", type=int, default=512, help="参与试训练的样本条数")
+    parser.add_argument("--steps", type=int, default=3, help="每个组合计时的优化器步数")
+    parser.add_argument("--effective-batch", type=int, help="有效批次，默认为batch_size * gradient_accumulation_steps")
+    parser.add_argument("--max-batch-size", type=int, default=64)
+    parser.add_argument("--memory-fraction", type=float, default=0.9, help="可使用的显存/内存比例")
+    parser.add_argument("--write", action="store_true", help="把最佳设置写回配置文件")
+    parser.add_argument("--json", action="store_true", help="以JSON输出结果")
+    args = parser.parse_args(argv)
+
+    config_path = args.config or "config.json"
+    try:
+        config = load_config(args.config) if args.config else dict(DEFAULT_CONFIG)
+        if args.data:
+            config["data_path"] = args.data
+        normalize_config(config)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    result = autotune(
+        config, tiny=args.tiny, sample_size=args.sample_size, steps=args.steps,
+        effective_batch=args.effective_batch, max_batch_size=args.max_batch_size,
+        memory_fraction=args.memory_fraction, log=sys.stderr.write if args.json else _print_log,
+    )
+    if args.write:
+        update_config_file(config_path, result["best"])
+        (sys.stderr.write if args.json else _print_log)(f"已写入 {config_path}\n")
+    if args.json:
+        _print_log(json.dumps(result, ensure_ascii=False) + "\n")
+    else:
+        _print_log(format_trials(result["trials"]) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""比较同步保存与后台写入检查点时训练步的停顿
+
+用随机初始化的小型Llama在CPU上训练，每隔若干步保存一次:
+    sync:  model.save_pretrained + tokenizer.save_pretrained (原实现)
+    async: AsyncCheckpointWriter.submit (快照后后台写入)
+    python benchmarks/bench_checkpoint.py --hidden 512 --layers 8 --steps 40 --save-every 10
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+class _NullTokenizer:
+    """只写出一个小文件的tokenizer替身"""
+
+    def save_pretrained(self, path):
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, "tokenizer_config.json"), 'w') as f:
+            json.dump({"model_max_length": 512}, f)
+
+
+def build_model(hidden, layers, lora):
+    import torch
+    from transformers import LlamaConfig, LlamaForCausalLM
+
+    torch.manual_seed(0)
+    config = LlamaConfig(
+        vocab_size=8000, hidden_size=hidden, intermediate_size=hidden * 4,
+        num_hidden_layers=layers, num_attention_heads=8, num_key_value_heads=8,
+    )
+    model = LlamaForCausalLM(config)
+    if lora:
+        from peft import LoraConfig, get_peft_model
+        from train_engine import LORA_TARGET_MODULES
+        model = get_peft_model(model, LoraConfig(r=16, target_modules=LORA_TARGET_MODULES, task_type="CAUSAL_LM"))
+    return model
+
+
+def run(method, args):
+    import torch
+    from checkpoint_io import AsyncCheckpointWriter
+
+    model = build_model(args.hidden, args.layers, args.lora)
+    optimizer = torch.optim.AdamW([p for p in model.parameters() if p.requires_grad], lr=1e-4)
+    tokenizer = _NullTokenizer()
+    batch = torch.randint(0, 8000, (1, 32))
+    step_times = []
+    save_calls = []
+    with tempfile.TemporaryDirectory() as save_path:
+        writer = AsyncCheckpointWriter(save_path, tokenizer, keep_last=2) if method == "async" else None
+        for step in range(1, args.steps + 1):
+            start = time.perf_counter()
+            loss = model(input_ids=batch, labels=batch).loss
+            loss.backward()
+            optimizer.step()
+            optimizer.zero_grad()
+            if step % args.save_every == 0:
+                path = os.path.join(save_path, f"epoch_{step // args.save_every}")
+                save_start = time.perf_counter()
+                if writer:
+                    writer.submit(model, path)
+                else:
+                    model.save_pretrained(path)
+                    tokenizer.save_pretrained(os.path.join(path, "tokenizer"))
+                save_calls.append(time.perf_counter() - save_start)
+            step_times.append(time.perf_counter() - start)
+        drain_start = time.perf_counter()
+        if writer:
+            writer.close()
+        drain = time.perf_counter() - drain_start
+
+    plain_steps = sorted(t for i, t in enumerate(step_times, 1) if i % args.save_every != 0)
+    return {
+        "method": method,
+        "params_m": round(sum(p.numel() for p in model.parameters()) / 1e6, 1),
+        "lora": args.lora,
+        "median_step_ms": round(plain_steps[len(plain_steps) // 2] * 1000, 1),
+        "save_stall_ms_avg": round(sum(save_calls) / len(save_calls) * 1000, 1),
+        "save_stall_ms_max": round(max(save_calls) * 1000, 1),
+        "total_s": round(sum(step_times), 2),
+        "final_drain_s": round(drain, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="检查点保存停顿基准测试")
+    parser.add_argument("--hidden", type=int, default=512)
+    parser.add_argument("--layers", type=int, default=8)
+    parser.add_argument("--steps", type=int, default=40)
+    parser.add_argument("--save-every", type=int, default=10)
+    parser.add_argument("--lora", action="store_true", help="只训练并保存LoRA适配器")
+    args = parser.parse_args()
+    for method in ("sync", "async"):
+        print(json.dumps(run(method, args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""近似去重的召回率、误删率、速度和峰值内存
+
+生成随机token序列作为原始样本，再按比例复制其中一部分并随机替换少量token作为近似重复样本，
+用shingle集合的精确Jaccard相似度作为标准答案:
+    python benchmarks/bench_dedup.py --rows 50000 --dup-ratio 0.2 --threshold 0.85 --num-proc 2
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from dedup import NGRAM, deduplicate, shingle_hashes
+
+
+def peak_rss():
+    """Linux下的进程峰值内存(字节)，其他平台返回None"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak_rss():
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def jaccard(x, y):
+    x, y = shingle_hashes(x, NGRAM), shingle_hashes(y, NGRAM)
+    return len(np.intersect1d(x, y)) / len(np.union1d(x, y))
+
+
+def make_rows(args):
+    """返回 (样本列表, 所属原始样本编号, 与原始样本的Jaccard)，原始样本的相似度为1"""
+    rng = np.random.default_rng(0)
+    originals = int(args.rows * (1 - args.dup_ratio))
+    lengths = np.clip(rng.lognormal(5.0, 0.8, originals).astype(np.int64), 8, args.max_length)
+    rows = [rng.integers(3, 32000, n).tolist() for n in lengths]
+    groups = list(range(originals))
+    similarity = [1.0] * originals
+    for _ in range(args.rows - originals):
+        source = int(rng.integers(originals))
+        ids = list(rows[source])
+        # 替换0~edit_rate比例的token
+        edits = int(len(ids) * rng.uniform(0, args.edit_rate))
+        for position in rng.integers(0, len(ids), edits):
+            ids[position] = int(rng.integers(3, 32000))
+        rows.append(ids)
+        groups.append(source)
+        similarity.append(jaccard(rows[source], ids))
+    order = rng.permutation(len(rows))
+    return [rows[i] for i in order], np.array(groups)[order], np.array(similarity)[order]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="近似去重基准测试")
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--dup-ratio", type=float, default=0.2)
+    parser.add_argument("--edit-rate", type=float, default=0.05)
+    parser.add_argument("--max-length", type=int, default=1024)
+    parser.add_argument("--threshold", type=float, default=0.85)
+    parser.add_argument("--num-proc", type=int, default=1)
+    args = parser.parse_args()
+
+    from datasets import Dataset
+
+    rows, groups, similarity = make_rows(args)
+    dataset = Dataset.from_dict({"input_ids": rows})
+    tokens = sum(len(ids) for ids in rows)
+    del rows
+    gc.collect()
+    # 只统计去重过程的峰值内存，不含生成数据时的Python列表
+    reset_peak_rss()
+    start = time.perf_counter()
+    deduped, stats = deduplicate(dataset, args.threshold, num_proc=args.num_proc)
+    elapsed = time.perf_counter() - start
+
+    count = len(dataset)
+    kept = np.zeros(count, dtype=bool)
+    kept[deduped._indices.column(0).to_numpy() if deduped._indices is not None else slice(None)] = True
+
+    def recall(threshold):
+        """原始样本和相似度不低于threshold的副本应当只保留一条"""
+        strict = similarity >= threshold
+        expected = int(strict.sum() - len(np.unique(groups[strict])))
+        extra = np.maximum(np.bincount(groups[strict & kept], minlength=groups.max() + 1) - 1, 0).sum()
+        return expected, round((expected - int(extra)) / expected, 4) if expected else 1.0
+
+    expected, recall_at_threshold = recall(args.threshold)
+    # 整组都被删除说明不相似的样本被错误合并
+    lost_groups = len(np.unique(groups)) - len(np.unique(groups[kept]))
+    print(json.dumps({
+        "rows": count,
+        "tokens": tokens,
+        "threshold": args.threshold,
+        "duplicates": int(count - len(np.unique(groups))),
+        "duplicates_above_threshold": expected,
+        "removed": stats["removed"],
+        "recall": recall_at_threshold,
+        "recall_above_threshold_plus_0.05": recall(args.threshold + 0.05)[1],
+        "removed_below_threshold": int((~kept & (similarity < args.threshold)).sum()),
+        "lost_groups": lost_groups,
+        "saved_tokens_pct": round(stats["saved_tokens"] / stats["tokens"] * 100, 2),
+        "rows_per_second": round(count / elapsed),
+        "seconds": round(elapsed, 2),
+        "peak_rss_mb": round(peak_rss() / (1 << 20)) if peak_rss() else None,
+    }))
+
+
+if __name__ == "__main__":
+    main()
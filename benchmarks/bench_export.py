@@ -0,0 +1,181 @@
+"""测量合并导出的峰值内存和耗时
+
+生成一个Llama-2-7B形状(hidden 4096, intermediate 11008, vocab 32000, fp16)的随机基础模型
+和rank 16的LoRA适配器，层数可调，然后在子进程中分别运行:
+    naive:  from_pretrained + PeftModel + merge_and_unload + save_pretrained (原实现)
+    stream: export_engine.export_merged
+    python benchmarks/bench_export.py --layers 32 --methods stream
+    python benchmarks/bench_export.py --layers 4 --methods naive,stream
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+HIDDEN = 4096
+INTERMEDIATE = 11008
+VOCAB = 32000
+
+
+def build_base(path, layers, shard_bytes, rank):
+    """逐层生成随机权重并按分片写出，生成过程本身也只占用一个分片的内存"""
+    import torch
+    from safetensors.torch import save_file
+    from transformers import LlamaConfig
+
+    os.makedirs(path, exist_ok=True)
+    config = LlamaConfig(
+        vocab_size=VOCAB, hidden_size=HIDDEN, intermediate_size=INTERMEDIATE,
+        num_hidden_layers=layers, num_attention_heads=32, num_key_value_heads=32,
+        torch_dtype="float16", tie_word_embeddings=False,
+    )
+    config.save_pretrained(path)
+
+    def tensors():
+        yield "model.embed_tokens.weight", (VOCAB, HIDDEN)
+        for i in range(layers):
+            prefix = f"model.layers.{i}."
+            for name in ("q_proj", "k_proj", "v_proj", "o_proj"):
+                yield prefix + f"self_attn.{name}.weight", (HIDDEN, HIDDEN)
+            yield prefix + "mlp.gate_proj.weight", (INTERMEDIATE, HIDDEN)
+            yield prefix + "mlp.up_proj.weight", (INTERMEDIATE, HIDDEN)
+            yield prefix + "mlp.down_proj.weight", (HIDDEN, INTERMEDIATE)
+            yield prefix + "input_layernorm.weight", (HIDDEN,)
+            yield prefix + "post_attention_layernorm.weight", (HIDDEN,)
+        yield "model.norm.weight", (HIDDEN,)
+        yield "lm_head.weight", (VOCAB, HIDDEN)
+
+    weight_map = {}
+    pending = {}
+    pending_bytes = 0
+    shard_names = []
+    total = 0
+
+    def flush():
+        name = f"base-{len(shard_names):05d}.safetensors"
+        save_file(pending, os.path.join(path, name), metadata={"format": "pt"})
+        shard_names.append(name)
+        for key in pending:
+            weight_map[key] = name
+        pending.clear()
+
+    generator = torch.Generator().manual_seed(0)
+    adapter = {}
+    for name, shape in tensors():
+        tensor = (torch.randn(shape, generator=generator) * 0.02).to(torch.float16)
+        size = tensor.numel() * 2
+        if pending and pending_bytes + size > shard_bytes:
+            flush()
+            pending_bytes = 0
+        pending[name] = tensor
+        pending_bytes += size
+        total += size
+        module = name[:-len(".weight")]
+        if module.rsplit(".", 1)[-1] in ("q_proj", "k_proj", "v_proj", "o_proj", "gate_proj", "up_proj", "down_proj"):
+            out_features, in_features = shape
+            adapter[f"base_model.model.{module}.lora_A.weight"] = torch.randn(rank, in_features, generator=generator) * 0.01
+            adapter[f"base_model.model.{module}.lora_B.weight"] = torch.randn(out_features, rank, generator=generator) * 0.01
+    flush()
+    with open(os.path.join(path, "model.safetensors.index.json"), 'w') as f:
+        json.dump({"metadata": {"total_size": total}, "weight_map": weight_map}, f)
+    return total, adapter
+
+
+def build_adapter(path, adapter, rank):
+    from peft import LoraConfig
+    from safetensors.torch import save_file
+    from train_engine import LORA_TARGET_MODULES
+
+    os.makedirs(path, exist_ok=True)
+    save_file(adapter, os.path.join(path, "adapter_model.safetensors"), metadata={"format": "pt"})
+    LoraConfig(r=rank, lora_alpha=rank * 2, target_modules=LORA_TARGET_MODULES, task_type="CAUSAL_LM").save_pretrained(path)
+
+
+def peak_rss_kb():
+    """本进程的峰值RSS；Linux上ru_maxrss会继承fork前父进程的峰值，优先读VmHWM"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def export(method, base, checkpoint, out, shard_gb):
+    """在子进程中执行一次导出"""
+    if method == "naive":
+        import torch
+        from peft import PeftModel
+        from transformers import AutoModelForCausalLM
+
+        model = AutoModelForCausalLM.from_pretrained(base, dtype=torch.float16)
+        model = PeftModel.from_pretrained(model, checkpoint).merge_and_unload()
+        model.save_pretrained(out, max_shard_size=f"{int(shard_gb * 1024)}MB")
+    else:
+        from export_engine import export_merged
+        export_merged(base, checkpoint, out, max_shard_size=int(shard_gb * (1 << 30)))
+
+
+def run(method, base, checkpoint, shard_gb):
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(base)) as out:
+        start = time.perf_counter()
+        proc = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", method, base, checkpoint, out, str(shard_gb)],
+            capture_output=True, text=True,
+        )
+        elapsed = time.perf_counter() - start
+        if proc.returncode != 0:
+            return {"method": method, "error": (proc.stderr.strip().splitlines() or ["killed"])[-1],
+                    "returncode": proc.returncode}
+        child = json.loads(proc.stdout.strip().splitlines()[-1])
+        written = sum(os.path.getsize(os.path.join(out, name)) for name in os.listdir(out))
+    return {
+        "method": method,
+        "seconds": round(elapsed, 1),
+        "peak_rss_mb": child["peak_rss_mb"],
+        "written_gb": round(written / (1 << 30), 2),
+    }
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        method, base, checkpoint, out, shard_gb = sys.argv[2:7]
+        export(method, base, checkpoint, out, float(shard_gb))
+        print(json.dumps({"peak_rss_mb": round(peak_rss_kb() / 1024)}))
+        return
+
+    parser = argparse.ArgumentParser(description="合并导出基准测试")
+    parser.add_argument("--layers", type=int, default=32, help="解码层数，32即完整的7B形状")
+    parser.add_argument("--rank", type=int, default=16)
+    parser.add_argument("--shard-gb", type=float, default=1.0, help="基础模型和导出结果的分片大小")
+    parser.add_argument("--methods", default="stream", help="逗号分隔: naive,stream")
+    parser.add_argument("--workdir", default=None, help="生成的模型存放位置，默认临时目录")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.workdir) as workdir:
+        base = os.path.join(workdir, "base")
+        checkpoint = os.path.join(workdir, "epoch_1")
+        start = time.perf_counter()
+        total, adapter = build_base(base, args.layers, int(args.shard_gb * (1 << 30)), args.rank)
+        build_adapter(checkpoint, adapter, args.rank)
+        del adapter
+        print(json.dumps({
+            "layers": args.layers,
+            "base_gb": round(total / (1 << 30), 2),
+            "build_seconds": round(time.perf_counter() - start, 1),
+        }))
+        for method in args.methods.split(","):
+            print(json.dumps(run(method.strip(), base, checkpoint, args.shard_gb)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""数据读取与格式化的速度: 流式转换Arrow、按批渲染模板，与逐条map渲染对比
+
+生成ShareGPT格式的对话和Alpaca格式的指令数据(JSONL)，用Llama-3风格的对话模板渲染:
+    python benchmarks/bench_formatting.py --rows 200000 --num-proc 1
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from formatting import _format_chat, format_dataset, load_records
+
+LLAMA3_TEMPLATE = (
+    "{{ bos_token }}{% for message in messages %}"
+    "{{ '<|start_header_id|>' + message['role'] + '<|end_header_id|>\n\n' + message['content'] | trim + '<|eot_id|>' }}"
+    "{% endfor %}"
+    "{% if add_generation_prompt %}{{ '<|start_header_id|>assistant<|end_header_id|>\n\n' }}{% endif %}"
+)
+
+
+def make_files(directory, rows):
+    rng = random.Random(0)
+    words = "the model learns to follow instructions and answer questions about the training data".split()
+
+    def sentence():
+        return " ".join(rng.choice(words) for _ in range(rng.randint(5, 60)))
+
+    chat_path = os.path.join(directory, "chat.jsonl")
+    alpaca_path = os.path.join(directory, "alpaca.jsonl")
+    with open(chat_path, 'w', encoding='utf-8') as chat, open(alpaca_path, 'w', encoding='utf-8') as alpaca:
+        for _ in range(rows):
+            turns = [{"from": "system", "value": "You are a helpful assistant."}]
+            for _ in range(rng.randint(1, 3)):
+                turns.append({"from": "human", "value": sentence()})
+                turns.append({"from": "gpt", "value": sentence()})
+            chat.write(json.dumps({"conversations": turns}) + "\n")
+            alpaca.write(json.dumps({"instruction": sentence(), "input": "", "output": sentence()}) + "\n")
+    return chat_path, alpaca_path
+
+
+def make_tokenizer():
+    from autotune import tiny_tokenizer
+
+    tokenizer = tiny_tokenizer(["the model learns to follow instructions"] * 10)
+    tokenizer.add_special_tokens({"bos_token": "<|begin_of_text|>"})
+    tokenizer.chat_template = LLAMA3_TEMPLATE
+    return tokenizer
+
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="数据格式化基准测试")
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--num-proc", type=int, default=1)
+    parser.add_argument("--baseline-rows", type=int, default=20000, help="逐条渲染对照组的条数")
+    args = parser.parse_args()
+
+    from datasets import disable_progress_bars
+
+    disable_progress_bars()
+    tokenizer = make_tokenizer()
+    with tempfile.TemporaryDirectory() as directory:
+        chat_path, alpaca_path = make_files(directory, args.rows)
+        cache_dir = os.path.join(directory, "cache")
+        for template, path in (("chat", chat_path), ("alpaca", alpaca_path)):
+            records, load_seconds = timed(lambda: load_records(path, cache_dir, template))
+            formatted, format_seconds = timed(
+                lambda: format_dataset(records, template, tokenizer, num_proc=args.num_proc)
+            )
+            result = {
+                "template": template,
+                "rows": len(formatted),
+                "num_proc": args.num_proc,
+                "read_rows_per_second": round(len(records) / load_seconds),
+                "format_rows_per_second": round(len(formatted) / format_seconds),
+                "seconds_per_million": round((load_seconds + format_seconds) / len(formatted) * 1e6, 1),
+            }
+            if template == "chat":
+                # 对照: 与notebook相同的逐条渲染(batched=False)
+                subset = records.select(range(min(args.baseline_rows, len(records))))
+                _, baseline_seconds = timed(lambda: subset.map(
+                    lambda row: {"text": tokenizer.apply_chat_template(row["messages"], tokenize=False)},
+                    remove_columns=subset.column_names,
+                ))
+                result["per_row_map_rows_per_second"] = round(len(subset) / baseline_seconds)
+                sample = _format_chat({"messages": [records[0]["messages"]]}, tokenizer, True)["text"][0]
+                result["double_bos"] = sample.startswith(tokenizer.bos_token)
+            print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
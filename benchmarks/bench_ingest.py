@@ -0,0 +1,111 @@
+"""测量训练数据读取的吞吐量和峰值内存
+
+每种方式在独立子进程中运行，峰值RSS互不干扰:
+    python benchmarks/bench_ingest.py --size-mb 5120
+    python benchmarks/bench_ingest.py --file train.jsonl --methods stream arrow
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def generate_jsonl(path, size_mb, seed=0):
+    """生成指定大小的合成JSONL数据"""
+    rng = random.Random(seed)
+    words = ["模型", "训练", "数据", "the", "quick", "brown", "fox", "token", "学习率", "梯度"]
+    target = size_mb * (1 << 20)
+    written = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        while written < target:
+            text = " ".join(rng.choice(words) for _ in range(rng.randint(20, 400)))
+            line = json.dumps({"text": text}, ensure_ascii=False) + "\n"
+            f.write(line)
+            written += len(line.encode('utf-8'))
+
+
+def peak_rss_mb():
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux以KB为单位，macOS以字节为单位
+    return usage / (1 << 20) if sys.platform == "darwin" else usage / 1024
+
+
+def run_method(method, path):
+    from data_stream import iter_text_batches, load_text_dataset
+
+    baseline_rss = peak_rss_mb()
+    start = time.perf_counter()
+    if method == "json_load":
+        # 原实现: 整体读入后再构建列表
+        with open(path, 'r', encoding='utf-8') as f:
+            if path.endswith(".jsonl"):
+                data = [json.loads(line) for line in f if line.strip()]
+            else:
+                data = json.load(f)
+        rows = len([{"text": item["text"]} for item in data])
+    elif method == "stream":
+        rows = sum(len(batch) for batch in iter_text_batches(path))
+    elif method == "arrow":
+        with tempfile.TemporaryDirectory() as cache_dir:
+            rows = load_text_dataset(path, cache_dir).num_rows
+    else:
+        raise ValueError(f"未知的方法: {method}")
+    elapsed = time.perf_counter() - start
+    size_mb = os.path.getsize(path) / (1 << 20)
+    return {
+        "method": method,
+        "rows": rows,
+        "size_mb": round(size_mb, 1),
+        "seconds": round(elapsed, 2),
+        "mb_per_sec": round(size_mb / elapsed, 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "baseline_rss_mb": round(baseline_rss, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="训练数据读取基准测试")
+    parser.add_argument("--file", help="已有的数据文件，不指定时生成合成数据")
+    parser.add_argument("--size-mb", type=int, default=512, help="合成数据大小(MB)")
+    parser.add_argument("--methods", nargs="+", default=["json_load", "stream", "arrow"])
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_method(args.child, args.file)))
+        return
+
+    path = args.file
+    tmp_dir = None
+    if not path:
+        tmp_dir = tempfile.mkdtemp()
+        path = os.path.join(tmp_dir, "bench.jsonl")
+        print(f"正在生成 {args.size_mb} MB 合成数据...", file=sys.stderr)
+        generate_jsonl(path, args.size_mb)
+
+    try:
+        for method in args.methods:
+            proc = subprocess.run(
+                [sys.executable, __file__, "--file", path, "--child", method],
+                capture_output=True, text=True,
+            )
+            if proc.returncode != 0:
+                print(json.dumps({"method": method, "error": proc.stderr.strip().splitlines()[-1:]}))
+            else:
+                print(proc.stdout.strip())
+    finally:
+        if tmp_dir:
+            os.remove(path)
+            os.rmdir(tmp_dir)
+
+
+if __name__ == "__main__":
+    main()
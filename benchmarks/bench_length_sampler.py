@@ -0,0 +1,130 @@
+"""比较固定batch_size的随机批次与按token预算组批的padding效率和训练吞吐
+
+padding效率只依赖样本长度，按对数正态(对话数据常见的长尾分布)和双峰分布生成长度；
+吞吐用随机初始化的小模型和transformers Trainer在CPU上训练固定步数，统计每秒真实(非padding)token数:
+    python benchmarks/bench_length_sampler.py --samples 20000 --batch-size 8 --max-length 1024
+    python benchmarks/bench_length_sampler.py --train-steps 0   # 只计算padding效率
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from length_sampler import TokenBudgetBatchSampler, padding_efficiency, random_batches
+
+
+def make_lengths(distribution, count, max_length, seed=0):
+    rng = np.random.default_rng(seed)
+    if distribution == "lognormal":
+        lengths = rng.lognormal(5.0, 0.9, count)
+    else:
+        # 短问答和长文档各占一半
+        lengths = np.where(rng.random(count) < 0.5, rng.normal(60, 20, count), rng.normal(0.8 * max_length, 100, count))
+    return np.clip(lengths.astype(np.int64), 4, max_length)
+
+
+def bench_efficiency(args):
+    for distribution in ("lognormal", "bimodal"):
+        lengths = make_lengths(distribution, args.samples, args.max_length)
+        budget = args.batch_size * args.max_length
+        start = time.perf_counter()
+        shuffled = TokenBudgetBatchSampler(lengths, budget).batches()
+        build_ms = (time.perf_counter() - start) * 1000
+        ordered = TokenBudgetBatchSampler(lengths, budget, shuffle=False).batches()
+        fixed = random_batches(len(lengths), args.batch_size)
+        print(json.dumps({
+            "distribution": distribution,
+            "samples": len(lengths),
+            "mean_length": round(float(lengths.mean()), 1),
+            "fixed_efficiency": round(padding_efficiency(lengths, fixed), 4),
+            "fixed_batches": len(fixed),
+            "budget_efficiency": round(padding_efficiency(lengths, shuffled), 4),
+            "budget_batches": len(shuffled),
+            "sorted_efficiency": round(padding_efficiency(lengths, ordered), 4),
+            "build_ms": round(build_ms, 1),
+        }))
+
+
+def bench_training(args):
+    from datasets import Dataset
+    from transformers import DataCollatorForLanguageModeling, Trainer, TrainerCallback, TrainingArguments
+
+    from autotune import tiny_model, tiny_tokenizer
+    from length_sampler import use_token_budget_batches
+
+    rng = random.Random(0)
+    words = "the model learns to follow instructions and answer questions about the training data".split()
+    lengths = make_lengths("lognormal", args.train_samples, args.train_max_length)
+    texts = [" ".join(rng.choice(words) for _ in range(int(n))) for n in lengths]
+    tokenizer = tiny_tokenizer(texts[:500])
+    dataset = Dataset.from_dict({"text": texts}).map(
+        lambda batch: tokenizer(batch["text"], truncation=True, max_length=args.train_max_length),
+        batched=True, remove_columns=["text"],
+    )
+
+    class TokenCounter(TrainerCallback):
+        """只统计第一步之后的真实token数和耗时"""
+
+        def __init__(self):
+            self.tokens = 0
+            self.start = None
+
+        def on_step_begin(self, args_, state, control, **kwargs):
+            if state.global_step == 1:
+                self.start = time.perf_counter()
+
+    for mode in ("fixed", "budget"):
+        with tempfile.TemporaryDirectory() as output_dir:
+            training_args = TrainingArguments(
+                output_dir=output_dir, per_device_train_batch_size=args.batch_size, max_steps=args.train_steps,
+                learning_rate=1e-4, report_to="none", remove_unused_columns=False, save_strategy="no",
+                logging_strategy="no", use_cpu=True, disable_tqdm=True,
+            )
+            counter = TokenCounter()
+            collator = DataCollatorForLanguageModeling(tokenizer, mlm=False)
+
+            def collate(features):
+                batch = collator(features)
+                if counter.start is not None:
+                    counter.tokens += int(batch["attention_mask"].sum())
+                return batch
+
+            trainer = Trainer(model=tiny_model(tokenizer, args.train_max_length), args=training_args,
+                              train_dataset=dataset, data_collator=collate, callbacks=[counter])
+            if mode == "budget":
+                use_token_budget_batches(trainer, args.batch_size * args.train_max_length)
+            trainer.train()
+            elapsed = time.perf_counter() - counter.start
+            print(json.dumps({
+                "mode": mode,
+                "steps": args.train_steps,
+                "real_tokens_per_second": round(counter.tokens / elapsed),
+                "seconds": round(elapsed, 2),
+            }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="按长度分组组批基准测试")
+    parser.add_argument("--samples", type=int, default=20000)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--max-length", type=int, default=1024)
+    parser.add_argument("--train-samples", type=int, default=4000)
+    parser.add_argument("--train-max-length", type=int, default=512)
+    parser.add_argument("--train-steps", type=int, default=40)
+    args = parser.parse_args()
+
+    bench_efficiency(args)
+    if args.train_steps > 0:
+        bench_training(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""测量日志管线的吞吐量(行/秒)和界面卡顿
+
+有显示器时比较两种方式写入Tk文本框:
+    legacy: 每行单独 insert + see (原实现)
+    bus:    LogBus 批量写入 + 行数上限
+并用10ms心跳测量主线程的最长停顿。无显示器时只测量队列、环形缓冲和文件日志。
+    python benchmarks/bench_log.py --lines 200000
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from log_bus import LogBus
+
+
+def produce(write, lines):
+    for i in range(lines):
+        write(f"step {i}: loss=1.2345 lr=2.0e-05 grad_norm=0.98\n")
+
+
+def bench_headless(lines):
+    with tempfile.TemporaryDirectory() as run_dir:
+        bus = LogBus()
+        bus.open_run_log(run_dir)
+        done = threading.Event()
+        drained = 0
+        start = time.perf_counter()
+        producer = threading.Thread(target=lambda: (produce(bus.write, lines), done.set()))
+        producer.start()
+        while not done.is_set() or drained < lines:
+            text, _ = bus.drain()
+            drained += text.count("\n")
+            if not text:
+                time.sleep(0.001)
+        elapsed = time.perf_counter() - start
+        producer.join()
+        bus.close_run_log()
+    return {"method": "bus_headless", "lines": lines, "lines_per_sec": round(lines / elapsed)}
+
+
+def bench_ui(method, lines):
+    import tkinter as tk
+
+    root = tk.Tk()
+    text_widget = tk.Text(root, height=10)
+    text_widget.pack()
+    state = {"last": time.perf_counter(), "max_stall": 0.0, "inserted": 0}
+
+    def heartbeat():
+        now = time.perf_counter()
+        state["max_stall"] = max(state["max_stall"], now - state["last"])
+        state["last"] = now
+        root.after(10, heartbeat)
+
+    if method == "legacy":
+        pending = []
+        lock = threading.Lock()
+
+        def write(message):
+            with lock:
+                pending.append(message)
+
+        def consume():
+            with lock:
+                items = pending[:]
+                pending.clear()
+            for message in items:
+                text_widget.insert(tk.END, message)
+                text_widget.see(tk.END)
+            state["inserted"] += len(items)
+            if state["inserted"] >= lines:
+                root.quit()
+            else:
+                root.after(1, consume)
+    else:
+        bus = LogBus(max_lines=5000)
+        bus.attach(root, text_widget, interval=50)
+        write = bus.write
+
+        def consume():
+            if bus._queue.empty() and producer_done.is_set():
+                root.quit()
+            else:
+                root.after(20, consume)
+
+    producer_done = threading.Event()
+    start = time.perf_counter()
+    threading.Thread(target=lambda: (produce(write, lines), producer_done.set()), daemon=True).start()
+    root.after(10, heartbeat)
+    root.after(1, consume)
+    root.mainloop()
+    elapsed = time.perf_counter() - start
+    root.destroy()
+    return {
+        "method": method,
+        "lines": lines,
+        "lines_per_sec": round(lines / elapsed),
+        "max_ui_stall_ms": round(state["max_stall"] * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="日志管线基准测试")
+    parser.add_argument("--lines", type=int, default=100000)
+    args = parser.parse_args()
+
+    print(json.dumps(bench_headless(args.lines)))
+    if os.environ.get("DISPLAY") or sys.platform in ("win32", "darwin"):
+        for method in ("legacy", "bus"):
+            print(json.dumps(bench_ui(method, args.lines)))
+    else:
+        print(json.dumps({"skipped": "ui", "reason": "没有可用的显示器"}, ensure_ascii=False), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
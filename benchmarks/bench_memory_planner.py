@@ -0,0 +1,121 @@
+"""比较原 _get_model_params 的估算公式与从safetensors文件头统计的参数量，并给出显存估算示例
+
+用meta设备按真实config构建模型，只写出safetensors文件头，数据区用稀疏文件补齐，
+不需要下载权重:
+    python benchmarks/bench_memory_planner.py
+    python benchmarks/bench_memory_planner.py --batch-size 2 --max-length 2048 --mode 4bit
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from memory_planner import count_parameters, estimate_params_from_config, plan_training_memory, read_model_tensors
+from train_engine import DEFAULT_CONFIG, LORA_TARGET_MODULES, normalize_config
+
+# 公开模型的config.json中与结构有关的字段
+MODELS = {
+    "Llama-3-8B": {
+        "architectures": ["LlamaForCausalLM"], "model_type": "llama", "hidden_size": 4096,
+        "intermediate_size": 14336, "num_hidden_layers": 32, "num_attention_heads": 32,
+        "num_key_value_heads": 8, "vocab_size": 128256, "tie_word_embeddings": False, "torch_dtype": "bfloat16",
+    },
+    "Llama-2-7B": {
+        "architectures": ["LlamaForCausalLM"], "model_type": "llama", "hidden_size": 4096,
+        "intermediate_size": 11008, "num_hidden_layers": 32, "num_attention_heads": 32,
+        "num_key_value_heads": 32, "vocab_size": 32000, "tie_word_embeddings": False, "torch_dtype": "float16",
+    },
+    "Qwen2.5-0.5B": {
+        "architectures": ["Qwen2ForCausalLM"], "model_type": "qwen2", "hidden_size": 896,
+        "intermediate_size": 4864, "num_hidden_layers": 24, "num_attention_heads": 14,
+        "num_key_value_heads": 2, "vocab_size": 151936, "tie_word_embeddings": True, "torch_dtype": "bfloat16",
+    },
+    "Qwen2.5-7B": {
+        "architectures": ["Qwen2ForCausalLM"], "model_type": "qwen2", "hidden_size": 3584,
+        "intermediate_size": 18944, "num_hidden_layers": 28, "num_attention_heads": 28,
+        "num_key_value_heads": 4, "vocab_size": 152064, "tie_word_embeddings": False, "torch_dtype": "bfloat16",
+    },
+}
+
+
+def legacy_params(config):
+    """原_get_model_params中的估算公式"""
+    return (config["hidden_size"] * config["hidden_size"] * config["num_hidden_layers"] * 4
+            + config["hidden_size"] * config["vocab_size"])
+
+
+def write_header_only(model_dir, config):
+    """按config构建meta模型，写出只有文件头的safetensors(数据区为稀疏空洞)"""
+    import torch
+    from transformers import AutoConfig, AutoModelForCausalLM
+
+    os.makedirs(model_dir)
+    with open(os.path.join(model_dir, "config.json"), 'w') as f:
+        json.dump(config, f)
+    hf_config = AutoConfig.from_pretrained(model_dir)
+    with torch.device("meta"):
+        model = AutoModelForCausalLM.from_config(hf_config, dtype=torch.bfloat16)
+    state = model.state_dict()
+    if config["tie_word_embeddings"]:
+        state.pop("lm_head.weight", None)
+    header = {}
+    offset = 0
+    for name, tensor in state.items():
+        size = tensor.numel() * 2
+        header[name] = {"dtype": "BF16", "shape": list(tensor.shape), "data_offsets": [offset, offset + size]}
+        offset += size
+    data = json.dumps(header).encode("utf-8")
+    data += b" " * (-len(data) % 8)
+    with open(os.path.join(model_dir, "model.safetensors"), 'wb') as f:
+        f.write(len(data).to_bytes(8, "little"))
+        f.write(data)
+        f.truncate(8 + len(data) + offset)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="参数量统计与显存估算")
+    parser.add_argument("--batch-size", type=int, default=2)
+    parser.add_argument("--max-length", type=int, default=2048)
+    parser.add_argument("--mode", choices=("4bit", "8bit", "fp16"), default="4bit")
+    parser.add_argument("--lora-rank", type=int, default=16)
+    parser.add_argument("--optimizer", default="adamw_8bit")
+    args = parser.parse_args()
+
+    cfg = normalize_config(dict(
+        DEFAULT_CONFIG, base_model="bench", data_path=__file__, save_path="bench",
+        batch_size=str(args.batch_size), max_length=str(args.max_length), lora_rank=str(args.lora_rank),
+        optimizer=args.optimizer, use_lora=True, use_fp16=True,
+        use_4bit=args.mode == "4bit", use_8bit=args.mode == "8bit",
+    ))
+    with tempfile.TemporaryDirectory() as root:
+        for name, config in MODELS.items():
+            model_dir = os.path.join(root, name)
+            write_header_only(model_dir, config)
+            start = time.perf_counter()
+            tensors, model_config = read_model_tensors(model_dir, local_files_only=True)
+            exact, _ = count_parameters(tensors)
+            read_ms = (time.perf_counter() - start) * 1000
+            legacy = legacy_params(config)
+            estimate = estimate_params_from_config(config)
+            plan = plan_training_memory(tensors, model_config, cfg, LORA_TARGET_MODULES)
+            print(json.dumps({
+                "model": name,
+                "exact": exact,
+                "legacy": legacy,
+                "legacy_error_pct": round((legacy - exact) / exact * 100, 1),
+                "config_estimate_error_pct": round((estimate - exact) / exact * 100, 3),
+                "header_read_ms": round(read_ms, 2),
+                "mode": args.mode,
+                "trainable": plan["trainable_params"],
+                "estimate_gb": {key: round(value / (1 << 30), 2) for key, value in plan.items()
+                                if key not in ("params", "trainable_params")},
+            }))
+
+
+if __name__ == "__main__":
+    main()
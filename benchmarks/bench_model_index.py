@@ -0,0 +1,142 @@
+"""比较逐个读取config.json的旧扫描方式与持久化索引的耗时
+
+生成训练输出目录(flat: 顶层即模型目录; nested: run-x/epoch_N)和HF缓存形式的模型，然后测量:
+    legacy: 原实现，只扫描一层，每次打开并解析全部config.json (nested和HF缓存中的模型找不到)
+    cold:   没有索引文件时的递归并行扫描
+    warm:   索引已存在且没有变化
+    touched: 索引已存在，1%的配置被修改
+--latency-ms 给每次stat/scandir/open增加固定延迟，模拟网络文件系统的往返时间。
+    python benchmarks/bench_model_index.py --runs 100 --epochs 5 --hub 50 --latency-ms 2
+    python benchmarks/bench_model_index.py --layout nested --latency-ms 2
+"""
+import argparse
+import builtins
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from model_index import ModelIndex
+
+MODEL_CONFIG = {
+    "architectures": ["LlamaForCausalLM"], "hidden_size": 4096, "intermediate_size": 11008,
+    "num_hidden_layers": 32, "num_attention_heads": 32, "vocab_size": 32000, "torch_dtype": "float16",
+}
+
+
+def build_tree(root, runs, epochs, hub, layout):
+    paths = []
+    for r in range(runs):
+        for e in range(1, epochs + 1):
+            if layout == "flat":
+                path = os.path.join(root, f"run-{r:04d}-epoch_{e}")
+            else:
+                path = os.path.join(root, f"run-{r:04d}", f"epoch_{e}")
+            os.makedirs(os.path.join(path, "tokenizer"))
+            with open(os.path.join(path, "config.json"), 'w') as f:
+                json.dump(MODEL_CONFIG, f)
+            with open(os.path.join(path, "training_config.json"), 'w') as f:
+                json.dump({"base_model": "meta-llama/Llama-2-7b-hf", "learning_rate": "2e-5"}, f)
+            paths.append(path)
+    for h in range(hub):
+        repo = os.path.join(root, f"models--org{h % 7}--model-{h}")
+        revision = f"{h:040x}"
+        snapshot = os.path.join(repo, "snapshots", revision)
+        os.makedirs(snapshot)
+        os.makedirs(os.path.join(repo, "refs"))
+        with open(os.path.join(repo, "refs", "main"), 'w') as f:
+            f.write(revision)
+        with open(os.path.join(snapshot, "config.json"), 'w') as f:
+            json.dump(MODEL_CONFIG, f)
+        paths.append(snapshot)
+    return paths
+
+
+def legacy_scan(model_dir):
+    """原scan_local_models中的扫描逻辑"""
+    found = []
+    for item in os.listdir(model_dir):
+        item_path = os.path.join(model_dir, item)
+        if os.path.isdir(item_path):
+            config_path = os.path.join(item_path, "config.json")
+            if os.path.exists(config_path):
+                with open(config_path, 'r', encoding='utf-8') as f:
+                    config = json.load(f)
+                found.append((item_path, config, os.path.getmtime(item_path)))
+    return found
+
+
+class SimulatedLatency:
+    """给文件系统调用加上固定延迟"""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.originals = {}
+
+    def _wrap(self, func):
+        seconds = self.seconds
+
+        def wrapper(*args, **kwargs):
+            time.sleep(seconds)
+            return func(*args, **kwargs)
+        return wrapper
+
+    def __enter__(self):
+        if self.seconds > 0:
+            for module, name in ((os, "stat"), (os, "scandir"), (os, "listdir"), (builtins, "open")):
+                self.originals[(module, name)] = getattr(module, name)
+                setattr(module, name, self._wrap(getattr(module, name)))
+        return self
+
+    def __exit__(self, *exc):
+        for (module, name), func in self.originals.items():
+            setattr(module, name, func)
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模型索引基准测试")
+    parser.add_argument("--runs", type=int, default=100)
+    parser.add_argument("--epochs", type=int, default=5)
+    parser.add_argument("--hub", type=int, default=50)
+    parser.add_argument("--layout", choices=("flat", "nested"), default="flat")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--workers", type=int, default=16)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        paths = build_tree(root, args.runs, args.epochs, args.hub, args.layout)
+        index_path = os.path.join(root, ".model_index.json")
+        with SimulatedLatency(args.latency_ms / 1000):
+            seconds, found = timed(lambda: legacy_scan(root))
+            print(json.dumps({"method": "legacy", "seconds": round(seconds, 3), "models": len(found)}))
+
+            seconds, records = timed(lambda: ModelIndex(root, max_workers=args.workers).refresh())
+            print(json.dumps({"method": "cold", "seconds": round(seconds, 3), "models": len(records)}))
+
+            index = ModelIndex(root, max_workers=args.workers)
+            seconds, records = timed(index.refresh)
+            print(json.dumps({"method": "warm", "seconds": round(seconds, 3), "models": len(records),
+                              "parsed": index.stats["parsed"]}))
+
+            for path in paths[::100]:
+                with open(os.path.join(path, "config.json"), 'a') as f:
+                    f.write(" ")
+            index = ModelIndex(root, max_workers=args.workers)
+            seconds, records = timed(index.refresh)
+            print(json.dumps({"method": "touched", "seconds": round(seconds, 3), "models": len(records),
+                              "parsed": index.stats["parsed"]}))
+        print(json.dumps({"index_kb": round(os.path.getsize(index_path) / 1024)}))
+
+
+if __name__ == "__main__":
+    main()
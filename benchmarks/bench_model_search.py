@@ -0,0 +1,130 @@
+"""测量模型列表搜索每次按键的耗时
+
+headless: 原实现每次按键对每条记录调用lower()再做子串匹配，与SearchIndex查询比较
+有显示器时另外比较表格刷新: 原实现删除并重新插入全部行，VirtualTreeview只更新可见行
+    python benchmarks/bench_model_search.py --entries 10000
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from model_search import SearchIndex
+
+ORGS = ["meta-llama", "Qwen", "mistralai", "microsoft", "unsloth", "google", "internlm", "01-ai"]
+FAMILIES = ["Llama-2", "Llama-3.1", "Qwen2.5", "Mistral", "Phi-3", "gemma-2", "internlm2", "Yi"]
+SIZES = ["0.5B", "1B", "3B", "7B", "8B", "13B", "14B", "70B"]
+ARCHS = ["LlamaForCausalLM", "Qwen2ForCausalLM", "MistralForCausalLM", "Phi3ForCausalLM", "Gemma2ForCausalLM"]
+
+
+def make_records(count, seed=0):
+    rng = random.Random(seed)
+    records = []
+    for i in range(count):
+        family = rng.choice(FAMILIES)
+        size = rng.choice(SIZES)
+        records.append({
+            "name": f"{family}-{size}-sft-run{i:05d}-epoch_{rng.randint(1, 5)}",
+            "base_model": f"{rng.choice(ORGS)}/{family}-{size}",
+            "params": size,
+            "architecture": rng.choice(ARCHS),
+            "last_modified": time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(1.7e9 + i * 600)),
+        })
+    return records
+
+
+def legacy_filter(records, text):
+    """原update_tree中的匹配逻辑"""
+    return [m for m in records
+            if text.lower() in m['name'].lower() or text.lower() in m['base_model'].lower()]
+
+
+def keystrokes(query):
+    return [query[:i] for i in range(1, len(query) + 1)]
+
+
+def bench_headless(records, queries):
+    start = time.perf_counter()
+    index = SearchIndex(records)
+    build = time.perf_counter() - start
+    results = {"entries": len(records), "index_build_ms": round(build * 1000, 1)}
+    for method in ("legacy", "index"):
+        times = []
+        for query in queries:
+            for text in keystrokes(query):
+                start = time.perf_counter()
+                if method == "legacy":
+                    legacy_filter(records, text)
+                else:
+                    index.search(text)
+                times.append(time.perf_counter() - start)
+        results[f"{method}_median_ms"] = round(statistics.median(times) * 1000, 3)
+        results[f"{method}_max_ms"] = round(max(times) * 1000, 3)
+    start = time.perf_counter()
+    index.sort(index.search(""), "params", reverse=True)
+    results["first_sort_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    start = time.perf_counter()
+    index.sort(index.search("qwen"), "params")
+    results["cached_sort_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    return results
+
+
+def bench_ui(records, queries):
+    import tkinter as tk
+    from tkinter import ttk
+
+    from model_search import VirtualTreeview
+
+    root = tk.Tk()
+    columns = ('名称', '基础模型', '参数量', '架构', '最后修改时间')
+    fields = ('name', 'base_model', 'params', 'architecture', 'last_modified')
+    rows = [tuple(r[f] for f in fields) for r in records]
+    legacy_tree = ttk.Treeview(root, columns=columns, show='headings', height=15)
+    legacy_tree.pack()
+    virtual = VirtualTreeview(root, columns, rows)
+    virtual.pack()
+    index = SearchIndex(records)
+    root.update()
+
+    results = {}
+    for method in ("legacy", "virtual"):
+        times = []
+        for query in queries:
+            for text in [""] + keystrokes(query):
+                start = time.perf_counter()
+                if method == "legacy":
+                    legacy_tree.delete(*legacy_tree.get_children())
+                    for m in legacy_filter(records, text):
+                        legacy_tree.insert('', tk.END, values=tuple(m[f] for f in fields))
+                else:
+                    virtual.set_items(index.search(text))
+                root.update_idletasks()
+                times.append(time.perf_counter() - start)
+        results[f"{method}_ui_median_ms"] = round(statistics.median(times) * 1000, 2)
+        results[f"{method}_ui_max_ms"] = round(max(times) * 1000, 2)
+    root.destroy()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模型列表搜索基准测试")
+    parser.add_argument("--entries", type=int, default=10000)
+    args = parser.parse_args()
+
+    records = make_records(args.entries)
+    queries = ["qwen2.5 7b", "llama-3.1-8b", "epoch_3", "mistralai", "phi3forcausal"]
+    print(json.dumps(bench_headless(records, queries)))
+    if os.environ.get("DISPLAY") or sys.platform in ("win32", "darwin"):
+        print(json.dumps(bench_ui(records, queries)))
+    else:
+        print(json.dumps({"skipped": "ui", "reason": "没有可用的显示器"}, ensure_ascii=False), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,349 @@
+"""完整微调流程的分阶段基准测试，不需要GUI和GPU
+
+生成合成训练数据和随机初始化的小模型(Llama或Qwen2结构)，依次计时:
+    model_load   从本地safetensors加载模型和tokenizer(开启LoRA时含添加适配器)
+    data_load    流式读取数据文件并写入Arrow
+    formatting   按模板渲染text列
+    tokenize     分词(打包时不截断)
+    packing      first-fit-decreasing打包(--packing)
+    train        transformers.Trainer训练 --steps 个优化步
+    checkpoint   快照并写出检查点
+    export       LoRA合并导出(export_merged)或全参数复制导出(export_full)
+各阶段调用训练引擎使用的同一组函数；训练用transformers.Trainer代替SFTTrainer
+(引擎已跳过SFTTrainer的数据预处理，两者的训练循环相同)，不经过unsloth。
+
+每个阶段输出一行JSON，--repeat 多次时取各阶段耗时的中位数。--output 保存完整结果，
+--baseline 与之前保存的结果比较，耗时超出基线 --tolerance 比例(且超出 --min-delta 秒)的阶段
+标记为回归，存在回归时退出码为1:
+    python benchmarks/bench_pipeline.py --output baseline.json
+    python benchmarks/bench_pipeline.py --baseline baseline.json
+    python benchmarks/bench_pipeline.py --arch qwen2 --template chat --packing --rows 4000 --steps 30
+基线与当前结果的机器、库版本或参数不同时，比较结果中的 settings_mismatch / env_mismatch 为true。
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+STAGES = ("model_load", "data_load", "formatting", "tokenize", "packing", "train", "checkpoint", "export")
+# 参与基线比较的参数，参数不同的结果不可直接比较
+SETTING_KEYS = (
+    "arch", "hidden_size", "layers", "rows", "template", "max_length", "packing", "lora", "lora_rank",
+    "batch_size", "accum", "steps", "num_proc", "threads",
+)
+
+WORDS = ("the model learns to follow instructions and answer questions about the training data "
+         "while keeping responses short clear and correct for every user").split()
+
+
+def make_data(path, rows, template, seed=0):
+    """生成合成训练数据(JSONL)，长度服从对数正态分布"""
+    rng = random.Random(seed)
+
+    def sentence(mean):
+        return " ".join(rng.choice(WORDS) for _ in range(max(3, int(rng.lognormvariate(mean, 0.6)))))
+
+    with open(path, 'w', encoding='utf-8') as f:
+        for _ in range(rows):
+            if template == "chat":
+                messages = [{"role": "system", "content": "You are a helpful assistant."}]
+                for _ in range(rng.randint(1, 3)):
+                    messages.append({"role": "user", "content": sentence(3.0)})
+                    messages.append({"role": "assistant", "content": sentence(3.5)})
+                record = {"messages": messages}
+            elif template == "alpaca":
+                record = {"instruction": sentence(3.0), "input": "", "output": sentence(3.5)}
+            else:
+                record = {"text": sentence(4.0)}
+            f.write(json.dumps(record) + "\n")
+
+
+def build_base_model(path, args):
+    """训练一个小BPE分词器并保存随机初始化的模型，作为"基础模型" """
+    import torch
+    from transformers import LlamaConfig, LlamaForCausalLM, Qwen2Config, Qwen2ForCausalLM
+
+    from autotune import tiny_tokenizer
+
+    tokenizer = tiny_tokenizer([" ".join(WORDS)] * 20 + WORDS, vocab_size=args.vocab_size)
+    shape = dict(
+        vocab_size=len(tokenizer), hidden_size=args.hidden_size, intermediate_size=args.hidden_size * 11 // 4,
+        num_hidden_layers=args.layers, num_attention_heads=max(1, args.hidden_size // 32),
+        num_key_value_heads=max(1, args.hidden_size // 64), max_position_embeddings=max(args.max_length, 128),
+        pad_token_id=tokenizer.pad_token_id, eos_token_id=tokenizer.eos_token_id, tie_word_embeddings=False,
+    )
+    torch.manual_seed(0)
+    if args.arch == "qwen2":
+        model = Qwen2ForCausalLM(Qwen2Config(**shape))
+    else:
+        model = LlamaForCausalLM(LlamaConfig(**shape))
+    model.save_pretrained(path)
+    tokenizer.save_pretrained(path)
+    return sum(p.numel() for p in model.parameters())
+
+
+class StageTimer:
+    def __init__(self):
+        self.results = {}
+
+    def run(self, name, function, *args, **kwargs):
+        start = time.perf_counter()
+        value = function(*args, **kwargs)
+        self.results[name] = {"seconds": time.perf_counter() - start}
+        return value
+
+    def note(self, name, **values):
+        self.results[name].update(values)
+
+
+def load_model(base_dir, args):
+    import torch
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(base_dir)
+    model = AutoModelForCausalLM.from_pretrained(base_dir, dtype=torch.float32)
+    if args.lora:
+        from autotune import _add_lora
+
+        model = _add_lora(model, {"lora_rank": args.lora_rank})
+    return model, tokenizer
+
+
+def train(model, tokenizer, dataset, workdir, args):
+    """返回 (有效token/秒, 步数)"""
+    from transformers import DataCollatorForLanguageModeling, PrinterCallback, Trainer, TrainingArguments
+
+    from metrics import MetricsExporter
+    from packing import collator_for
+    from train_callbacks import MetricsCallback
+
+    training_args = TrainingArguments(
+        output_dir=os.path.join(workdir, "trainer"),
+        per_device_train_batch_size=args.batch_size,
+        gradient_accumulation_steps=args.accum,
+        learning_rate=2e-4,
+        max_steps=args.steps,
+        logging_steps=1,
+        optim="adamw_torch",
+        weight_decay=0.01,
+        lr_scheduler_type="linear",
+        save_strategy="no",
+        report_to="none",
+        remove_unused_columns=False,
+        disable_tqdm=True,
+        seed=0,
+    )
+    trainer = Trainer(
+        model=model, args=training_args, train_dataset=dataset,
+        data_collator=DataCollatorForLanguageModeling(tokenizer, mlm=False),
+    )
+    if args.packing:
+        trainer.data_collator = collator_for(model, tokenizer.pad_token_id)
+    else:
+        from length_sampler import use_token_budget_batches
+
+        use_token_budget_batches(trainer, args.batch_size * args.max_length, seed=0)
+    # disable_tqdm时Trainer会逐步打印日志，不输出到标准输出以免与结果混在一起
+    trainer.remove_callback(PrinterCallback)
+    exporter = MetricsExporter()
+    trainer.add_callback(MetricsCallback(trainer, exporter))
+    trainer.train()
+    counters = exporter.counters
+    elapsed = counters["data_wait_seconds"] + counters["compute_seconds"]
+    return counters["tokens"] / elapsed if elapsed else None, counters["steps"]
+
+
+def run_pipeline(args, workdir):
+    from export_engine import export_full, export_merged
+    from formatting import format_dataset, load_records
+    from packing import pack_dataset
+    from token_cache import tokenize_texts
+
+    data_path = os.path.join(workdir, "train.jsonl")
+    base_dir = os.path.join(workdir, "base")
+    make_data(data_path, args.rows, args.template)
+    parameters = build_base_model(base_dir, args)
+    num_proc = args.num_proc if args.num_proc > 1 else None
+
+    timer = StageTimer()
+    model, tokenizer = timer.run("model_load", load_model, base_dir, args)
+    timer.note("model_load", parameters=parameters)
+    records = timer.run("data_load", load_records, data_path, os.path.join(workdir, "data_cache"), args.template)
+    timer.note("data_load", rows_per_second=round(len(records) / timer.results["data_load"]["seconds"]))
+    formatted = timer.run("formatting", format_dataset, records, args.template, tokenizer, num_proc=args.num_proc)
+    timer.note("formatting", rows_per_second=round(len(formatted) / timer.results["formatting"]["seconds"]))
+    tokenized = timer.run(
+        "tokenize", tokenize_texts, formatted, tokenizer, None if args.packing else args.max_length, num_proc,
+    )
+    tokens = sum(len(ids) for ids in tokenized["input_ids"])
+    timer.note("tokenize", tokens=tokens, tokens_per_second=round(tokens / timer.results["tokenize"]["seconds"]))
+    if args.packing:
+        tokenized = timer.run("packing", pack_dataset, tokenized, args.max_length, tokenizer.eos_token_id, num_proc)
+        timer.note("packing", sequences=len(tokenized), fill=tokens / (len(tokenized) * args.max_length))
+
+    tokens_per_second, steps = timer.run("train", train, model, tokenizer, tokenized, workdir, args)
+    timer.note("train", steps=steps, tokens_per_second=tokens_per_second,
+               seconds_per_step=timer.results["train"]["seconds"] / max(steps, 1))
+
+    from checkpoint_io import AsyncCheckpointWriter
+
+    checkpoint = os.path.join(workdir, "save", "epoch_1")
+
+    def save_checkpoint():
+        writer = AsyncCheckpointWriter(os.path.join(workdir, "save"), tokenizer, log=None)
+        stall = writer.submit(model, checkpoint)
+        writer.close()
+        return stall
+
+    stall = timer.run("checkpoint", save_checkpoint)
+    timer.note("checkpoint", stall_seconds=stall)
+
+    export_path = os.path.join(workdir, "export")
+    if args.lora:
+        timer.run("export", export_merged, base_dir, checkpoint, export_path)
+    else:
+        timer.run("export", export_full, checkpoint, export_path)
+    timer.note("export", bytes=sum(
+        os.path.getsize(os.path.join(export_path, name)) for name in os.listdir(export_path)
+        if os.path.isfile(os.path.join(export_path, name))
+    ))
+    return timer.results
+
+
+def environment():
+    import datasets
+    import torch
+    import transformers
+
+    env = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "torch": torch.__version__,
+        "transformers": transformers.__version__,
+        "datasets": datasets.__version__,
+        "torch_threads": torch.get_num_threads(),
+    }
+    try:
+        import peft
+
+        env["peft"] = peft.__version__
+    except ImportError:
+        pass
+    return env
+
+
+def summarize(runs):
+    """各阶段耗时取中位数，其余指标取最后一次"""
+    stages = {}
+    for name in STAGES:
+        values = [run[name] for run in runs if name in run]
+        if not values:
+            continue
+        stage = dict(values[-1])
+        stage["seconds"] = statistics.median(value["seconds"] for value in values)
+        if len(values) > 1:
+            stage["seconds_min"] = min(value["seconds"] for value in values)
+            stage["seconds_max"] = max(value["seconds"] for value in values)
+        stages[name] = stage
+    return stages
+
+
+def compare(result, baseline, tolerance, min_delta):
+    """返回 (逐阶段比较结果, 回归的阶段)"""
+    rows, regressions = [], []
+    for name, stage in result["stages"].items():
+        base = baseline.get("stages", {}).get(name)
+        if base is None:
+            continue
+        delta = stage["seconds"] - base["seconds"]
+        ratio = stage["seconds"] / base["seconds"] if base["seconds"] > 0 else None
+        regression = ratio is not None and ratio > 1 + tolerance and delta > min_delta
+        if regression:
+            regressions.append(name)
+        rows.append({
+            "stage": name, "seconds": round(stage["seconds"], 4), "baseline_seconds": round(base["seconds"], 4),
+            "ratio": round(ratio, 3) if ratio is not None else None, "regression": regression,
+        })
+    return rows, regressions
+
+
+def _rounded(values):
+    return {key: round(value, 4) if isinstance(value, float) else value for key, value in values.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="微调流程分阶段基准测试")
+    parser.add_argument("--arch", choices=("llama", "qwen2"), default="llama")
+    parser.add_argument("--hidden-size", type=int, default=128)
+    parser.add_argument("--layers", type=int, default=2)
+    parser.add_argument("--vocab-size", type=int, default=1024)
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--template", choices=("text", "alpaca", "chat"), default="alpaca")
+    parser.add_argument("--max-length", type=int, default=256)
+    parser.add_argument("--packing", action="store_true")
+    parser.add_argument("--no-lora", dest="lora", action="store_false", help="全参数训练，导出时直接复制")
+    parser.add_argument("--lora-rank", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--accum", type=int, default=2)
+    parser.add_argument("--steps", type=int, default=20)
+    parser.add_argument("--num-proc", type=int, default=1)
+    parser.add_argument("--threads", type=int, default=0, help="torch线程数，0表示不设置")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="保存完整结果的JSON文件，可作为之后的基线")
+    parser.add_argument("--baseline", help="与之比较的基线JSON文件")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="耗时超出基线的比例上限")
+    parser.add_argument("--min-delta", type=float, default=0.05, help="忽略绝对差值小于该秒数的变化")
+    args = parser.parse_args()
+
+    import torch
+    from datasets import disable_progress_bars
+    from transformers.utils import logging as hf_logging
+
+    disable_progress_bars()
+    hf_logging.set_verbosity_error()
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    runs = []
+    for _ in range(args.repeat):
+        with tempfile.TemporaryDirectory() as workdir:
+            runs.append(run_pipeline(args, workdir))
+
+    settings = {key: getattr(args, key) for key in SETTING_KEYS}
+    result = {"env": environment(), "settings": settings, "repeat": args.repeat, "stages": summarize(runs)}
+    for name, stage in result["stages"].items():
+        print(json.dumps(dict(stage=name, **_rounded(stage))))
+    total = sum(stage["seconds"] for stage in result["stages"].values())
+    print(json.dumps({"stage": "total", "seconds": round(total, 4)}))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        rows, regressions = compare(result, baseline, args.tolerance, args.min_delta)
+        for row in rows:
+            print(json.dumps(row))
+        print(json.dumps({
+            "regressions": regressions,
+            "settings_mismatch": baseline.get("settings") != settings,
+            "env_mismatch": baseline.get("env") != result["env"],
+        }))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
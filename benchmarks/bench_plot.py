@@ -0,0 +1,91 @@
+"""比较曲线重绘耗时与历史长度的关系
+
+legacy: 原update_visualization的做法(clear + 全量plot + draw)
+live:   LivePlot增量更新(降采样 + blit)
+    python benchmarks/bench_plot.py --lengths 1000 10000 100000
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import time
+
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from live_plot import LivePlot
+
+
+def synthetic_point(step):
+    loss = 2.0 * math.exp(-step / 20000) + 0.1 * math.sin(step * 0.37)
+    lr = 2e-5 * (1 - step / 200000)
+    return loss, lr
+
+
+def bench_legacy(length, repeats):
+    fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(6, 8))
+    losses = []
+    lrs = []
+    for step in range(length):
+        loss, lr = synthetic_point(step)
+        losses.append(loss)
+        lrs.append(lr)
+    fig.canvas.draw()
+    timings = []
+    for i in range(repeats):
+        loss, lr = synthetic_point(length + i)
+        start = time.perf_counter()
+        losses.append(loss)
+        lrs.append(lr)
+        ax1.clear()
+        ax2.clear()
+        ax1.plot(losses)
+        ax1.set_title("loss")
+        ax2.plot(lrs)
+        ax2.set_title("lr")
+        fig.canvas.draw()
+        timings.append(time.perf_counter() - start)
+    plt.close(fig)
+    return timings
+
+
+def bench_live(length, repeats):
+    fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(6, 8))
+    plot = LivePlot(fig.canvas, (ax1, ax2))
+    for step in range(length):
+        plot.append(step, *synthetic_point(step))
+    plot.refresh(force=True)
+    timings = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        plot.append(length + i, *synthetic_point(length + i))
+        plot.refresh(force=True)
+        timings.append(time.perf_counter() - start)
+    plt.close(fig)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="训练曲线重绘基准测试")
+    parser.add_argument("--lengths", type=int, nargs="+", default=[100, 1000, 10000, 100000])
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    for length in args.lengths:
+        for name, bench in (("legacy", bench_legacy), ("live", bench_live)):
+            timings = sorted(bench(length, args.repeats))
+            print(json.dumps({
+                "method": name,
+                "history": length,
+                "median_ms": round(timings[len(timings) // 2] * 1000, 2),
+                "max_ms": round(timings[-1] * 1000, 2),
+            }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""界面启动和第一个训练步的耗时: 延迟导入matplotlib、后台预加载前后对比
+
+每项在新的Python进程中测量，取 --repeat 次中的最小值:
+    gui_import         导入w.py(界面模块，matplotlib已改为延迟导入)
+    gui_import_eager   导入w.py并同时导入pyplot和TkAgg后端，相当于改动前导入界面模块的开销
+    first_step_cold    从"点击开始训练"到第一个训练步结束: 导入transformers/peft/trl、建小模型、训练一步
+    first_step_warm    同上，但点击前已由 startup.Prewarm 完成预加载(模拟用户填写参数期间预加载已结束)
+    prewarm            后台预加载本身的耗时(界面上不阻塞)
+没有显示器时无法创建Tk窗口，只测量导入部分:
+    python benchmarks/bench_startup.py --repeat 5
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def first_step():
+    """与训练引擎相同的导入，加上随机小模型的一步训练"""
+    import tempfile
+
+    import torch
+    from transformers import LlamaConfig, LlamaForCausalLM, Trainer, TrainingArguments
+    import peft  # noqa: F401
+    import trl  # noqa: F401
+
+    model = LlamaForCausalLM(LlamaConfig(
+        vocab_size=512, hidden_size=64, intermediate_size=176, num_hidden_layers=2,
+        num_attention_heads=4, num_key_value_heads=2,
+    ))
+    rows = [{"input_ids": torch.arange(64) % 500, "labels": torch.arange(64) % 500}] * 4
+    with tempfile.TemporaryDirectory() as directory:
+        args = TrainingArguments(directory, per_device_train_batch_size=4, max_steps=1, report_to="none",
+                                 save_strategy="no", disable_tqdm=True, use_cpu=not torch.cuda.is_available())
+        Trainer(model=model, args=args, train_dataset=rows).train()
+
+
+def child(mode):
+    if mode == "gui_import":
+        start = time.perf_counter()
+        import w  # noqa: F401
+        return time.perf_counter() - start
+    if mode == "gui_import_eager":
+        start = time.perf_counter()
+        import w  # noqa: F401
+        import matplotlib.pyplot  # noqa: F401
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg  # noqa: F401
+        return time.perf_counter() - start
+    if mode == "prewarm":
+        from startup import ML_MODULES, Prewarm, _import, probe_device
+
+        start = time.perf_counter()
+        Prewarm([(name, _import(name)) for name in ML_MODULES] + [("设备", probe_device)]).start().wait()
+        return time.perf_counter() - start
+    if mode == "first_step_warm":
+        from startup import ML_MODULES, Prewarm, _import, probe_device
+
+        Prewarm([(name, _import(name)) for name in ML_MODULES] + [("设备", probe_device)]).start().wait()
+    start = time.perf_counter()
+    first_step()
+    return time.perf_counter() - start
+
+
+def measure(mode, repeat):
+    values = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", mode],
+            capture_output=True, text=True, check=True, cwd=ROOT,
+        ).stdout
+        values.append(float(output.strip().splitlines()[-1]))
+    return min(values)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="界面启动耗时基准测试")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        print(child(args.child))
+        return
+
+    result = {}
+    for mode in ("gui_import", "gui_import_eager", "prewarm", "first_step_cold", "first_step_warm"):
+        result[mode] = round(measure(mode, args.repeat), 3)
+    result["gui_import_saved"] = round(result["gui_import_eager"] - result["gui_import"], 3)
+    result["first_step_saved"] = round(result["first_step_cold"] - result["first_step_warm"], 3)
+    print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""后台检查点写入
+
+训练线程只把权重复制到主机内存(快照)，safetensors文件由后台线程写出；
+tokenizer只保存一份，各检查点通过硬链接共享；epoch_N目录按数量保留最近的若干个。
+"""
+import glob
+import os
+import queue
+import re
+import shutil
+import threading
+import time
+
+SHARED_TOKENIZER_DIR = "tokenizer"
+
+
+def _is_peft_model(model):
+    return hasattr(model, "peft_config")
+
+
+def snapshot_state_dict(model):
+    """把需要保存的权重复制到主机内存，返回 {名称: CPU张量}
+
+    LoRA模型只保存适配器权重；完整模型中共享存储的张量(如绑定的词嵌入)只保存一次。
+    """
+    import torch
+
+    if _is_peft_model(model):
+        from peft import get_peft_model_state_dict
+        state_dict = get_peft_model_state_dict(model)
+    else:
+        state_dict = model.state_dict()
+
+    pin = torch.cuda.is_available()
+    snapshot = {}
+    seen = set()
+    for name, tensor in state_dict.items():
+        key = (tensor.device, tensor.data_ptr(), tensor.shape)
+        if tensor.data_ptr() and key in seen:
+            continue
+        seen.add(key)
+        host = torch.empty(tensor.shape, dtype=tensor.dtype, device="cpu", pin_memory=pin and tensor.is_cuda)
+        host.copy_(tensor.detach(), non_blocking=pin and tensor.is_cuda)
+        snapshot[name] = host
+    if pin:
+        torch.cuda.synchronize()
+    return snapshot
+
+
+def link_or_copy_tree(src, dst):
+    """用硬链接复制目录，跨文件系统等无法链接时退回普通复制"""
+    os.makedirs(dst, exist_ok=True)
+    for name in os.listdir(src):
+        s = os.path.join(src, name)
+        d = os.path.join(dst, name)
+        if os.path.isdir(s):
+            link_or_copy_tree(s, d)
+            continue
+        if os.path.exists(d):
+            os.remove(d)
+        try:
+            os.link(s, d)
+        except OSError:
+            shutil.copy2(s, d)
+
+
+def prune_epoch_checkpoints(save_path, keep_last):
+    """只保留最近keep_last个epoch_N目录，best_model不受影响，返回删除的目录"""
+    if keep_last <= 0:
+        return []
+    pattern = re.compile(r"epoch_(\d+)$")
+    epochs = []
+    for path in glob.glob(os.path.join(save_path, "epoch_*")):
+        match = pattern.search(path)
+        if match and os.path.isdir(path):
+            epochs.append((int(match.group(1)), path))
+    epochs.sort()
+    removed = []
+    for _, path in epochs[:-keep_last]:
+        shutil.rmtree(path, ignore_errors=True)
+        removed.append(path)
+    return removed
+
+
+class AsyncCheckpointWriter:
+    """在后台线程中写出模型快照
+
+    submit()在调用线程中完成快照后立即返回；待写入的快照超过max_pending时阻塞，
+    以限制占用的主机内存。close()等待全部写入完成。
+    """
+
+    def __init__(self, save_path, tokenizer, keep_last=2, max_pending=2, log=None):
+        self.save_path = save_path
+        self.keep_last = keep_last
+        self.log = log or (lambda message: None)
+        self.errors = []
+        self.stall_seconds = []
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._run, name="checkpoint-writer", daemon=True)
+        self._thread.start()
+
+        # tokenizer在整个训练中不变，只保存一次
+        self.tokenizer_dir = os.path.join(save_path, SHARED_TOKENIZER_DIR)
+        tokenizer.save_pretrained(self.tokenizer_dir)
+
+    def submit(self, model, path):
+        """快照模型权重并排队写入path，返回训练线程被占用的秒数"""
+        start = time.perf_counter()
+        tensors = snapshot_state_dict(model)
+        config = model.peft_config if _is_peft_model(model) else model.config
+        self._queue.put((path, tensors, config, _is_peft_model(model)))
+        stall = time.perf_counter() - start
+        self.stall_seconds.append(stall)
+        return stall
+
+    def close(self):
+        """等待全部写入完成，有写入失败时抛出第一个错误"""
+        self._queue.put(None)
+        self._thread.join()
+        if self.errors:
+            raise self.errors[0]
+
+    def _write(self, path, tensors, config, is_peft):
+        from safetensors.torch import save_file
+
+        tmp_path = path + ".tmp"
+        if os.path.exists(tmp_path):
+            shutil.rmtree(tmp_path)
+        os.makedirs(tmp_path)
+        if is_peft:
+            save_file(tensors, os.path.join(tmp_path, "adapter_model.safetensors"), metadata={"format": "pt"})
+            for adapter_config in config.values():
+                adapter_config.save_pretrained(tmp_path)
+        else:
+            save_file(tensors, os.path.join(tmp_path, "model.safetensors"), metadata={"format": "pt"})
+            config.save_pretrained(tmp_path)
+        link_or_copy_tree(self.tokenizer_dir, os.path.join(tmp_path, "tokenizer"))
+
+        # 写完整后再替换旧目录，中途崩溃不会留下半个检查点
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.replace(tmp_path, path)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            path, tensors, config, is_peft = item
+            start = time.perf_counter()
+            try:
+                self._write(path, tensors, config, is_peft)
+                for removed in prune_epoch_checkpoints(self.save_path, self.keep_last):
+                    self.log(f"已按保留策略删除旧检查点: {removed}\n")
+                self.log(f"检查点已写入 {path} (后台耗时 {time.perf_counter() - start:.1f} 秒)\n")
+            except Exception as e:
+                self.errors.append(e)
+                self.log(f"检查点写入失败 {path}: {str(e)}\n")
@@ -0,0 +1,229 @@
+"""流式读取训练数据，逐批写入磁盘上的Arrow文件，避免整份数据常驻内存
+
+支持JSONL(每行一个对象)、JSON数组、CSV/TSV(首行为列名)和Parquet，JSON数组也按块增量解析，
+Parquet按批读取，只读需要的列。
+"""
+import codecs
+import csv
+import hashlib
+import io
+import json
+import os
+import time
+
+# 每次从磁盘读取的字节数
+READ_CHUNK_SIZE = 1 << 20
+# 每批写入Arrow的记录数
+WRITE_BATCH_SIZE = 10000
+
+
+def detect_format(path):
+    """根据扩展名和首个非空白字符判断数据格式，返回 'jsonl'、'json'、'csv'、'tsv' 或 'parquet'"""
+    lower = path.lower()
+    if lower.endswith((".jsonl", ".ndjson")):
+        return "jsonl"
+    if lower.endswith(".csv"):
+        return "csv"
+    if lower.endswith(".tsv"):
+        return "tsv"
+    if lower.endswith(".parquet"):
+        return "parquet"
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(4096)
+            if not chunk:
+                return "jsonl"
+            stripped = chunk.lstrip(b" \t\r\n\xef\xbb\xbf")
+            if stripped:
+                return "json" if stripped[:1] == b"[" else "jsonl"
+
+
+def _iter_jsonl(f):
+    for line_no, line in enumerate(f, 1):
+        line = line.strip()
+        if line_no == 1:
+            line = line.lstrip(codecs.BOM_UTF8)
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"第{line_no}行不是有效的JSON: {e}") from e
+
+
+def _iter_json_array(f, chunk_size):
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    buf = ""
+    pos = 0
+    eof = False
+    started = False
+    read_size = chunk_size
+
+    while True:
+        # 跳过空白和元素间的逗号
+        while pos < len(buf) and (buf[pos].isspace() or (started and buf[pos] == ",")):
+            pos += 1
+        need_more = pos >= len(buf)
+
+        if not need_more:
+            ch = buf[pos]
+            if not started:
+                if ch != "[":
+                    raise ValueError("JSON数据必须是对象数组")
+                started = True
+                pos += 1
+                continue
+            if ch == "]":
+                return
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise ValueError("JSON数组格式错误或文件不完整")
+                need_more = True
+            else:
+                # 对象恰好位于缓冲区末尾时也可能被截断，先补足数据再确认
+                if end < len(buf) or eof:
+                    yield obj
+                    pos = end
+                    read_size = chunk_size
+                    continue
+                need_more = True
+
+        if eof:
+            raise ValueError("JSON数组不完整，缺少结尾的 ]")
+        chunk = f.read(read_size)
+        eof = not chunk
+        buf = buf[pos:] + text_decoder.decode(chunk, final=eof)
+        pos = 0
+        # 单个对象超过缓冲区时逐步扩大读取量，避免反复解析
+        read_size = min(read_size * 2, 64 * chunk_size)
+
+
+def _iter_csv(f, delimiter):
+    yield from csv.DictReader(io.TextIOWrapper(f, encoding='utf-8-sig', newline=''), delimiter=delimiter)
+
+
+def _iter_parquet(f, columns):
+    import pyarrow.parquet as pq
+
+    parquet = pq.ParquetFile(f)
+    if columns is not None:
+        columns = [name for name in columns if name in parquet.schema_arrow.names]
+    for batch in parquet.iter_batches(batch_size=WRITE_BATCH_SIZE, columns=columns):
+        yield from batch.to_pylist()
+
+
+def iter_records(path, progress=None, chunk_size=READ_CHUNK_SIZE, columns=None):
+    """逐条产出数据文件中的记录
+
+    progress: 可选回调 progress(已读字节, 总字节, 已读记录数)，约每秒调用一次
+    columns: 只需要的列名，Parquet据此跳过其余列，其他格式忽略
+    """
+    total = os.path.getsize(path)
+    fmt = detect_format(path)
+    count = 0
+    last_report = time.monotonic()
+    with open(path, 'rb') as f:
+        if fmt == "jsonl":
+            records = _iter_jsonl(f)
+        elif fmt == "json":
+            records = _iter_json_array(f, chunk_size)
+        elif fmt == "parquet":
+            records = _iter_parquet(f, columns)
+        else:
+            records = _iter_csv(f, "," if fmt == "csv" else "\t")
+        for record in records:
+            count += 1
+            yield record
+            if progress is not None:
+                now = time.monotonic()
+                if now - last_report >= 1.0:
+                    last_report = now
+                    progress(f.tell(), total, count)
+        if progress is not None:
+            progress(total, total, count)
+
+
+def iter_batches(path, extract, progress=None, batch_size=WRITE_BATCH_SIZE, columns=None):
+    """按批产出列字典，extract(记录, 下标) 把一条记录转换为 {列名: 值}"""
+    batch = None
+    size = 0
+    for index, record in enumerate(iter_records(path, progress=progress, columns=columns)):
+        if not isinstance(record, dict):
+            raise ValueError(f"第{index + 1}条数据不是对象")
+        row = extract(record, index)
+        if batch is None:
+            batch = {key: [] for key in row}
+        for key, value in row.items():
+            batch[key].append(value)
+        size += 1
+        if size >= batch_size:
+            yield batch
+            batch = None
+            size = 0
+    if batch is not None:
+        yield batch
+
+
+def _extract_text(record, index):
+    if "text" not in record:
+        raise ValueError(f"第{index + 1}条数据缺少text字段")
+    return {"text": record["text"]}
+
+
+def source_fingerprint(path):
+    """用路径、大小和修改时间标识数据文件，用于复用已转换的Arrow文件"""
+    stat = os.stat(path)
+    key = f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}"
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+
+
+def load_records_dataset(path, cache_dir, features, extract, name, columns=None, log=None):
+    """将训练数据流式转换为磁盘上的Arrow文件并以内存映射方式加载
+
+    features: datasets.Features，extract的输出需与之一致；name区分同一数据文件的不同转换方式
+    """
+    from datasets import Dataset
+    from datasets.arrow_writer import ArrowWriter
+
+    log = log or (lambda message: None)
+    os.makedirs(cache_dir, exist_ok=True)
+    arrow_path = os.path.join(cache_dir, f"{name}-{source_fingerprint(path)}.arrow")
+    if os.path.exists(arrow_path):
+        log(f"复用已转换的数据集: {arrow_path}\n")
+        return Dataset.from_file(arrow_path)
+
+    def report(done, total, count):
+        percent = done / total * 100 if total else 100
+        log(f"正在读取训练数据: {percent:.1f}% ({count} 条)\n")
+
+    log(f"正在流式读取训练数据: {path}\n")
+    start = time.perf_counter()
+    tmp_path = arrow_path + ".tmp"
+    writer = ArrowWriter(features=features, path=tmp_path, writer_batch_size=WRITE_BATCH_SIZE)
+    try:
+        for batch in iter_batches(path, extract, progress=report, columns=columns):
+            writer.write_batch(batch)
+        num_rows, _ = writer.finalize()
+    except BaseException:
+        writer.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, arrow_path)
+
+    elapsed = max(time.perf_counter() - start, 1e-9)
+    size_mb = os.path.getsize(path) / (1 << 20)
+    log(f"数据转换完成: {num_rows} 条, {size_mb:.1f} MB, 耗时 {elapsed:.1f} 秒 ({size_mb / elapsed:.1f} MB/s)\n")
+    return Dataset.from_file(arrow_path)
+
+
+def load_text_dataset(path, cache_dir, log=None):
+    """只读取 "text" 字段"""
+    from datasets import Features, Value
+
+    return load_records_dataset(
+        path, cache_dir, Features({"text": Value("string")}), _extract_text, "text", columns=["text"], log=log
+    )
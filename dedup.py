@@ -0,0 +1,244 @@
+"""基于MinHash/LSH的近似去重，在分词之后、打包之前删除近似重复的样本
+
+在token序列上取连续NGRAM个token作为shingle，两条样本的shingle集合的Jaccard相似度
+不低于阈值时视为重复，只保留下标最小的一条。流程:
+    1. datasets.map(num_proc)并行计算每条样本的MinHash签名，签名写入临时Arrow文件
+    2. 签名切成 bands 段，每段 rows 个值；逐段对全部样本求段哈希并排序，同一桶内的样本成为候选对
+    3. 候选对用签名估计的Jaccard相似度复核，超过阈值的用并查集合并
+内存中只保留每条样本几个整数(段哈希、排序下标、并查集)，文本和签名都在磁盘上按块读取。
+截断后的样本只按实际参与训练的前max_length个token比较。
+"""
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+NUM_PERM = 128
+NGRAM = 5
+# 每次读取签名的行数
+SIGNATURE_CHUNK_SIZE = 50000
+# 计算签名时每次处理的shingle数，限制单条超长样本的内存占用
+_SHINGLE_BLOCK = 4096
+
+
+def _mix64(x):
+    """splitmix64的混合函数，使哈希值的各位均匀分布"""
+    x = x ^ (x >> np.uint64(30))
+    x = x * np.uint64(0xBF58476D1CE4E5B9)
+    x = x ^ (x >> np.uint64(27))
+    x = x * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def permutations(num_perm=NUM_PERM, seed=1):
+    """MinHash使用的 num_perm 组乘移位哈希参数 (a, b)，a为奇数"""
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, 1 << 63, num_perm, dtype=np.uint64) | np.uint64(1)
+    b = rng.integers(0, 1 << 63, num_perm, dtype=np.uint64)
+    return a, b
+
+
+def shingle_hashes(ids, ngram=NGRAM):
+    """连续ngram个token的64位哈希(去重后)，不足ngram个token时整条作为一个shingle"""
+    ids = np.asarray(ids, dtype=np.uint64)
+    if len(ids) == 0:
+        return np.zeros(1, dtype=np.uint64)
+    ngram = min(ngram, len(ids))
+    count = len(ids) - ngram + 1
+    with np.errstate(over="ignore"):
+        hashes = ids[:count] + np.uint64(1)
+        for offset in range(1, ngram):
+            hashes = hashes * np.uint64(0x100000001B3) + ids[offset:offset + count] + np.uint64(1)
+        return np.unique(_mix64(hashes))
+
+
+def _min_hash_values(hashes, a, b):
+    """每个shingle在各组哈希下的值，形状为 (len(a), len(hashes))"""
+    with np.errstate(over="ignore"):
+        # 乘移位哈希: 取 (a*x + b) mod 2^64 的高32位
+        return (a[:, None] * hashes + b[:, None]) >> np.uint64(32)
+
+
+def minhash(ids, a, b, ngram=NGRAM):
+    """单条样本的MinHash签名，长度为len(a)的uint32数组"""
+    hashes = shingle_hashes(ids, ngram)
+    signature = np.full(len(a), 0xFFFFFFFF, dtype=np.uint64)
+    for start in range(0, len(hashes), _SHINGLE_BLOCK):
+        np.minimum(signature, _min_hash_values(hashes[start:start + _SHINGLE_BLOCK], a, b).min(axis=1), out=signature)
+    return signature.astype(np.uint32)
+
+
+def _signature_batch(batch, a, b, ngram):
+    """批量计算签名: 多条样本的shingle拼在一起计算，再按样本边界取最小值，减少逐条调用numpy的开销"""
+    signatures = []
+    group, group_size = [], 0
+
+    def flush():
+        offsets = np.cumsum([0] + [len(hashes) for hashes in group[:-1]])
+        values = _min_hash_values(np.concatenate(group), a, b)
+        signatures.extend(np.minimum.reduceat(values, offsets, axis=1).T.astype(np.uint32))
+
+    for ids in batch["input_ids"]:
+        hashes = shingle_hashes(ids, ngram)
+        if len(hashes) > _SHINGLE_BLOCK:
+            if group:
+                flush()
+                group, group_size = [], 0
+            signatures.append(minhash(ids, a, b, ngram))
+            continue
+        group.append(hashes)
+        group_size += len(hashes)
+        if group_size >= _SHINGLE_BLOCK:
+            flush()
+            group, group_size = [], 0
+    if group:
+        flush()
+    return {"minhash": signatures}
+
+
+def lsh_params(threshold, num_perm=NUM_PERM, false_positive_weight=0.1):
+    """选择 (bands, rows)，使阈值两侧的加权误判面积最小
+
+    候选对都会用签名复核，LSH的假阳性只增加复核量，假阴性则直接漏删，因此假阳性的权重较低。
+    """
+    grid = np.linspace(0.0, 1.0, 201)
+    best = None
+    for bands in range(1, num_perm + 1):
+        rows = num_perm // bands
+        if rows == 0:
+            break
+        probability = 1 - (1 - grid ** rows) ** bands
+        false_positive = np.where(grid < threshold, probability, 0).mean()
+        false_negative = np.where(grid >= threshold, 1 - probability, 0).mean()
+        error = false_positive_weight * false_positive + (1 - false_positive_weight) * false_negative
+        if best is None or error < best[0]:
+            best = (error, bands, rows)
+    return best[1], best[2]
+
+
+def _read_signatures(signatures, start, end):
+    table = signatures.with_format("arrow")[start:end]
+    column = table["minhash"].combine_chunks()
+    return column.flatten().to_numpy(zero_copy_only=False).reshape(len(column), -1)
+
+
+def _take_signatures(signatures, indices):
+    table = signatures.with_format("arrow")[indices.tolist()]
+    column = table["minhash"].combine_chunks()
+    return column.flatten().to_numpy(zero_copy_only=False).reshape(len(column), -1)
+
+
+def _band_keys(signatures, band, rows):
+    """全部样本在第band段签名上的64位哈希"""
+    count = len(signatures)
+    keys = np.empty(count, dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for start in range(0, count, SIGNATURE_CHUNK_SIZE):
+            chunk = _read_signatures(signatures, start, min(start + SIGNATURE_CHUNK_SIZE, count))
+            values = chunk[:, band * rows:(band + 1) * rows].astype(np.uint64)
+            key = np.full(len(values), band, dtype=np.uint64)
+            for column in range(rows):
+                key = _mix64(key ^ values[:, column])
+            keys[start:start + len(values)] = key
+    return keys
+
+
+def _find(parent, i):
+    root = i
+    while parent[root] != root:
+        root = parent[root]
+    while parent[i] != root:
+        parent[i], i = root, parent[i]
+    return root
+
+
+def near_duplicates(signatures, threshold, bands, rows):
+    """返回布尔数组，True表示该样本与下标更小的某条样本近似重复"""
+    count = len(signatures)
+    parent = np.arange(count, dtype=np.int64)
+    for band in range(bands):
+        keys = _band_keys(signatures, band, rows)
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        del keys
+        # 同一桶内稳定排序后第一个是下标最小的样本，其余样本与它组成候选对
+        is_start = np.ones(count, dtype=bool)
+        is_start[1:] = sorted_keys[1:] != sorted_keys[:-1]
+        del sorted_keys
+        leaders = order[np.maximum.accumulate(np.where(is_start, np.arange(count), 0))]
+        members = order[~is_start]
+        leaders = leaders[~is_start]
+        del order, is_start
+        for start in range(0, len(members), SIGNATURE_CHUNK_SIZE):
+            left = members[start:start + SIGNATURE_CHUNK_SIZE]
+            right = leaders[start:start + SIGNATURE_CHUNK_SIZE]
+            # 已经合并过的候选对不再复核
+            pending = [k for k in range(len(left)) if _find(parent, left[k]) != _find(parent, right[k])]
+            if not pending:
+                continue
+            left, right = left[pending], right[pending]
+            similarity = (_take_signatures(signatures, left) == _take_signatures(signatures, right)).mean(axis=1)
+            for i, j in zip(left[similarity >= threshold].tolist(), right[similarity >= threshold].tolist()):
+                root_i, root_j = _find(parent, i), _find(parent, j)
+                if root_i != root_j:
+                    parent[max(root_i, root_j)] = min(root_i, root_j)
+    # 父节点的下标总是更小，反复跳到父节点的父节点直到不再变化即得到各样本的根
+    while True:
+        grandparent = parent[parent]
+        if np.array_equal(grandparent, parent):
+            break
+        parent = grandparent
+    return parent != np.arange(count)
+
+
+def deduplicate(dataset, threshold, num_proc=1, num_perm=NUM_PERM, ngram=NGRAM, log=None):
+    """删除近似重复的样本，返回 (去重后的数据集, 统计信息)
+
+    dataset需包含input_ids列；统计信息包含 rows、removed、tokens、saved_tokens。
+    """
+    log = log or (lambda message: None)
+    from length_sampler import sequence_lengths
+
+    count = len(dataset)
+    stats = {"rows": count, "removed": 0, "tokens": 0, "saved_tokens": 0}
+    if count < 2:
+        return dataset, stats
+    bands, rows = lsh_params(threshold, num_perm)
+    a, b = permutations(num_perm)
+    cache_files = getattr(dataset, "cache_files", None)
+    work_dir = tempfile.mkdtemp(
+        prefix="minhash-", dir=os.path.dirname(cache_files[0]["filename"]) if cache_files else None
+    )
+    try:
+        log(f"去重: 计算MinHash签名 ({num_perm} 个哈希, {bands} 段 × {rows} 行, 阈值 {threshold})\n")
+        signatures = dataset.map(
+            _signature_batch,
+            batched=True,
+            num_proc=num_proc if num_proc and num_proc > 1 else None,
+            remove_columns=dataset.column_names,
+            fn_kwargs={"a": a, "b": b, "ngram": ngram},
+            cache_file_name=os.path.join(work_dir, "minhash.arrow"),
+            desc="MinHash",
+        )
+        duplicated = near_duplicates(signatures, threshold, bands, rows)
+        del signatures
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    lengths = sequence_lengths(dataset)
+    stats.update(
+        removed=int(duplicated.sum()),
+        tokens=int(lengths.sum()),
+        saved_tokens=int(lengths[duplicated].sum()),
+    )
+    if stats["removed"]:
+        dataset = dataset.select(np.flatnonzero(~duplicated))
+    return dataset, stats
+
+
+def format_stats(stats):
+    rows = max(stats["rows"], 1)
+    tokens = max(stats["tokens"], 1)
+    return (f"去重: 删除 {stats['removed']} 条近似重复样本 ({stats['removed'] / rows:.1%})，"
+            f"节省 {stats['saved_tokens']} 个token ({stats['saved_tokens'] / tokens:.1%})")
@@ -0,0 +1,342 @@
+"""模型导出
+
+两种模式:
+    adapter: 只复制LoRA适配器和tokenizer，不加载基础模型
+    merged:  逐个张量读取基础模型的safetensors，把LoRA增量 scale * B @ A 合并进对应权重后
+             直接写入输出分片，内存中同时只有一个张量，不会同时持有两份完整权重
+"""
+import json
+import math
+import os
+import re
+import shutil
+import time
+
+ADAPTER_FILES = ("adapter_model.safetensors", "adapter_config.json", "adapter_model.bin")
+MODEL_CONFIG_FILES = ("config.json", "generation_config.json")
+TOKENIZER_FILE_PREFIXES = ("tokenizer", "special_tokens", "vocab", "merges", "chat_template")
+DEFAULT_MAX_SHARD_SIZE = 5 * (1 << 30)
+
+_LORA_KEY = re.compile(r"^(?:base_model\.model\.)?(.+)\.lora_([AB])(?:\.[^.]+)?\.weight$")
+_PEFT_PREFIX = "base_model.model."
+
+
+def find_latest_checkpoint(save_path):
+    """返回save_path下最新写出的epoch_N、checkpoint-N或final_model目录，都没有时退回best_model
+
+    checkpoint-N只在trainer_state.json已写出(保存完整)时计入。
+    """
+    latest = None
+    latest_mtime = -1.0
+    if os.path.isdir(save_path):
+        for name in os.listdir(save_path):
+            path = os.path.join(save_path, name)
+            if not os.path.isdir(path):
+                continue
+            if re.fullmatch(r"epoch_(\d+)", name) or name == "final_model":
+                mtime = os.path.getmtime(path)
+            elif re.fullmatch(r"checkpoint-(\d+)", name) and os.path.exists(os.path.join(path, "trainer_state.json")):
+                mtime = os.path.getmtime(os.path.join(path, "trainer_state.json"))
+            else:
+                continue
+            if mtime > latest_mtime:
+                latest_mtime = mtime
+                latest = path
+    if latest is None and os.path.isdir(os.path.join(save_path, "best_model")):
+        latest = os.path.join(save_path, "best_model")
+    return latest
+
+
+def is_adapter_checkpoint(path):
+    return os.path.exists(os.path.join(path, "adapter_config.json"))
+
+
+def _copy_tokenizer(checkpoint_dir, export_path):
+    tokenizer_dir = os.path.join(checkpoint_dir, "tokenizer")
+    if os.path.isdir(tokenizer_dir):
+        names = os.listdir(tokenizer_dir)
+    else:
+        # Trainer的checkpoint-N把tokenizer文件直接写在检查点根目录
+        tokenizer_dir = checkpoint_dir
+        names = [name for name in os.listdir(checkpoint_dir) if name.startswith(TOKENIZER_FILE_PREFIXES)]
+        if not names:
+            return False
+    for name in names:
+        src = os.path.join(tokenizer_dir, name)
+        if os.path.isfile(src):
+            shutil.copy2(src, os.path.join(export_path, name))
+    return True
+
+
+def export_adapter(checkpoint_dir, export_path, log=None):
+    """只导出LoRA适配器和tokenizer"""
+    log = log or (lambda message: None)
+    if not is_adapter_checkpoint(checkpoint_dir):
+        raise FileNotFoundError(f"{checkpoint_dir} 中没有LoRA适配器(adapter_config.json)")
+    os.makedirs(export_path, exist_ok=True)
+    for name in ADAPTER_FILES:
+        src = os.path.join(checkpoint_dir, name)
+        if os.path.exists(src):
+            shutil.copy2(src, os.path.join(export_path, name))
+    if _copy_tokenizer(checkpoint_dir, export_path):
+        log("已复制tokenizer\n")
+    log(f"适配器已导出到 {export_path}\n")
+    return export_path
+
+
+def export_full(checkpoint_dir, export_path, log=None):
+    """全参数微调的检查点已经是完整模型，直接复制"""
+    log = log or (lambda message: None)
+    os.makedirs(export_path, exist_ok=True)
+    for name in os.listdir(checkpoint_dir):
+        src = os.path.join(checkpoint_dir, name)
+        if os.path.isfile(src):
+            shutil.copy2(src, os.path.join(export_path, name))
+    _copy_tokenizer(checkpoint_dir, export_path)
+    log(f"模型已导出到 {export_path}\n")
+    return export_path
+
+
+def resolve_model_dir(model_name_or_path, local_files_only=False):
+    """返回基础模型所在的本地目录，Hub上的模型只下载safetensors和配置文件"""
+    if os.path.isdir(model_name_or_path):
+        return model_name_or_path
+    from huggingface_hub import snapshot_download
+    return snapshot_download(
+        model_name_or_path,
+        allow_patterns=["*.safetensors", "*.safetensors.index.json", "*.json"],
+        local_files_only=local_files_only,
+    )
+
+
+def safetensors_shards(model_dir):
+    """返回基础模型的safetensors分片列表"""
+    index_path = os.path.join(model_dir, "model.safetensors.index.json")
+    if os.path.exists(index_path):
+        with open(index_path, 'r', encoding='utf-8') as f:
+            weight_map = json.load(f)["weight_map"]
+        return [os.path.join(model_dir, name) for name in sorted(set(weight_map.values()))]
+    single = os.path.join(model_dir, "model.safetensors")
+    if os.path.exists(single):
+        return [single]
+    raise FileNotFoundError(f"{model_dir} 中没有safetensors格式的模型权重")
+
+
+def load_lora_deltas(checkpoint_dir):
+    """读取适配器，返回 (scale, {基础权重名: (A, B)}, {基础权重名: 替换张量}, fan_in_fan_out)"""
+    from safetensors.torch import load_file
+
+    with open(os.path.join(checkpoint_dir, "adapter_config.json"), 'r', encoding='utf-8') as f:
+        adapter_config = json.load(f)
+    rank = adapter_config["r"]
+    alpha = adapter_config.get("lora_alpha", rank)
+    scale = alpha / math.sqrt(rank) if adapter_config.get("use_rslora") else alpha / rank
+
+    tensors = load_file(os.path.join(checkpoint_dir, "adapter_model.safetensors"))
+    pairs = {}
+    replacements = {}
+    for key, tensor in tensors.items():
+        match = _LORA_KEY.match(key)
+        if match:
+            module, which = match.groups()
+            pairs.setdefault(module + ".weight", {})[which] = tensor
+        elif "lora_" in key:
+            raise ValueError(f"暂不支持合并的适配器权重: {key}")
+        else:
+            # modules_to_save 等整体替换的权重
+            name = key[len(_PEFT_PREFIX):] if key.startswith(_PEFT_PREFIX) else key
+            replacements[name] = tensor
+    deltas = {}
+    for name, pair in pairs.items():
+        if "A" not in pair or "B" not in pair:
+            raise ValueError(f"适配器权重不完整: {name}")
+        deltas[name] = (pair["A"], pair["B"])
+    return scale, deltas, replacements, adapter_config.get("fan_in_fan_out", False)
+
+
+# safetensors中的dtype名称
+SAFETENSORS_DTYPES = {
+    "F64": "float64", "F32": "float32", "F16": "float16", "BF16": "bfloat16",
+    "I64": "int64", "I32": "int32", "I16": "int16", "I8": "int8", "U8": "uint8", "BOOL": "bool",
+    "F8_E4M3": "float8_e4m3fn", "F8_E5M2": "float8_e5m2",
+}
+_DTYPE_NAMES = {torch_name: name for name, torch_name in SAFETENSORS_DTYPES.items()}
+_DTYPE_SIZES = {"F64": 8, "F32": 4, "F16": 2, "BF16": 2, "I64": 8, "I32": 4, "I16": 2, "I8": 1, "U8": 1,
+                "BOOL": 1, "F8_E4M3": 1, "F8_E5M2": 1}
+
+
+def read_safetensors_header(path):
+    """读取safetensors文件头(8字节小端长度 + JSON)，返回 (张量信息, 数据区起始偏移)"""
+    with open(path, 'rb') as f:
+        length = int.from_bytes(f.read(8), "little")
+        header = json.loads(f.read(length))
+    header.pop("__metadata__", None)
+    return header, 8 + length
+
+
+def _read_tensor(f, info, data_start):
+    """按文件头中的偏移直接读入张量，不经过mmap"""
+    import torch
+
+    begin, end = info["data_offsets"]
+    buffer = torch.empty(end - begin, dtype=torch.uint8)
+    f.seek(data_start + begin)
+    f.readinto(buffer.numpy())
+    dtype = getattr(torch, SAFETENSORS_DTYPES[info["dtype"]])
+    return buffer.view(dtype).reshape(info["shape"])
+
+
+def _merge_lora(weight, lora_a, lora_b, scale, fan_in_fan_out, rows=1024):
+    """原地计算 weight += scale * B @ A，按行分块以免生成整个fp32增量矩阵"""
+    if fan_in_fan_out:
+        left, right = lora_a.T.float(), lora_b.T.float()
+    else:
+        left, right = lora_b.float(), lora_a.float()
+    for begin in range(0, weight.shape[0], rows):
+        block = weight[begin:begin + rows]
+        block.copy_(block.float().addmm_(left[begin:begin + rows], right, alpha=scale))
+
+
+def _plan_shards(entries, max_shard_size):
+    """按输出大小把张量分组，entries为 [(名称, dtype名, 形状)]"""
+    shards = []
+    current = []
+    current_bytes = 0
+    for name, dtype, shape in entries:
+        size = math.prod(shape) * _DTYPE_SIZES[dtype]
+        if current and current_bytes + size > max_shard_size:
+            shards.append(current)
+            current = []
+            current_bytes = 0
+        current.append((name, dtype, shape, size))
+        current_bytes += size
+    if current:
+        shards.append(current)
+    return shards
+
+
+def _write_shard(path, tensors, produce):
+    """先写文件头再逐个写入张量数据，内存中同时只有一个张量
+
+    produce(name)返回该张量，其dtype和形状须与tensors中登记的一致。
+    """
+    import torch
+
+    header = {"__metadata__": {"format": "pt"}}
+    offset = 0
+    for name, dtype, shape, size in tensors:
+        header[name] = {"dtype": dtype, "shape": list(shape), "data_offsets": [offset, offset + size]}
+        offset += size
+    header_bytes = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    # 与safetensors一致，文件头按8字节对齐
+    header_bytes += b" " * (-len(header_bytes) % 8)
+    with open(path, 'wb') as f:
+        f.write(len(header_bytes).to_bytes(8, "little"))
+        f.write(header_bytes)
+        for name, dtype, shape, size in tensors:
+            tensor = produce(name).contiguous()
+            f.write(memoryview(tensor.view(-1).view(torch.uint8).numpy()))
+
+
+def export_merged(base_model, checkpoint_dir, export_path, max_shard_size=DEFAULT_MAX_SHARD_SIZE,
+                  dtype=None, local_files_only=False, log=None):
+    """把LoRA适配器合并进基础模型权重并以分片safetensors导出
+
+    输出分片的划分由基础模型的文件头预先算出，之后逐个张量读取、合并、写出。
+    dtype: 输出精度(如"float16")，默认与基础模型各张量一致
+    """
+    import torch
+
+    log = log or (lambda message: None)
+    start = time.perf_counter()
+    model_dir = resolve_model_dir(base_model, local_files_only=local_files_only)
+    scale, deltas, replacements, fan_in_fan_out = load_lora_deltas(checkpoint_dir)
+    log(f"已读取适配器: {len(deltas)} 个LoRA模块, 缩放系数 {scale:g}\n")
+
+    sources = {}  # 张量名 -> (基础模型分片, 张量信息, 数据区起始偏移)
+    entries = []
+    for shard in safetensors_shards(model_dir):
+        header, data_start = read_safetensors_header(shard)
+        for name, info in sorted(header.items(), key=lambda item: item[1]["data_offsets"][0]):
+            if name.endswith((".absmax", ".quant_map", ".quant_state")) or ".quant_state." in name:
+                raise ValueError("基础模型是预量化权重，无法合并，请使用原始精度的基础模型")
+            sources[name] = (shard, info, data_start)
+            out_dtype = info["dtype"]
+            if dtype is not None and info["dtype"] in ("F64", "F32", "F16", "BF16"):
+                out_dtype = _DTYPE_NAMES[str(dtype).replace("torch.", "")]
+            entries.append((name, out_dtype, info["shape"]))
+
+    missing = set(deltas) - set(sources)
+    if missing:
+        raise ValueError(f"基础模型中找不到以下LoRA目标权重: {sorted(missing)[:5]}")
+    extra = set(replacements) - set(sources)
+    if extra:
+        raise ValueError(f"基础模型中找不到以下替换权重: {sorted(extra)[:5]}")
+
+    out_dtypes = {name: out_dtype for name, out_dtype, _ in entries}
+    handles = {}
+
+    def produce(name):
+        shard, info, data_start = sources[name]
+        if shard not in handles:
+            # 基础模型分片按顺序读取，只保持当前分片打开
+            for handle in handles.values():
+                handle.close()
+            handles.clear()
+            handles[shard] = open(shard, 'rb')
+        if name in replacements:
+            tensor = replacements[name]
+        else:
+            tensor = _read_tensor(handles[shard], info, data_start)
+        if name in deltas:
+            _merge_lora(tensor, *deltas[name], scale, fan_in_fan_out)
+        return tensor.to(getattr(torch, SAFETENSORS_DTYPES[out_dtypes[name]]))
+
+    os.makedirs(export_path, exist_ok=True)
+    shards = _plan_shards(entries, max_shard_size)
+    count = len(shards)
+    names = ["model.safetensors"] if count == 1 else [
+        f"model-{i:05d}-of-{count:05d}.safetensors" for i in range(1, count + 1)
+    ]
+    written = []
+    try:
+        for i, (name, tensors) in enumerate(zip(names, shards), 1):
+            tmp_path = os.path.join(export_path, name + ".tmp")
+            written.append(tmp_path)
+            _write_shard(tmp_path, tensors, produce)
+            log(f"已写出分片 {i}/{count}\n")
+    except BaseException:
+        for tmp_path in written:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        raise
+    finally:
+        for handle in handles.values():
+            handle.close()
+    # 全部写完后再去掉.tmp后缀，中途失败不会留下不完整的模型
+    for tmp_path in written:
+        os.replace(tmp_path, tmp_path[:-len(".tmp")])
+
+    total_size = sum(size for tensors in shards for _, _, _, size in tensors)
+    if count > 1:
+        weight_map = {tensor[0]: name for name, tensors in zip(names, shards) for tensor in tensors}
+        with open(os.path.join(export_path, "model.safetensors.index.json"), 'w', encoding='utf-8') as f:
+            json.dump({"metadata": {"total_size": total_size}, "weight_map": weight_map}, f, indent=2)
+
+    for name in MODEL_CONFIG_FILES:
+        src = os.path.join(model_dir, name)
+        if os.path.exists(src):
+            shutil.copy2(src, os.path.join(export_path, name))
+    if dtype is not None:
+        config_path = os.path.join(export_path, "config.json")
+        with open(config_path, 'r', encoding='utf-8') as f:
+            model_config = json.load(f)
+        model_config["torch_dtype"] = str(dtype).replace("torch.", "")
+        with open(config_path, 'w', encoding='utf-8') as f:
+            json.dump(model_config, f, indent=2)
+    _copy_tokenizer(checkpoint_dir, export_path)
+
+    elapsed = time.perf_counter() - start
+    log(f"合并导出完成: {len(deltas)} 个权重已合并, {count} 个分片, "
+        f"{total_size / (1 << 30):.2f} GB, 耗时 {elapsed:.1f} 秒\n")
+    return export_path
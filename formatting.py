@@ -0,0 +1,173 @@
+"""把不同格式的训练数据整理成 "text" 列
+
+模板:
+    text    每条数据的text字段原样使用
+    alpaca  instruction / input / output 三个字段，按Alpaca提示词拼接并补上eos
+    chat    messages(OpenAI格式, role/content) 或 conversations(ShareGPT格式, from/value)，
+            用tokenizer的对话模板渲染；tokenizer没有对话模板时使用ChatML
+    auto    按第一条数据的字段自动选择
+读取时只抽取模板需要的字段写入Arrow(见data_stream.py)，再用datasets.map按批、多进程渲染。
+"""
+import json
+
+from data_stream import iter_records, load_records_dataset, load_text_dataset
+
+TEMPLATES = ("auto", "text", "alpaca", "chat")
+# 每批渲染的样本数
+FORMAT_BATCH_SIZE = 1000
+
+# 与 Qwen2_5_(7B)_Alpaca.ipynb 相同，推理时需使用同一提示词
+ALPACA_PROMPT = """Below is an instruction that describes a task, paired with an input that provides further context. Write a response that appropriately completes the request.
+
+### Instruction:
+{}
+
+### Input:
+{}
+
+### Response:
+{}"""
+
+CHATML_TEMPLATE = (
+    "{% for message in messages %}"
+    "{{ '<|im_start|>' + message['role'] + '\n' + message['content'] + '<|im_end|>' + '\n' }}"
+    "{% endfor %}"
+    "{% if add_generation_prompt %}{{ '<|im_start|>assistant\n' }}{% endif %}"
+)
+
+# ShareGPT的角色名映射为OpenAI格式
+ROLE_ALIASES = {
+    "human": "user", "user": "user",
+    "gpt": "assistant", "assistant": "assistant", "bot": "assistant", "model": "assistant",
+    "system": "system", "tool": "tool", "function": "tool",
+}
+
+
+def detect_template(path):
+    """按第一条数据的字段判断模板"""
+    for record in iter_records(path):
+        if not isinstance(record, dict):
+            break
+        if "messages" in record or "conversations" in record:
+            return "chat"
+        if "instruction" in record and "output" in record:
+            return "alpaca"
+        if "text" in record:
+            return "text"
+        raise ValueError(f"无法识别数据格式，字段为: {', '.join(record)}；需要text、instruction/output或messages/conversations")
+    raise ValueError("训练数据为空或不是对象列表")
+
+
+def resolve_template(path, template):
+    return detect_template(path) if template == "auto" else template
+
+
+def _string(value):
+    return "" if value is None else str(value)
+
+
+def _extract_alpaca(record, index):
+    if "instruction" not in record or "output" not in record:
+        raise ValueError(f"第{index + 1}条数据缺少instruction或output字段")
+    return {
+        "instruction": _string(record["instruction"]),
+        "input": _string(record.get("input")),
+        "output": _string(record["output"]),
+    }
+
+
+def _extract_chat(record, index):
+    messages = record.get("messages", record.get("conversations"))
+    if isinstance(messages, str):
+        # CSV中的对话常以JSON字符串保存
+        messages = json.loads(messages)
+    if not isinstance(messages, list):
+        raise ValueError(f"第{index + 1}条数据缺少messages或conversations字段")
+    result = []
+    for message in messages:
+        if not isinstance(message, dict):
+            raise ValueError(f"第{index + 1}条数据的对话消息不是对象")
+        role = message.get("role", message.get("from"))
+        content = message.get("content", message.get("value"))
+        if role is None or content is None:
+            raise ValueError(f"第{index + 1}条数据的对话消息缺少role/from或content/value")
+        result.append({"role": ROLE_ALIASES.get(role, role), "content": _string(content)})
+    return {"messages": result}
+
+
+def template_fields(template):
+    """返回 (Features, 抽取函数, 需要的列)"""
+    from datasets import Features, Value
+
+    if template == "alpaca":
+        features = Features({name: Value("string") for name in ("instruction", "input", "output")})
+        return features, _extract_alpaca, ["instruction", "input", "output"]
+    if template == "chat":
+        # 列表写法在datasets 2.x-4.x中都表示"字典的列表"；Sequence(dict)在4.0之前会变成"列表的字典"
+        features = Features({"messages": [{"role": Value("string"), "content": Value("string")}]})
+        return features, _extract_chat, ["messages", "conversations"]
+    raise ValueError(f"未知的数据模板: {template}")
+
+
+def load_records(path, cache_dir, template, log=None):
+    """流式读取模板需要的字段，返回内存映射的数据集"""
+    if template == "text":
+        return load_text_dataset(path, cache_dir, log=log)
+    features, extract, columns = template_fields(template)
+    return load_records_dataset(path, cache_dir, features, extract, template, columns=columns, log=log)
+
+
+def ensure_chat_template(tokenizer, log=None):
+    """tokenizer没有对话模板时设置为ChatML，导出的tokenizer会带上同一模板"""
+    if tokenizer is not None and not getattr(tokenizer, "chat_template", None):
+        tokenizer.chat_template = CHATML_TEMPLATE
+        if log is not None:
+            log("tokenizer没有对话模板，使用ChatML格式\n")
+
+
+def _format_alpaca(batch, eos_token):
+    return {"text": [ALPACA_PROMPT.format(instruction, inp, output) + eos_token
+                     for instruction, inp, output in zip(batch["instruction"], batch["input"], batch["output"])]}
+
+
+def _format_chat(batch, tokenizer, strip_bos):
+    texts = tokenizer.apply_chat_template(batch["messages"], tokenize=False)
+    if strip_bos:
+        # 分词时还会再加一次bos，去掉模板渲染出的bos
+        bos = tokenizer.bos_token
+        texts = [text[len(bos):] if text.startswith(bos) else text for text in texts]
+    return {"text": texts}
+
+
+def _adds_bos(tokenizer):
+    bos_id = getattr(tokenizer, "bos_token_id", None)
+    if bos_id is None or not tokenizer.bos_token:
+        return False
+    ids = tokenizer("a")["input_ids"]
+    return bool(ids) and ids[0] == bos_id
+
+
+def format_dataset(dataset, template, tokenizer=None, num_proc=1, log=None):
+    """按模板生成只有 "text" 列的数据集"""
+    if template == "text":
+        return dataset
+    if template == "alpaca":
+        function = _format_alpaca
+        fn_kwargs = {"eos_token": getattr(tokenizer, "eos_token", None) or ""}
+    elif template == "chat":
+        if tokenizer is None:
+            raise ValueError("对话模板需要tokenizer")
+        ensure_chat_template(tokenizer, log)
+        function = _format_chat
+        fn_kwargs = {"tokenizer": tokenizer, "strip_bos": _adds_bos(tokenizer)}
+    else:
+        raise ValueError(f"未知的数据模板: {template}")
+    return dataset.map(
+        function,
+        batched=True,
+        batch_size=FORMAT_BATCH_SIZE,
+        num_proc=num_proc if num_proc and num_proc > 1 else None,
+        remove_columns=dataset.column_names,
+        fn_kwargs=fn_kwargs,
+        desc="格式化",
+    )
@@ -0,0 +1,592 @@
+"""训练任务队列: SQLite持久化 + 本地HTTP接口 + 按并发上限调度
+
+每个任务是一份与导出的training_config.json格式相同的配置，调度器用
+python -m train_engine --config <任务配置> 在子进程中运行，输出写入任务目录下的output.log。
+调度器退出或崩溃后重新启动时，仍标记为运行中的任务会重新排队，
+开启auto_resume(默认)时从属于该配置的最新检查点继续。
+
+用法:
+    python -m job_queue serve --root ./jobs --port 8765 --concurrency 1
+    python -m job_queue serve --gpus 0,1            # 每块GPU同时运行一个任务
+    python -m job_queue submit training_config.json --name 夜间任务 --set epochs=1
+    python -m job_queue list
+    python -m job_queue cancel 3
+    python -m job_queue tail 3 --follow
+
+HTTP接口(JSON):
+    POST /jobs                 {"config": {...}, "name": "...", "priority": 0}，返回 {"id": ...}
+    GET  /jobs[?status=queued] 任务列表，按提交顺序
+    GET  /jobs/<id>            任务详情，含配置和训练结果
+    POST /jobs/<id>/cancel     排队中的任务直接取消；运行中的任务在当前step结束后停止
+    GET  /jobs/<id>/log?offset=N  从第N字节开始的日志，返回 {"text": ..., "offset": 下次的起点}
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sqlite3
+import sys
+import time
+from urllib.parse import parse_qs, urlsplit
+
+from train_engine import DEFAULT_CONFIG, normalize_config, parse_overrides
+
+DEFAULT_PORT = 8765
+STATUSES = ("queued", "running", "succeeded", "failed", "cancelled")
+# 取消运行中的任务时，等待其在step边界停止的秒数，超时后强制结束
+CANCEL_GRACE_SECONDS = 300
+# 重新排队前发给训练进程的信号: 训练引擎在当前step结束后保存完整检查点再退出(暂停)，
+# 重新运行时从该检查点继续；SIGTERM只用于取消，训练停止但不保存检查点
+REQUEUE_SIGNAL = getattr(signal, "SIGUSR1", signal.SIGTERM)
+# 请求体上限
+MAX_BODY_BYTES = 1 << 20
+# 每次读取日志的最大字节数
+MAX_LOG_CHUNK = 1 << 20
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    config TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    pid INTEGER,
+    gpu TEXT,
+    exit_code INTEGER,
+    result TEXT,
+    error TEXT,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0
+)
+"""
+
+
+def _pid_alive(pid):
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        return True
+    return True
+
+
+class JobStore:
+    """任务表的读写，所有方法都在调度器的事件循环线程中调用"""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.db = sqlite3.connect(path, isolation_level=None)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(_SCHEMA)
+
+    def add(self, name, config, priority=0):
+        cursor = self.db.execute(
+            "INSERT INTO jobs (name, config, priority, status, created_at) VALUES (?, ?, ?, 'queued', ?)",
+            (name, json.dumps(config, ensure_ascii=False), priority, time.time()),
+        )
+        return cursor.lastrowid
+
+    def get(self, job_id):
+        row = self.db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row is not None else None
+
+    def list(self, status=None):
+        if status:
+            rows = self.db.execute("SELECT * FROM jobs WHERE status = ? ORDER BY id", (status,))
+        else:
+            rows = self.db.execute("SELECT * FROM jobs ORDER BY id")
+        return [self._to_dict(row, with_config=False) for row in rows]
+
+    def next_queued(self, exclude_save_paths):
+        """优先级高的先运行，同优先级按提交顺序；跳过与运行中任务保存路径相同的任务"""
+        for row in self.db.execute("SELECT * FROM jobs WHERE status = 'queued' ORDER BY priority DESC, id"):
+            job = self._to_dict(row)
+            if _save_path(job["config"]) not in exclude_save_paths:
+                return job
+        return None
+
+    def update(self, job_id, **fields):
+        columns = ", ".join(f"{key} = ?" for key in fields)
+        self.db.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+    def recover(self, log=None):
+        """把上次调度器退出时仍在运行的任务重新排队，返回仍存活的遗留子进程pid
+
+        已请求取消的遗留进程收到SIGTERM直接停止，其余收到REQUEUE_SIGNAL保存检查点后退出
+        """
+        log = log or (lambda message: None)
+        orphans = []
+        for row in self.db.execute("SELECT id, pid, cancel_requested FROM jobs WHERE status = 'running'").fetchall():
+            if _pid_alive(row["pid"]):
+                try:
+                    os.kill(row["pid"], signal.SIGTERM if row["cancel_requested"] else REQUEUE_SIGNAL)
+                    orphans.append(row["pid"])
+                except OSError:
+                    pass
+            if row["cancel_requested"]:
+                self.update(row["id"], status="cancelled", finished_at=time.time(), pid=None)
+            else:
+                self.update(row["id"], status="queued", pid=None, gpu=None)
+                log(f"任务 {row['id']} 在调度器退出时仍在运行，已重新排队\n")
+        return orphans
+
+    @staticmethod
+    def _to_dict(row, with_config=True):
+        job = dict(row)
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        if with_config:
+            job["config"] = json.loads(job["config"])
+        else:
+            config = json.loads(job.pop("config"))
+            job["base_model"] = config.get("base_model")
+            job["save_path"] = _save_path(config)
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+
+def _save_path(config):
+    return os.path.abspath(config.get("save_path") or DEFAULT_CONFIG["save_path"])
+
+
+# 按调度器的工作目录展开为绝对路径，训练子进程的工作目录不同
+PATH_KEYS = ("data_path", "save_path", "local_model_dir", "cache_dir")
+
+
+def validate_job_config(config):
+    """检查配置能否通过训练引擎的校验，返回路径已展开的配置"""
+    if not isinstance(config, dict):
+        raise ValueError("config必须是JSON对象")
+    unknown = sorted(set(config) - set(DEFAULT_CONFIG))
+    if unknown:
+        raise ValueError(f"未知的配置项: {', '.join(unknown)}")
+    config = dict(config)
+    config.setdefault("save_path", DEFAULT_CONFIG["save_path"])
+    for key in PATH_KEYS:
+        if config.get(key):
+            config[key] = os.path.abspath(config[key])
+    normalize_config(config)
+    return config
+
+
+class JobQueue:
+    """调度器和HTTP接口
+
+    concurrency: 同时运行的任务数；gpus给出时每个任务独占一块GPU(设置CUDA_VISIBLE_DEVICES)，
+    并发数不超过GPU数量
+    """
+
+    def __init__(self, root, concurrency=1, gpus=None, python=None, log=None):
+        self.root = os.path.abspath(root)
+        self.gpus = list(gpus or [])
+        self.concurrency = max(1, min(concurrency, len(self.gpus)) if self.gpus else concurrency)
+        self.python = python or sys.executable
+        self.log = log or (lambda message: None)
+        self.store = JobStore(os.path.join(self.root, "jobs.db"))
+        self.running = {}  # 任务id -> asyncio.subprocess.Process
+        self._wakeup = None
+        self._stopping = False
+
+    def job_dir(self, job_id):
+        return os.path.join(self.root, str(job_id))
+
+    def log_path(self, job_id):
+        return os.path.join(self.job_dir(job_id), "output.log")
+
+    # 任务操作
+
+    def submit(self, config, name=None, priority=0):
+        config = validate_job_config(config)
+        job_id = self.store.add(name or os.path.basename(config.get("data_path", "")) or "job", config, int(priority))
+        self.log(f"已提交任务 {job_id}\n")
+        self._wake()
+        return job_id
+
+    def cancel(self, job_id):
+        """返回取消后的任务，任务不存在时返回None"""
+        job = self.store.get(job_id)
+        if job is None:
+            return None
+        if job["status"] == "queued":
+            self.store.update(job_id, status="cancelled", finished_at=time.time())
+        elif job["status"] == "running":
+            self.store.update(job_id, cancel_requested=1)
+            process = self.running.get(job_id)
+            if process is not None:
+                self._terminate(job_id, process)
+        return self.store.get(job_id)
+
+    def read_log(self, job_id, offset=0):
+        path = self.log_path(job_id)
+        if not os.path.exists(path):
+            return "", 0
+        with open(path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            offset = min(max(offset, 0), size)
+            f.seek(offset)
+            data = f.read(MAX_LOG_CHUNK)
+        # 不在多字节字符中间截断
+        text = data.decode('utf-8', errors='ignore') if len(data) < MAX_LOG_CHUNK else \
+            data[:len(data) - _incomplete_tail(data)].decode('utf-8', errors='replace')
+        return text, offset + len(text.encode('utf-8'))
+
+    # 调度
+
+    def _wake(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _free_gpu(self):
+        used = {job["gpu"] for job in (self.store.get(job_id) for job_id in self.running) if job}
+        for gpu in self.gpus:
+            if gpu not in used:
+                return gpu
+        return None
+
+    async def schedule(self):
+        self._wakeup = asyncio.Event()
+        orphans = self.store.recover(self.log)
+        if orphans:
+            # 遗留进程在当前step结束时退出(重新排队的任务会先保存检查点)，
+            # 等它退出后再重新运行，避免两个进程同时写同一个保存目录
+            self.log(f"等待 {len(orphans)} 个遗留训练进程停止\n")
+            deadline = time.monotonic() + CANCEL_GRACE_SECONDS
+            while any(_pid_alive(pid) for pid in orphans) and time.monotonic() < deadline:
+                await asyncio.sleep(1)
+            for pid in orphans:
+                if _pid_alive(pid):
+                    try:
+                        os.kill(pid, signal.SIGKILL)
+                    except OSError:
+                        pass
+        while not self._stopping:
+            while len(self.running) < self.concurrency:
+                busy = {_save_path(self.store.get(job_id)["config"]) for job_id in self.running}
+                job = self.store.next_queued(busy)
+                if job is None:
+                    break
+                await self._start(job)
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=5)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _start(self, job):
+        job_id = job["id"]
+        directory = self.job_dir(job_id)
+        os.makedirs(directory, exist_ok=True)
+        config_path = os.path.join(directory, "config.json")
+        with open(config_path, 'w', encoding='utf-8') as f:
+            json.dump(job["config"], f, indent=2, ensure_ascii=False)
+
+        env = dict(os.environ, PYTHONUNBUFFERED="1")
+        gpu = self._free_gpu() if self.gpus else None
+        if gpu is not None:
+            env["CUDA_VISIBLE_DEVICES"] = gpu
+        with open(self.log_path(job_id), 'ab') as output:
+            process = await asyncio.create_subprocess_exec(
+                self.python, "-m", "train_engine", "--config", config_path,
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+                stdout=output, stderr=asyncio.subprocess.STDOUT, env=env,
+                # 独立会话: 终端的Ctrl+C只发给调度器，由调度器决定向训练进程发送什么信号
+                start_new_session=True,
+            )
+        self.running[job_id] = process
+        self.store.update(job_id, status="running", started_at=time.time(), finished_at=None, pid=process.pid,
+                          gpu=gpu, exit_code=None, error=None, attempts=job["attempts"] + 1)
+        self.log(f"任务 {job_id} 开始运行 (pid {process.pid}{f', GPU {gpu}' if gpu is not None else ''})\n")
+        asyncio.ensure_future(self._watch(job_id, process))
+
+    async def _watch(self, job_id, process):
+        exit_code = await process.wait()
+        self.running.pop(job_id, None)
+        job = self.store.get(job_id)
+        result = _last_json_line(self.log_path(job_id))
+        if job["cancel_requested"]:
+            status = "cancelled"
+        elif exit_code == 0 and result is not None and result.get("status") == "completed":
+            status = "succeeded"
+        elif exit_code == 0 and result is not None and result.get("status") == "paused":
+            # 调度器退出时暂停的任务，重新排队后从暂停时的检查点继续
+            status = "queued"
+        else:
+            status = "failed"
+        error = None if status != "failed" else f"退出码 {exit_code}，详见 {self.log_path(job_id)}"
+        self.store.update(job_id, status=status, finished_at=None if status == "queued" else time.time(),
+                          pid=None, gpu=None, exit_code=exit_code,
+                          result=json.dumps(result, ensure_ascii=False) if result is not None else None, error=error)
+        self.log(f"任务 {job_id} 结束: {status} (退出码 {exit_code})\n")
+        self._wake()
+
+    def _terminate(self, job_id, process):
+        """先发SIGTERM让训练在step边界停止，超时后强制结束"""
+        try:
+            process.terminate()
+        except ProcessLookupError:
+            return
+
+        async def kill_later():
+            try:
+                await asyncio.wait_for(process.wait(), timeout=CANCEL_GRACE_SECONDS)
+            except asyncio.TimeoutError:
+                self.log(f"任务 {job_id} 未在 {CANCEL_GRACE_SECONDS} 秒内停止，强制结束\n")
+                process.kill()
+        asyncio.ensure_future(kill_later())
+
+    # HTTP
+
+    async def handle(self, reader, writer):
+        try:
+            status, body = await self._dispatch(reader)
+        except ValueError as e:
+            status, body = 400, {"error": str(e)}
+        except Exception as e:
+            status, body = 500, {"error": str(e)}
+        payload = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        reasons = {200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+                   409: "Conflict", 413: "Payload Too Large", 500: "Internal Server Error"}
+        writer.write(
+            f"HTTP/1.1 {status} {reasons.get(status, '')}\r\nContent-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode('latin-1') + payload
+        )
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def _dispatch(self, reader):
+        request_line = (await reader.readline()).decode('latin-1').strip()
+        if not request_line:
+            raise ValueError("空请求")
+        method, target = request_line.split(" ")[:2]
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode('latin-1')
+            if line in ("\r\n", "\n", ""):
+                break
+            key, _, value = line.partition(":")
+            headers[key.strip().lower()] = value.strip()
+        length = int(headers.get("content-length", 0) or 0)
+        if length > MAX_BODY_BYTES:
+            return 413, {"error": "请求体过大"}
+        body = await reader.readexactly(length) if length else b""
+
+        url = urlsplit(target)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        parts = [part for part in url.path.split("/") if part]
+        if not parts or parts[0] != "jobs":
+            return 404, {"error": "未知的路径"}
+        if len(parts) == 1:
+            if method == "GET":
+                status = query.get("status")
+                if status and status not in STATUSES:
+                    raise ValueError(f"status必须是 {', '.join(STATUSES)} 之一")
+                return 200, {"jobs": self.store.list(status)}
+            if method == "POST":
+                try:
+                    request = json.loads(body.decode('utf-8') or "{}")
+                except json.JSONDecodeError as e:
+                    raise ValueError(f"请求体不是有效的JSON: {e}")
+                if not isinstance(request, dict):
+                    raise ValueError("请求体必须是JSON对象")
+                # 也接受直接提交配置本身
+                if "config" in request:
+                    config = request["config"]
+                else:
+                    config, request = request, {}
+                job_id = self.submit(config, request.get("name"), request.get("priority", 0))
+                return 201, {"id": job_id}
+            return 405, {"error": "不支持的方法"}
+
+        try:
+            job_id = int(parts[1])
+        except ValueError:
+            return 404, {"error": "未知的任务"}
+        if self.store.get(job_id) is None:
+            return 404, {"error": f"任务 {job_id} 不存在"}
+        if len(parts) == 2 and method == "GET":
+            return 200, self.store.get(job_id)
+        if len(parts) == 3 and parts[2] == "cancel" and method == "POST":
+            job = self.cancel(job_id)
+            if job["status"] in ("succeeded", "failed"):
+                return 409, {"error": f"任务已结束: {job['status']}", "job": job}
+            return 200, job
+        if len(parts) == 3 and parts[2] == "log" and method == "GET":
+            text, offset = self.read_log(job_id, int(query.get("offset", 0)))
+            return 200, {"text": text, "offset": offset, "status": self.store.get(job_id)["status"]}
+        return 404, {"error": "未知的路径"}
+
+    async def serve(self, host="127.0.0.1", port=DEFAULT_PORT):
+        server = await asyncio.start_server(self.handle, host, port)
+        self.log(f"任务队列: http://{host}:{port}/jobs，数据目录 {self.root}，并发 {self.concurrency}\n")
+        scheduler = asyncio.ensure_future(self.schedule())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self._stopping = True
+            scheduler.cancel()
+            # 运行中的任务保存检查点后退出，数据库中保持为running，下次启动时重新排队并从检查点继续
+            await self._shutdown_running()
+
+    async def _shutdown_running(self):
+        """向运行中的任务发送REQUEUE_SIGNAL并等待退出，超时后强制结束"""
+        processes = dict(self.running)
+        for process in processes.values():
+            try:
+                process.send_signal(REQUEUE_SIGNAL)
+            except ProcessLookupError:
+                pass
+        if not processes:
+            return
+        self.log(f"等待 {len(processes)} 个训练任务保存检查点并退出\n")
+        waits = [asyncio.ensure_future(process.wait()) for process in processes.values()]
+        await asyncio.wait(waits, timeout=CANCEL_GRACE_SECONDS)
+        for job_id, process in processes.items():
+            if process.returncode is None:
+                self.log(f"任务 {job_id} 未在 {CANCEL_GRACE_SECONDS} 秒内停止，强制结束\n")
+                process.kill()
+                await process.wait()
+
+
+def _incomplete_tail(data):
+    """data末尾不完整的UTF-8字符的字节数"""
+    for back in range(1, min(4, len(data)) + 1):
+        byte = data[-back]
+        if byte & 0xC0 != 0x80:
+            expected = 2 if byte >= 0xC0 else 1
+            expected = 3 if byte >= 0xE0 else expected
+            expected = 4 if byte >= 0xF0 else expected
+            return back if expected > back else 0
+    return 0
+
+
+def _last_json_line(path, tail_bytes=65536):
+    """训练引擎结束时在最后一行输出结果JSON"""
+    try:
+        with open(path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - tail_bytes))
+            lines = f.read().decode('utf-8', errors='replace').splitlines()
+    except OSError:
+        return None
+    for line in reversed(lines):
+        line = line.strip()
+        if line.startswith("{") and line.endswith("}"):
+            try:
+                return json.loads(line)
+            except json.JSONDecodeError:
+                return None
+        if line:
+            return None
+    return None
+
+
+# 命令行客户端
+
+def _request(url, method="GET", body=None):
+    from urllib.error import HTTPError, URLError
+    from urllib.request import Request, urlopen
+
+    data = json.dumps(body, ensure_ascii=False).encode('utf-8') if body is not None else None
+    request = Request(url, data=data, method=method, headers={"Content-Type": "application/json"})
+    try:
+        with urlopen(request, timeout=30) as response:
+            return json.loads(response.read().decode('utf-8'))
+    except HTTPError as e:
+        message = json.loads(e.read().decode('utf-8') or "{}").get("error", str(e))
+        raise SystemExit(f"请求失败({e.code}): {message}")
+    except URLError as e:
+        raise SystemExit(f"无法连接任务队列 {url}: {e.reason}")
+
+
+def _print_jobs(jobs):
+    for job in jobs:
+        started = time.strftime("%m-%d %H:%M", time.localtime(job["started_at"])) if job["started_at"] else "-"
+        print(f"{job['id']:>5}  {job['status']:<10} {started:<12} {job['name']}  {job['base_model']}  {job['save_path']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m job_queue", description="训练任务队列")
+    parser.add_argument("--url", default=f"http://127.0.0.1:{DEFAULT_PORT}", help="客户端命令使用的队列地址")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve = commands.add_parser("serve", help="启动调度器和HTTP接口")
+    serve.add_argument("--root", default="./jobs", help="任务数据库和日志目录")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=DEFAULT_PORT)
+    serve.add_argument("--concurrency", type=int, default=1, help="同时运行的任务数")
+    serve.add_argument("--gpus", help="逗号分隔的GPU编号，每个任务独占一块")
+
+    submit = commands.add_parser("submit", help="提交任务")
+    submit.add_argument("config", help="配置文件(与GUI导出的training_config.json格式相同)")
+    submit.add_argument("--name")
+    submit.add_argument("--priority", type=int, default=0, help="数值大的先运行")
+    submit.add_argument("--set", action="append", metavar="KEY=VALUE", help="覆盖配置项，可重复使用")
+
+    listing = commands.add_parser("list", help="列出任务")
+    listing.add_argument("--status", choices=STATUSES)
+
+    cancel = commands.add_parser("cancel", help="取消任务")
+    cancel.add_argument("id", type=int)
+
+    tail = commands.add_parser("tail", help="查看任务日志")
+    tail.add_argument("id", type=int)
+    tail.add_argument("--follow", "-f", action="store_true", help="持续输出直到任务结束")
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        def log(message):
+            sys.stdout.write(message)
+            sys.stdout.flush()
+
+        gpus = [gpu.strip() for gpu in args.gpus.split(",") if gpu.strip()] if args.gpus else None
+        queue = JobQueue(args.root, concurrency=args.concurrency, gpus=gpus, log=log)
+        try:
+            asyncio.run(queue.serve(args.host, args.port))
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    base = args.url.rstrip("/")
+    if args.command == "submit":
+        with open(args.config, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        config.update(parse_overrides(args.set))
+        # 调度器的工作目录可能不同，相对路径按当前目录展开
+        for key in PATH_KEYS:
+            if config.get(key):
+                config[key] = os.path.abspath(config[key])
+        result = _request(f"{base}/jobs", "POST", {"config": config, "name": args.name, "priority": args.priority})
+        print(f"已提交任务 {result['id']}")
+    elif args.command == "list":
+        _print_jobs(_request(f"{base}/jobs" + (f"?status={args.status}" if args.status else ""))["jobs"])
+    elif args.command == "cancel":
+        job = _request(f"{base}/jobs/{args.id}/cancel", "POST", {})
+        print(f"任务 {job['id']}: {job['status']}{'(等待停止)' if job['cancel_requested'] and job['status'] == 'running' else ''}")
+    elif args.command == "tail":
+        offset = 0
+        while True:
+            chunk = _request(f"{base}/jobs/{args.id}/log?offset={offset}")
+            sys.stdout.write(chunk["text"])
+            sys.stdout.flush()
+            offset = chunk["offset"]
+            if not args.follow or (chunk["status"] not in ("queued", "running") and not chunk["text"]):
+                break
+            if not chunk["text"]:
+                time.sleep(1)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+"""按长度分组、按token预算组批的批采样器
+
+不打包时SFTTrainer把每个批次padding到批内最长的样本，长短混合的对话数据中大量计算花在padding上。
+TokenBudgetBatchSampler 把长度相近的样本放进同一批，每批的 样本数 * 批内最长长度 不超过token预算，
+短样本的批次因此包含更多样本:
+    shuffle=True   每个epoch先随机打乱，再把样本分成若干桶，桶内按长度排序后组批，最后打乱批次顺序
+    shuffle=False  全部样本按长度排序组批，padding最少，批次顺序固定(最长的批次在前)
+"""
+import numpy as np
+
+# 每个桶大约包含的批次数，越大padding越少，随机性越低
+BATCHES_PER_BUCKET = 50
+
+
+def sequence_lengths(dataset, column="input_ids"):
+    """各样本的token数；Arrow数据集直接读取列表长度，不把token解码为Python对象"""
+    try:
+        import pyarrow.compute as pc
+
+        column_data = dataset.with_format("arrow")[column]
+        return pc.list_value_length(column_data).to_numpy(zero_copy_only=False).astype(np.int64)
+    except (ImportError, AttributeError, KeyError, TypeError):
+        return np.array([len(ids) for ids in dataset[column]], dtype=np.int64)
+
+
+def padding_efficiency(lengths, batches):
+    """真实token数 / padding后的token数"""
+    lengths = np.asarray(lengths)
+    real = padded = 0
+    for batch in batches:
+        batch_lengths = lengths[batch]
+        real += int(batch_lengths.sum())
+        padded += int(batch_lengths.max()) * len(batch)
+    return real / padded if padded else 1.0
+
+
+def random_batches(num_samples, batch_size, seed=0):
+    """固定batch_size的随机批次，与默认的RandomSampler相同，用于对比padding效率"""
+    order = np.random.default_rng(seed).permutation(num_samples)
+    return [order[i:i + batch_size] for i in range(0, num_samples, batch_size)]
+
+
+class TokenBudgetBatchSampler:
+    """按token预算组批的批采样器，用作DataLoader的batch_sampler"""
+
+    def __init__(self, lengths, max_tokens, shuffle=True, seed=0, bucket_size=None):
+        self.lengths = np.asarray(lengths, dtype=np.int64)
+        self.max_tokens = int(max_tokens)
+        self.shuffle = shuffle
+        self.seed = seed
+        if bucket_size is None:
+            mean_length = max(float(self.lengths.mean()) if len(self.lengths) else 1.0, 1.0)
+            bucket_size = int(self.max_tokens / mean_length * BATCHES_PER_BUCKET)
+        self.bucket_size = max(1, bucket_size)
+        self.epoch = 0
+        self._cache = None  # (epoch, 批次列表)
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def _fill(self, indices, batches):
+        """indices已按长度降序排列，贪心地装入批次；批内最长的总是第一个样本"""
+        batch = []
+        longest = 0
+        for index, length in zip(indices.tolist(), self.lengths[indices].tolist()):
+            if batch and (len(batch) + 1) * longest > self.max_tokens:
+                batches.append(batch)
+                batch = []
+            if not batch:
+                longest = length
+            batch.append(index)
+        if batch:
+            batches.append(batch)
+
+    def batches(self):
+        """当前epoch的批次列表"""
+        if self._cache is not None and self._cache[0] == self.epoch:
+            return self._cache[1]
+        batches = []
+        if self.shuffle:
+            rng = np.random.default_rng(self.seed + self.epoch)
+            order = rng.permutation(len(self.lengths))
+            for start in range(0, len(order), self.bucket_size):
+                bucket = order[start:start + self.bucket_size]
+                self._fill(bucket[np.argsort(-self.lengths[bucket], kind="stable")], batches)
+            rng.shuffle(batches)
+        else:
+            self._fill(np.argsort(-self.lengths, kind="stable"), batches)
+        self._cache = (self.epoch, batches)
+        return batches
+
+    def __iter__(self):
+        return iter(self.batches())
+
+    def __len__(self):
+        return len(self.batches())
+
+
+def use_token_budget_batches(trainer, max_tokens, shuffle=True, seed=0, log=None):
+    """让trainer的训练数据按token预算组批，并记录padding效率"""
+    from torch.utils.data import DataLoader
+
+    log = log or (lambda message: None)
+    lengths = sequence_lengths(trainer.train_dataset)
+    sampler = TokenBudgetBatchSampler(lengths, max_tokens, shuffle=shuffle, seed=seed)
+
+    batches = sampler.batches()
+    efficiency = padding_efficiency(lengths, batches)
+    baseline = padding_efficiency(lengths, random_batches(len(lengths), trainer.args.per_device_train_batch_size))
+    log(f"按长度分组: token预算 {max_tokens}, {len(batches)} 个批次, 平均每批 {len(lengths) / max(len(batches), 1):.1f} 条, "
+        f"padding效率 {efficiency:.1%} (固定batch_size {trainer.args.per_device_train_batch_size} 时 {baseline:.1%})\n")
+    trainer.padding_efficiency = efficiency
+
+    def get_train_dataloader():
+        args = trainer.args
+        dataloader = DataLoader(
+            trainer.train_dataset,
+            batch_sampler=sampler,
+            collate_fn=trainer.data_collator,
+            num_workers=args.dataloader_num_workers,
+            pin_memory=args.dataloader_pin_memory,
+        )
+        return trainer.accelerator.prepare(dataloader)
+
+    trainer.get_train_dataloader = get_train_dataloader
+    return sampler
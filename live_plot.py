@@ -0,0 +1,169 @@
+"""训练曲线的增量绘制：固定点数的最小/最大值降采样 + 限速的blit重绘
+
+append可在训练线程中调用，refresh必须在Tk主线程中调用。
+"""
+import threading
+import time
+
+
+class MinMaxDownsampler:
+    """流式最小/最大值降采样，内存和输出点数都不随历史长度增长
+
+    每个桶保存其中y最小和最大的两个点；桶数超过上限时相邻两桶合并，
+    桶宽度翻倍，因此追加是均摊O(1)，输出最多2*max_buckets个点。
+    """
+
+    def __init__(self, max_buckets=1000):
+        self.max_buckets = max_buckets
+        self.bucket_width = 1
+        self.buckets = []  # [count, (x, y)最小点, (x, y)最大点]
+        self.count = 0
+        self.x_range = None
+        self.y_range = None
+
+    def append(self, x, y):
+        self.count += 1
+        point = (x, y)
+        if self.x_range is None:
+            self.x_range = [x, x]
+            self.y_range = [y, y]
+        else:
+            self.x_range[1] = max(self.x_range[1], x)
+            self.y_range[0] = min(self.y_range[0], y)
+            self.y_range[1] = max(self.y_range[1], y)
+
+        if self.buckets and self.buckets[-1][0] < self.bucket_width:
+            bucket = self.buckets[-1]
+            bucket[0] += 1
+            if y < bucket[1][1]:
+                bucket[1] = point
+            if y > bucket[2][1]:
+                bucket[2] = point
+            return
+        self.buckets.append([1, point, point])
+        if len(self.buckets) > self.max_buckets:
+            self._merge()
+
+    def _merge(self):
+        merged = []
+        for i in range(0, len(self.buckets), 2):
+            pair = self.buckets[i:i + 2]
+            lo = min((b[1] for b in pair), key=lambda p: p[1])
+            hi = max((b[2] for b in pair), key=lambda p: p[1])
+            merged.append([sum(b[0] for b in pair), lo, hi])
+        self.buckets = merged
+        self.bucket_width *= 2
+
+    def points(self):
+        """按x顺序返回降采样后的 (xs, ys)"""
+        xs = []
+        ys = []
+        for _, lo, hi in self.buckets:
+            for x, y in ((lo, hi) if lo[0] <= hi[0] else (hi, lo)):
+                if xs and xs[-1] == x:
+                    continue
+                xs.append(x)
+                ys.append(y)
+        return xs, ys
+
+
+class LivePlot:
+    """在已有坐标轴上增量更新曲线
+
+    坐标轴范围按倍数扩展，只有范围变化时才整体重绘，其余时候只blit曲线本身。
+    """
+
+    def __init__(self, canvas, axes, max_points=2000, min_interval=0.25):
+        self.canvas = canvas
+        self.axes = list(axes)
+        self.min_interval = min_interval
+        self.lines = []
+        self.samplers = []
+        for ax in self.axes:
+            line, = ax.plot([], [], animated=True)
+            self.lines.append(line)
+            self.samplers.append(MinMaxDownsampler(max_buckets=max_points // 2))
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._last_refresh = 0.0
+        self._backgrounds = None
+        self._scaled = [False] * len(self.axes)
+        canvas.mpl_connect("draw_event", self._on_draw)
+
+    def append(self, x, *values):
+        """追加一个数据点，每条曲线一个值，None表示该曲线无新值"""
+        with self._lock:
+            for sampler, value in zip(self.samplers, values):
+                if value is not None:
+                    sampler.append(x, value)
+            self._dirty = True
+
+    def reset(self):
+        with self._lock:
+            self.samplers = [MinMaxDownsampler(s.max_buckets) for s in self.samplers]
+            self._dirty = True
+        self._scaled = [False] * len(self.axes)
+        for line in self.lines:
+            line.set_data([], [])
+        self.canvas.draw_idle()
+
+    def _on_draw(self, event):
+        # 整体重绘后重新截取不含曲线的背景
+        self._backgrounds = [self.canvas.copy_from_bbox(ax.bbox) for ax in self.axes]
+        self._draw_lines()
+
+    def _draw_lines(self):
+        for ax, line in zip(self.axes, self.lines):
+            ax.draw_artist(line)
+
+    def _expand_limits(self, index):
+        """数据超出当前范围时扩展坐标轴，返回是否需要整体重绘"""
+        ax = self.axes[index]
+        sampler = self.samplers[index]
+        if sampler.x_range is None:
+            return False
+        lo, hi = sampler.y_range
+        pad = (hi - lo) * 0.1 or abs(hi) * 0.1 or 1e-8
+        if not self._scaled[index]:
+            # 第一批数据直接按数据范围设置
+            self._scaled[index] = True
+            ax.set_xlim(sampler.x_range[0], max(sampler.x_range[1] * 2, 10))
+            ax.set_ylim(lo - pad, hi + pad)
+            return True
+
+        changed = False
+        x_lo, x_hi = ax.get_xlim()
+        if sampler.x_range[1] > x_hi:
+            ax.set_xlim(x_lo, sampler.x_range[1] * 2)
+            changed = True
+        y_lo, y_hi = ax.get_ylim()
+        if lo < y_lo or hi > y_hi:
+            ax.set_ylim(min(y_lo, lo - pad), max(y_hi, hi + pad))
+            changed = True
+        return changed
+
+    def refresh(self, force=False):
+        """有新数据且距上次刷新超过min_interval时重绘，返回是否进行了绘制"""
+        now = time.monotonic()
+        if not self._dirty or (not force and now - self._last_refresh < self.min_interval):
+            return False
+        with self._lock:
+            data = [sampler.points() for sampler in self.samplers]
+            self._dirty = False
+        self._last_refresh = now
+
+        full_redraw = self._backgrounds is None
+        for index, (line, (xs, ys)) in enumerate(zip(self.lines, data)):
+            line.set_data(xs, ys)
+            if self._expand_limits(index):
+                full_redraw = True
+
+        if full_redraw:
+            self.canvas.draw()
+        else:
+            for background in self._backgrounds:
+                self.canvas.restore_region(background)
+            self._draw_lines()
+            for ax in self.axes:
+                self.canvas.blit(ax.bbox)
+        return True
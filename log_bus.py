@@ -0,0 +1,157 @@
+"""线程安全的日志总线
+
+后台线程只向队列写入消息，Tk主线程通过after()定时批量取出并插入文本框；
+文本框只保留最近的若干行，完整日志写入每次训练独立的滚动日志文件。
+"""
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+
+class RotatingFileSink:
+    """后台线程批量写入的滚动日志文件，写入端只做入队"""
+
+    def __init__(self, path, max_bytes=10 * (1 << 20), backup_count=5):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._queue = queue.SimpleQueue()
+        self._file = open(path, 'a', encoding='utf-8')
+        self._thread = threading.Thread(target=self._run, name="log-file-sink", daemon=True)
+        self._thread.start()
+
+    def write(self, message):
+        self._queue.put((time.time(), message))
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        self._file.close()
+
+    def _rotate(self):
+        self._file.close()
+        for i in range(self.backup_count - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        self._file = open(self.path, 'w', encoding='utf-8')
+
+    def _run(self):
+        while True:
+            items = [self._queue.get()]
+            # 一次取出积压的全部消息，合并为一次写入
+            while True:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            closing = None in items
+            chunks = []
+            stamp_second = None
+            stamp = ""
+            for item in items:
+                if item is None:
+                    continue
+                created, message = item
+                second = int(created)
+                if second != stamp_second:
+                    stamp_second = second
+                    stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(second))
+                for line in message.rstrip("\n").split("\n"):
+                    chunks.append(f"{stamp} {line}\n")
+            if chunks:
+                self._file.write("".join(chunks))
+                self._file.flush()
+                if self._file.tell() >= self.max_bytes:
+                    self._rotate()
+            if closing:
+                return
+
+
+class LogBus:
+    """日志消息和界面回调的队列，写入端可在任意线程调用"""
+
+    def __init__(self, max_lines=5000, batch_size=1000, echo=None, use_queue=True):
+        self.max_lines = max_lines
+        self.batch_size = batch_size
+        self.echo = echo
+        # 无界面运行时没有消费者，不入队以免队列无限增长
+        self.use_queue = use_queue
+        self.lines = deque(maxlen=max_lines)  # 最近的日志行，供界面或导出使用
+        self._queue = queue.SimpleQueue()
+        self._file_sink = None
+        self.run_log_path = None
+
+    def write(self, message):
+        """写入一条日志消息"""
+        if self.use_queue:
+            self._queue.put(("log", message))
+        sink = self._file_sink
+        if sink is not None:
+            sink.write(message)
+        if self.echo is not None:
+            self.echo.write(message)
+            self.echo.flush()
+
+    def post(self, callback, *args):
+        """请求在Tk主线程中执行callback(*args)"""
+        self._queue.put(("call", (callback, args)))
+
+    def open_run_log(self, directory, max_bytes=10 * (1 << 20), backup_count=5):
+        """为本次训练打开滚动日志文件，返回文件路径"""
+        self.close_run_log()
+        log_dir = os.path.join(directory, "logs")
+        os.makedirs(log_dir, exist_ok=True)
+        path = os.path.join(log_dir, time.strftime("run-%Y%m%d-%H%M%S.log"))
+        self._file_sink = RotatingFileSink(path, max_bytes=max_bytes, backup_count=backup_count)
+        self.run_log_path = path
+        return path
+
+    def close_run_log(self):
+        sink, self._file_sink = self._file_sink, None
+        if sink is not None:
+            sink.close()
+
+    def drain(self, limit=None):
+        """取出最多limit条待处理项，返回 (日志文本, 回调列表)"""
+        limit = limit or self.batch_size
+        messages = []
+        calls = []
+        for _ in range(limit):
+            try:
+                kind, item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "log":
+                messages.append(item)
+            else:
+                calls.append(item)
+        text = "".join(messages)
+        if text:
+            self.lines.extend(text.splitlines())
+        return text, calls
+
+    def attach(self, root, text_widget, interval=100):
+        """在Tk主线程中定时把队列内容刷新到文本框"""
+        def pump():
+            try:
+                text, calls = self.drain()
+                if text:
+                    # 用户向上翻看时不强制滚动到底部
+                    at_bottom = text_widget.yview()[1] >= 0.999
+                    text_widget.insert("end", text)
+                    line_count = int(text_widget.index("end-1c").split(".")[0])
+                    if line_count > self.max_lines:
+                        text_widget.delete("1.0", f"{line_count - self.max_lines + 1}.0")
+                    if at_bottom:
+                        text_widget.see("end")
+                for callback, args in calls:
+                    callback(*args)
+            finally:
+                root.after(interval, pump)
+
+        root.after(interval, pump)
@@ -0,0 +1,265 @@
+"""参数量统计和训练显存估算
+
+参数量和dtype来自safetensors文件头(8字节长度 + JSON)，不读取张量数据；
+Hub上的模型用HTTP Range请求只取文件头。显存估算按训练方式分项:
+    权重       量化的线性层按4/8-bit计，其余按fp16/fp32
+    LoRA       可训练参数(fp32)、梯度和优化器状态
+    激活       开启梯度检查点时每层只保存输入，另加一层重算时的完整激活
+    logits     batch * 长度 * 词表大小，fp16输出加fp32的损失计算
+估算偏保守，用于在启动训练前发现明显放不下的配置。
+"""
+import json
+import os
+
+from export_engine import read_safetensors_header, safetensors_shards
+
+# 每个可训练参数的优化器状态字节数
+OPTIMIZER_STATE_BYTES = {
+    "adamw_8bit": 2, "paged_adamw_8bit": 2, "adamw_bnb_8bit": 2,
+    "adamw_torch": 8, "adamw_hf": 8, "adam": 8, "adamw_torch_fused": 8, "paged_adamw_32bit": 8,
+    "adafactor": 4, "sgd": 0,
+}
+# 4-bit NF4 每个参数0.5字节，另有每64个参数一个量化常数(二次量化后约1字节)
+_QUANT_BYTES = {"4bit": 0.5 + 1 / 64, "8bit": 1.0 + 4 / 4096}
+# CUDA上下文等固定开销
+RUNTIME_OVERHEAD = 768 * (1 << 20)
+# 分配器碎片等按总量的比例预留
+FRAGMENTATION = 0.1
+
+_hub_cache = {}
+
+
+def _read_json(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _local_model_dir(model_path):
+    """本地目录或HF缓存中已完整下载的模型目录，找不到时返回None"""
+    if os.path.isdir(model_path):
+        return model_path
+    try:
+        from huggingface_hub import snapshot_download
+        model_dir = snapshot_download(model_path, allow_patterns=["*.json"], local_files_only=True)
+        shards = safetensors_shards(model_dir)
+    except Exception:
+        return None
+    return model_dir if all(os.path.exists(shard) for shard in shards) else None
+
+
+def read_model_tensors(model_path, local_files_only=False, timeout=10):
+    """返回 ({张量名: (dtype, 形状)}, config.json内容)，只读取文件头
+
+    本地文件每次重新读取(只有几十KB)；Hub上的结果缓存在进程内，避免重复的网络请求。
+    """
+    model_dir = _local_model_dir(model_path)
+    if model_dir is not None:
+        tensors = {}
+        for shard in safetensors_shards(model_dir):
+            header, _ = read_safetensors_header(shard)
+            for name, info in header.items():
+                tensors[name] = (info["dtype"], tuple(info["shape"]))
+        return tensors, _read_json(os.path.join(model_dir, "config.json"))
+    if local_files_only:
+        raise FileNotFoundError(f"本地找不到模型 {model_path} 的safetensors文件")
+
+    if model_path not in _hub_cache:
+        from huggingface_hub import get_safetensors_metadata, hf_hub_download
+        metadata = get_safetensors_metadata(model_path, timeout=timeout)
+        tensors = {}
+        for file_metadata in metadata.files_metadata.values():
+            for name, info in file_metadata.tensors.items():
+                tensors[name] = (info.dtype, tuple(info.shape))
+        _hub_cache[model_path] = (tensors, _read_json(hf_hub_download(model_path, "config.json")))
+    return _hub_cache[model_path]
+
+
+def _is_quantized(tensors):
+    return any(name.endswith(".absmax") or ".quant_state." in name for name in tensors)
+
+
+def count_parameters(tensors):
+    """返回 (总参数量, {dtype: 参数量})；预量化的uint8权重每字节按两个4-bit参数计"""
+    quantized = _is_quantized(tensors)
+    total = 0
+    by_dtype = {}
+    for name, (dtype, shape) in tensors.items():
+        if quantized and (name.endswith((".absmax", ".quant_map", ".nested_absmax", ".nested_quant_map"))
+                          or ".quant_state." in name):
+            continue
+        count = 1
+        for dim in shape:
+            count *= dim
+        if quantized and dtype == "U8" and name.endswith(".weight"):
+            count *= 2
+            dtype = "NF4"
+        total += count
+        by_dtype[dtype] = by_dtype.get(dtype, 0) + count
+    return total, by_dtype
+
+
+def config_dimensions(config):
+    """从config.json取出估算所需的维度"""
+    config = config.get("text_config", config)
+    hidden = config["hidden_size"]
+    heads = config["num_attention_heads"]
+    kv_heads = config.get("num_key_value_heads") or heads
+    head_dim = config.get("head_dim") or hidden // heads
+    return {
+        "hidden": hidden,
+        "intermediate": config.get("intermediate_size") or 4 * hidden,
+        "layers": config["num_hidden_layers"],
+        "heads": heads,
+        "kv_heads": kv_heads,
+        "head_dim": head_dim,
+        "vocab": config["vocab_size"],
+        "tied": config.get("tie_word_embeddings", False),
+    }
+
+
+def estimate_params_from_config(config):
+    """没有权重文件时按Llama式结构(含GQA和门控MLP)估算参数量"""
+    d = config_dimensions(config)
+    q = d["hidden"] * d["heads"] * d["head_dim"]
+    kv = 2 * d["hidden"] * d["kv_heads"] * d["head_dim"]
+    o = d["heads"] * d["head_dim"] * d["hidden"]
+    mlp = 3 * d["hidden"] * d["intermediate"]
+    per_layer = q + kv + o + mlp + 2 * d["hidden"]
+    embed = d["vocab"] * d["hidden"]
+    return d["layers"] * per_layer + embed * (1 if d["tied"] else 2) + d["hidden"]
+
+
+def lora_shapes(tensors, config, target_modules):
+    """LoRA目标线性层的 (输出, 输入) 形状列表"""
+    shapes = []
+    for name, (dtype, shape) in tensors.items():
+        parts = name.split(".")
+        if len(parts) >= 2 and parts[-1] == "weight" and parts[-2] in target_modules and len(shape) == 2 \
+                and dtype != "U8":
+            shapes.append(shape)
+    if shapes or config is None:
+        return shapes
+    # 预量化权重的形状是打包后的，按config还原
+    d = config_dimensions(config)
+    q_out = d["heads"] * d["head_dim"]
+    kv_out = d["kv_heads"] * d["head_dim"]
+    per_layer = {
+        "q_proj": (q_out, d["hidden"]), "k_proj": (kv_out, d["hidden"]), "v_proj": (kv_out, d["hidden"]),
+        "o_proj": (d["hidden"], q_out), "gate_proj": (d["intermediate"], d["hidden"]),
+        "up_proj": (d["intermediate"], d["hidden"]), "down_proj": (d["hidden"], d["intermediate"]),
+    }
+    return [per_layer[m] for m in target_modules if m in per_layer] * d["layers"]
+
+
+def _linear_params(tensors, quantized):
+    """会被bitsandbytes量化的参数量(解码层中的二维权重)"""
+    total = 0
+    for name, (dtype, shape) in tensors.items():
+        if ".layers." in name and name.endswith(".weight") and (len(shape) == 2 or (quantized and dtype == "U8")):
+            count = 1
+            for dim in shape:
+                count *= dim
+            total += count * (2 if quantized and dtype == "U8" else 1)
+    return total
+
+
+def plan_training_memory(tensors, config, cfg, target_modules):
+    """估算训练所需的显存，返回各项字节数和总计
+
+    cfg为normalize_config之后的训练配置。
+    """
+    total_params, _ = count_parameters(tensors)
+    d = config_dimensions(config)
+    quantization = "4bit" if cfg["use_4bit"] else "8bit" if cfg["use_8bit"] else None
+    dense_bytes = 2 if (quantization or cfg["use_fp16"]) else 4
+
+    if quantization:
+        linear = _linear_params(tensors, _is_quantized(tensors))
+        weights = linear * _QUANT_BYTES[quantization] + (total_params - linear) * dense_bytes
+    else:
+        weights = total_params * dense_bytes
+
+    state_bytes = OPTIMIZER_STATE_BYTES.get(cfg["optimizer"], 8)
+    if cfg["use_lora"]:
+        rank = cfg["lora_rank"]
+        trainable = sum(rank * (out_features + in_features)
+                        for out_features, in_features in lora_shapes(tensors, config, target_modules))
+        # LoRA权重和梯度以fp32保存
+        adapter = trainable * 4
+        gradients = trainable * 4
+    else:
+        trainable = total_params
+        adapter = 0
+        gradients = trainable * dense_bytes
+    optimizer = trainable * state_bytes
+
+    tokens = cfg["batch_size"] * cfg["max_length"]
+    kv_dim = d["kv_heads"] * d["head_dim"]
+    layer_activations = tokens * (7 * d["hidden"] + 2 * kv_dim + 4 * d["intermediate"]) * 2
+    if cfg["use_lora"]:
+        # LoRA训练开启了梯度检查点
+        activations = d["layers"] * tokens * d["hidden"] * 2 + layer_activations
+    else:
+        activations = d["layers"] * layer_activations
+    logits = tokens * d["vocab"] * (2 + 4)
+
+    subtotal = weights + adapter + gradients + optimizer + activations + logits
+    overhead = RUNTIME_OVERHEAD + subtotal * FRAGMENTATION
+    return {
+        "params": total_params,
+        "trainable_params": trainable,
+        "weights": int(weights),
+        "adapter": int(adapter),
+        "gradients": int(gradients),
+        "optimizer": int(optimizer),
+        "activations": int(activations),
+        "logits": int(logits),
+        "overhead": int(overhead),
+        "total": int(subtotal + overhead),
+    }
+
+
+def available_memory():
+    """返回 (可用于训练的总字节数, 设备描述)，有GPU时为显存，否则为物理内存"""
+    try:
+        import torch
+        if torch.cuda.is_available():
+            props = torch.cuda.get_device_properties(0)
+            return props.total_memory, f"GPU {props.name}"
+    except ImportError:
+        pass
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES"), "内存"
+    except (ValueError, OSError, AttributeError):
+        return None, "未知设备"
+
+
+def format_bytes(n):
+    return f"{n / (1 << 30):.1f} GB"
+
+
+def format_params(params):
+    """参数量显示为 7.0B / 125.0M 形式，None显示为未知"""
+    if params is None:
+        return "未知"
+    if params >= 1e9:
+        return f"{params / 1e9:.1f}B"
+    if params >= 1e6:
+        return f"{params / 1e6:.1f}M"
+    return f"{params:,}"
+
+
+def format_plan(plan):
+    labels = (("weights", "模型权重"), ("adapter", "LoRA权重"), ("gradients", "梯度"), ("optimizer", "优化器状态"),
+              ("activations", "激活"), ("logits", "logits"), ("overhead", "运行时开销"))
+    parts = [f"{label} {format_bytes(plan[key])}" for key, label in labels if plan[key]]
+    return (f"参数量 {format_params(plan['params'])} (可训练 {format_params(plan['trainable_params'])}), "
+            f"预计显存 {format_bytes(plan['total'])}: " + ", ".join(parts))
+
+
+def check_training_memory(cfg, model_path, target_modules, local_files_only=False, timeout=10):
+    """返回 (估算结果, 可用字节数, 设备描述, 是否可能不足)"""
+    tensors, config = read_model_tensors(model_path, local_files_only=local_files_only, timeout=timeout)
+    plan = plan_training_memory(tensors, config, cfg, target_modules)
+    available, device = available_memory()
+    return plan, available, device, bool(available and plan["total"] > available)
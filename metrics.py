@@ -0,0 +1,209 @@
+"""训练指标导出: 每步写一行JSONL，并在本地HTTP端口以OpenMetrics格式提供最新值
+
+MetricsExporter 不依赖transformers，由train_callbacks.MetricsCallback在每个优化步结束时调用record()。
+HTTP端点为 http://<host>:<port>/metrics，标签 run(配置标识) 和 model 用于区分同时运行的多个训练。
+"""
+import json
+import math
+import os
+import threading
+import time
+
+METRIC_PREFIX = "finetune_"
+
+# (名称, 说明)；gauge为最近一步的值，counter为累计值
+_GAUGES = (
+    ("global_step", "当前优化步"),
+    ("epoch", "当前epoch(小数)"),
+    ("loss", "训练loss"),
+    ("learning_rate", "学习率"),
+    ("grad_norm", "梯度范数"),
+    ("tokens_per_second", "最近一步每秒训练的token数(labels不为-100)"),
+    ("samples_per_second", "最近一步每秒训练的序列数"),
+    ("step_duration_seconds", "最近一步的总耗时"),
+    ("step_data_wait_seconds", "最近一步等待数据的耗时"),
+    ("step_compute_seconds", "最近一步除等待数据外的耗时"),
+    ("host_memory_bytes", "进程常驻内存"),
+    ("host_memory_peak_bytes", "进程峰值常驻内存"),
+    ("device_memory_allocated_bytes", "GPU已分配显存"),
+    ("device_memory_peak_bytes", "GPU峰值已分配显存"),
+    ("device_memory_reserved_bytes", "GPU缓存分配器保留的显存"),
+    ("running", "训练是否在进行"),
+)
+_COUNTERS = (
+    ("steps", "累计优化步数"),
+    ("tokens", "累计训练token数"),
+    ("samples", "累计训练序列数"),
+    ("data_wait_seconds", "累计等待数据的秒数"),
+    ("compute_seconds", "累计计算的秒数"),
+)
+
+
+def host_memory():
+    """返回 (常驻内存, 峰值常驻内存) 字节数，无法获取时为None"""
+    rss = peak = None
+    try:
+        with open("/proc/self/status", 'r') as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    rss = int(line.split()[1]) * 1024
+                elif line.startswith("VmHWM:"):
+                    peak = int(line.split()[1]) * 1024
+    except OSError:
+        try:
+            import resource
+            import sys
+
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            # macOS以字节为单位，Linux以KB为单位
+            peak = peak if sys.platform == "darwin" else peak * 1024
+        except (ImportError, OSError):
+            pass
+    return rss, peak
+
+
+def device_memory():
+    """返回当前GPU的 {allocated, peak, reserved} 字节数，没有GPU时返回空字典"""
+    try:
+        import torch
+    except ImportError:
+        return {}
+    if not torch.cuda.is_available() or not torch.cuda.is_initialized():
+        return {}
+    return {
+        "device_memory_allocated_bytes": torch.cuda.memory_allocated(),
+        "device_memory_peak_bytes": torch.cuda.max_memory_allocated(),
+        "device_memory_reserved_bytes": torch.cuda.memory_reserved(),
+    }
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _number(value):
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, float) and math.isnan(value):
+        return "NaN"
+    if isinstance(value, float) and math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class MetricsExporter:
+    """保存最新指标和累计值，写JSONL并按需启动HTTP端点"""
+
+    def __init__(self, jsonl_path=None, port=0, host="127.0.0.1", labels=None, log=None):
+        self.jsonl_path = jsonl_path
+        self.port = port
+        self.host = host
+        self.labels = labels or {}
+        self.log = log or (lambda message: None)
+        self.gauges = {"running": 0}
+        self.counters = {name: 0 for name, _ in _COUNTERS}
+        self._lock = threading.Lock()
+        self._file = None
+        self._last_flush = 0.0
+        self._server = None
+
+    def start(self):
+        if self.jsonl_path:
+            os.makedirs(os.path.dirname(os.path.abspath(self.jsonl_path)), exist_ok=True)
+            self._file = open(self.jsonl_path, 'a', encoding='utf-8')
+            self.log(f"训练指标写入: {self.jsonl_path}\n")
+        if self.port:
+            self._start_server()
+        with self._lock:
+            self.gauges["running"] = 1
+        return self
+
+    def _start_server(self):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                body = exporter.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header("Content-Type", "application/openmetrics-text; version=1.0.0; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        except OSError as e:
+            self.log(f"无法在 {self.host}:{self.port} 启动指标端点: {e}\n")
+            return
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True).start()
+        self.log(f"训练指标端点: http://{self.host}:{self._server.server_address[1]}/metrics\n")
+
+    def record(self, values):
+        """记录一步的指标；values中的 tokens/samples/data_wait/compute 计入累计值"""
+        rss, peak = host_memory()
+        values = dict(values, host_memory_bytes=rss, host_memory_peak_bytes=peak, **device_memory())
+        with self._lock:
+            self.counters["steps"] += 1
+            self.counters["tokens"] += values.get("tokens", 0)
+            self.counters["samples"] += values.get("samples", 0)
+            self.counters["data_wait_seconds"] += values.get("step_data_wait_seconds", 0.0)
+            self.counters["compute_seconds"] += values.get("step_compute_seconds", 0.0)
+            for name, _ in _GAUGES:
+                if values.get(name) is not None:
+                    self.gauges[name] = values[name]
+        if self._file is not None:
+            now = time.time()
+            self._file.write(json.dumps(dict(values, time=now, **self.labels), ensure_ascii=False) + "\n")
+            # 每秒最多刷新一次，避免步数很快时频繁写盘
+            if now - self._last_flush >= 1.0:
+                self._file.flush()
+                self._last_flush = now
+
+    def render(self):
+        """OpenMetrics文本格式"""
+        labels = ",".join(f'{key}="{_escape(value)}"' for key, value in sorted(self.labels.items()))
+        labels = "{" + labels + "}" if labels else ""
+        lines = []
+        with self._lock:
+            for name, help_text in _GAUGES:
+                if self.gauges.get(name) is None:
+                    continue
+                lines.append(f"# TYPE {METRIC_PREFIX}{name} gauge")
+                lines.append(f"# HELP {METRIC_PREFIX}{name} {help_text}")
+                lines.append(f"{METRIC_PREFIX}{name}{labels} {_number(self.gauges[name])}")
+            for name, help_text in _COUNTERS:
+                lines.append(f"# TYPE {METRIC_PREFIX}{name} counter")
+                lines.append(f"# HELP {METRIC_PREFIX}{name} {help_text}")
+                lines.append(f"{METRIC_PREFIX}{name}_total{labels} {_number(self.counters[name])}")
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """训练结束时写入日志的汇总"""
+        with self._lock:
+            counters = dict(self.counters)
+        total = counters["data_wait_seconds"] + counters["compute_seconds"]
+        if not counters["steps"] or total <= 0:
+            return None
+        return (f"训练指标: {counters['steps']} 步，平均 {counters['tokens'] / total:.0f} tokens/s，"
+                f"{counters['samples'] / total:.2f} 序列/s，等待数据占 {counters['data_wait_seconds'] / total:.1%}")
+
+    def close(self):
+        with self._lock:
+            self.gauges["running"] = 0
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
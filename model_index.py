@@ -0,0 +1,259 @@
+"""本地模型目录索引
+
+递归扫描模型目录(含Hugging Face缓存的 models--org--name/snapshots/<rev> 结构)，
+结果保存在目录下的 .model_index.json 中。再次扫描时:
+    目录的mtime未变   -> 直接使用上次记录的子目录列表，不再列目录
+    配置文件的mtime和大小未变 -> 直接使用上次解析的结果，不再读取config.json
+参数量从safetensors文件头统计，只读取每个分片开头的几十KB。
+目录的stat和读取由线程池并行完成，网络文件系统上的等待可以重叠。
+"""
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from memory_planner import count_parameters, estimate_params_from_config, read_model_tensors
+
+INDEX_FILE = ".model_index.json"
+INDEX_VERSION = 3
+FALLBACK_INDEX_DIR = os.path.join(os.path.expanduser("~"), ".cache", "unsloth_gui", "model_index")
+
+# 识别模型目录时关心的文件；training_config.json 为本工具导出的训练配置，
+# adapter_config.json 为LoRA适配器(导出的adapter和epoch_N/best_model检查点没有config.json)
+CONFIG_FILES = ("config.json", "training_config.json", "adapter_config.json")
+# 不需要进入的子目录
+SKIP_DIRS = {"__pycache__", "blobs", "refs", "logs", "tokenizer"}
+
+
+def _signature(path, files):
+    """配置文件的 (名称, mtime_ns, 大小) 列表，用于判断是否需要重新解析"""
+    signature = []
+    for name in CONFIG_FILES:
+        if name in files:
+            st = os.stat(os.path.join(path, name))
+            signature.append([name, st.st_mtime_ns, st.st_size])
+    return signature
+
+
+def hub_repo_of(path):
+    """path为HF缓存中的某个快照目录时返回 (org/name, revision)，否则返回None"""
+    parent = os.path.dirname(path)
+    repo_dir = os.path.dirname(parent)
+    repo = os.path.basename(repo_dir)
+    if os.path.basename(parent) == "snapshots" and repo.startswith("models--"):
+        return repo[len("models--"):].replace("--", "/"), os.path.basename(path)
+    return None
+
+
+def _read_json(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def model_params(path, model_config):
+    """参数量: 优先用safetensors文件头精确统计，其次用config中的记录或按结构估算，都不行时返回None"""
+    try:
+        return count_parameters(read_model_tensors(path, local_files_only=True)[0])[0]
+    except (OSError, ValueError, KeyError):
+        pass
+    for key in ("num_parameters", "n_parameters"):
+        if isinstance(model_config.get(key), int):
+            return model_config[key]
+    try:
+        return estimate_params_from_config(model_config)
+    except (KeyError, TypeError):
+        return None
+
+
+def base_model_dir(base_model, train_config=None):
+    """在本地查找基础模型目录: 本地路径、训练配置中的本地模型目录或HF缓存，找不到时返回None"""
+    candidates = [base_model]
+    if train_config and train_config.get("local_model_dir"):
+        candidates.append(os.path.join(train_config["local_model_dir"], os.path.basename(base_model)))
+    for path in candidates:
+        if os.path.exists(os.path.join(path, "config.json")):
+            return path
+    try:
+        from huggingface_hub import try_to_load_from_cache
+        cached = try_to_load_from_cache(base_model, "config.json")
+    except Exception:
+        return None
+    return os.path.dirname(cached) if isinstance(cached, str) else None
+
+
+def read_model_record(path, signature, mtime):
+    """读取一个模型目录的配置，返回索引记录"""
+    model_config = None
+    if os.path.exists(os.path.join(path, "config.json")):
+        model_config = _read_json(os.path.join(path, "config.json"))
+    train_config = None
+    if os.path.exists(os.path.join(path, "training_config.json")):
+        train_config = _read_json(os.path.join(path, "training_config.json"))
+    adapter_config = None
+    if os.path.exists(os.path.join(path, "adapter_config.json")):
+        adapter_config = _read_json(os.path.join(path, "adapter_config.json"))
+    # 旧版本导出的config.json就是训练配置
+    if train_config is None and model_config and "base_model" in model_config:
+        train_config = model_config
+
+    hub = hub_repo_of(path)
+    if hub:
+        name = f"{hub[0]}@{hub[1][:8]}"
+        base_model = hub[0]
+    else:
+        name = os.path.basename(path)
+        base_model = ((train_config or {}).get("base_model") or (adapter_config or {}).get("base_model_name_or_path")
+                      or (model_config or {}).get("_name_or_path") or "未知")
+
+    weights_dir = path
+    if model_config is None or "base_model" in model_config:
+        # 适配器目录: 架构和参数量取自基础模型，本地找不到基础模型时只显示名称
+        weights_dir = base_model_dir(str(base_model), train_config)
+        model_config = _read_json(os.path.join(weights_dir, "config.json")) if weights_dir else {}
+    architectures = model_config.get("architectures") or ["未知"]
+    return {
+        "path": path,
+        "name": name,
+        "base_model": str(base_model),
+        "architecture": architectures[0],
+        "params": model_params(weights_dir, model_config) if weights_dir else None,
+        "model_config": model_config,
+        "train_config": train_config,
+        "last_modified": mtime,
+        "signature": signature,
+    }
+
+
+class ModelIndex:
+    """持久化的模型目录索引"""
+
+    def __init__(self, root, index_path=None, max_workers=16, max_depth=8, log=None):
+        self.root = os.path.abspath(root)
+        self.index_path = index_path or os.path.join(self.root, INDEX_FILE)
+        self.max_workers = max_workers
+        self.max_depth = max_depth
+        self.log = log or (lambda message: None)
+        self.stats = {}
+        self._dirs = self._load()
+
+    def _fallback_path(self):
+        digest = hashlib.sha1(self.root.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(FALLBACK_INDEX_DIR, f"{digest}.json")
+
+    def _load(self):
+        for path in (self.index_path, self._fallback_path()):
+            try:
+                data = _read_json(path)
+            except (OSError, ValueError):
+                continue
+            if data.get("version") == INDEX_VERSION and data.get("root") == self.root:
+                return data["dirs"]
+        return {}
+
+    def save(self):
+        """原子写入索引文件；模型目录不可写时写入用户缓存目录"""
+        data = {"version": INDEX_VERSION, "root": self.root, "dirs": self._dirs}
+        for path in (self.index_path, self._fallback_path()):
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, ensure_ascii=False)
+                os.replace(tmp_path, path)
+                return path
+            except OSError:
+                continue
+        return None
+
+    def records(self):
+        """当前索引中的全部模型记录，按路径排序"""
+        return sorted((entry["model"] for entry in self._dirs.values() if entry.get("model")),
+                      key=lambda record: record["path"])
+
+    def _children(self, path, subdirs):
+        """决定需要继续扫描的子目录"""
+        name = os.path.basename(path)
+        if name.startswith("models--"):
+            return ["snapshots"] if "snapshots" in subdirs else []
+        if name == "snapshots" and os.path.basename(os.path.dirname(path)).startswith("models--"):
+            # 只索引refs/main指向的版本，没有refs时索引全部快照
+            try:
+                with open(os.path.join(os.path.dirname(path), "refs", "main"), 'r') as f:
+                    revision = f.read().strip()
+                if revision in subdirs:
+                    return [revision]
+            except OSError:
+                pass
+            return subdirs
+        return [d for d in subdirs
+                if not d.startswith(".") and d not in SKIP_DIRS and not d.startswith(("datasets--", "spaces--"))]
+
+    def _scan_dir(self, path, cached):
+        """扫描一个目录，返回 (目录条目或None, 子目录路径列表, 是否重新解析了配置)"""
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            return None, [], False
+        if cached and cached["mtime"] == mtime_ns:
+            subdirs, files = cached["subdirs"], cached["files"]
+        else:
+            subdirs, files = [], []
+            try:
+                with os.scandir(path) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.name)
+                        elif entry.name in CONFIG_FILES:
+                            files.append(entry.name)
+            except OSError:
+                return None, [], False
+            subdirs.sort()
+
+        model = None
+        parsed = False
+        if files:
+            try:
+                signature = _signature(path, files)
+                if cached and cached.get("model") and cached["model"]["signature"] == signature:
+                    model = cached["model"]
+                else:
+                    model = read_model_record(path, signature, mtime_ns / 1e9)
+                    parsed = True
+            except (OSError, ValueError) as e:
+                self.log(f"读取模型 {path} 配置失败: {str(e)}\n")
+        entry = {"mtime": mtime_ns, "subdirs": subdirs, "files": files, "model": model}
+        return entry, [os.path.join(path, d) for d in self._children(path, subdirs)], parsed
+
+    def refresh(self, save=True):
+        """增量刷新索引并返回全部模型记录"""
+        start = time.perf_counter()
+        cached_dirs = self._dirs
+        new_dirs = {}
+        parsed = 0
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            pending = {pool.submit(self._scan_dir, self.root, cached_dirs.get(self.root)): (self.root, 0)}
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    path, depth = pending.pop(future)
+                    entry, children, was_parsed = future.result()
+                    if entry is None:
+                        continue
+                    new_dirs[path] = entry
+                    parsed += was_parsed
+                    if depth < self.max_depth:
+                        for child in children:
+                            pending[pool.submit(self._scan_dir, child, cached_dirs.get(child))] = (child, depth + 1)
+        self._dirs = new_dirs
+        records = self.records()
+        self.stats = {
+            "directories": len(new_dirs),
+            "models": len(records),
+            "parsed": parsed,
+            "reused": len(records) - parsed,
+            "seconds": round(time.perf_counter() - start, 3),
+        }
+        if save:
+            self.save()
+        return records
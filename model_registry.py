@@ -0,0 +1,148 @@
+"""进程内的模型和tokenizer注册表
+
+训练、导出和导入共用已加载的模型和tokenizer，按 (模型路径, 精度, 量化方式, 最大长度)
+区分；总占用超过内存预算时按最近最少使用淘汰，也可以显式释放。
+"""
+import gc
+import os
+import threading
+from collections import OrderedDict
+
+
+def module_nbytes(model):
+    """统计模型参数和缓冲区占用的字节数"""
+    total = 0
+    for tensor in list(model.parameters()) + list(model.buffers()):
+        total += tensor.numel() * tensor.element_size()
+    return total
+
+
+def default_budget():
+    """默认预算：有GPU时为显存的90%，否则为物理内存的一半"""
+    try:
+        import torch
+        if torch.cuda.is_available():
+            return int(torch.cuda.get_device_properties(0).total_memory * 0.9)
+    except ImportError:
+        pass
+    try:
+        return int(os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") * 0.5)
+    except (ValueError, OSError, AttributeError):
+        return 8 * (1 << 30)
+
+
+def model_key(model_path, dtype, quantization, max_seq_length):
+    """模型条目的键"""
+    return ("model", str(model_path), str(dtype), str(quantization), int(max_seq_length))
+
+
+def tokenizer_key(path):
+    return ("tokenizer", str(path))
+
+
+class ModelRegistry:
+    """带内存预算的LRU缓存，值为任意对象，大小由调用方给出"""
+
+    def __init__(self, budget_bytes=None):
+        self._budget = budget_bytes
+        self._entries = OrderedDict()  # key -> (value, size)
+        self._lock = threading.RLock()
+        self._loading = {}  # key -> Lock，避免同一模型被并发加载两次
+
+    @property
+    def budget(self):
+        if self._budget is None:
+            self._budget = default_budget()
+        return self._budget
+
+    def set_budget(self, budget_bytes):
+        with self._lock:
+            self._budget = budget_bytes
+            self._evict()
+
+    @property
+    def total_bytes(self):
+        with self._lock:
+            return sum(size for _, size in self._entries.values())
+
+    def keys(self):
+        with self._lock:
+            return list(self._entries)
+
+    def get(self, key):
+        """命中时返回值并标记为最近使用，否则返回None"""
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+
+    def put(self, key, value, size=0):
+        """加入或替换条目，超出预算时淘汰最久未用的其他条目"""
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (value, size)
+            self._evict(keep=key)
+
+    def get_or_load(self, key, loader, size_fn=None):
+        """命中时直接返回，否则调用loader()加载并登记"""
+        value = self.get(key)
+        if value is not None:
+            return value
+        with self._lock:
+            key_lock = self._loading.setdefault(key, threading.Lock())
+        with key_lock:
+            value = self.get(key)
+            if value is None:
+                value = loader()
+                self.put(key, value, size_fn(value) if size_fn else 0)
+        with self._lock:
+            self._loading.pop(key, None)
+        return value
+
+    def release(self, key):
+        """显式释放一个条目，返回是否存在"""
+        with self._lock:
+            found = self._entries.pop(key, None) is not None
+        if found:
+            _free_memory()
+        return found
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        _free_memory()
+
+    def _evict(self, keep=None):
+        evicted = False
+        while sum(size for _, size in self._entries.values()) > self.budget:
+            victim = next((k for k in self._entries if k != keep), None)
+            if victim is None:
+                break
+            del self._entries[victim]
+            evicted = True
+        if evicted:
+            _free_memory()
+
+
+def _free_memory():
+    gc.collect()
+    try:
+        import torch
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+    except ImportError:
+        pass
+
+
+# 进程内共享的注册表
+registry = ModelRegistry()
+
+
+def get_tokenizer(path):
+    """从注册表获取tokenizer，未加载时用AutoTokenizer加载"""
+    def load():
+        from transformers import AutoTokenizer
+        return AutoTokenizer.from_pretrained(path)
+
+    return registry.get_or_load(tokenizer_key(path), load)
@@ -0,0 +1,204 @@
+"""模型列表的搜索索引和虚拟化表格
+
+SearchIndex 预先把各字段转为小写并建立三元组(trigram)倒排索引，查询时先求候选集合的交集，
+再对少量候选做子串校验；VirtualTreeview 只为可见的行创建Treeview条目，滚动时复用这些条目。
+"""
+import tkinter as tk
+from tkinter import ttk
+
+DEFAULT_FIELDS = ("name", "base_model", "architecture")
+
+
+def parse_param_count(text):
+    """把 "7.0B" / "125.0M" / "1,234" 形式的参数量转为数字，无法解析时返回-1，用于排序"""
+    text = str(text).replace(",", "").strip()
+    scale = {"B": 1e9, "M": 1e6}.get(text[-1:], 1)
+    try:
+        return float(text[:-1] if scale != 1 else text) * scale
+    except ValueError:
+        return -1
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class SearchIndex:
+    """对记录列表的子串搜索，多个以空格分隔的词须同时匹配"""
+
+    def __init__(self, records, fields=DEFAULT_FIELDS, sort_keys=None):
+        self.records = records
+        # 字段之间用不会出现在查询中的字符分隔，避免跨字段匹配
+        self._texts = ["\x00".join(str(record.get(field, "")) for field in fields).lower() for record in records]
+        postings = {}
+        for i, text in enumerate(self._texts):
+            for gram in _trigrams(text):
+                postings.setdefault(gram, []).append(i)
+        self._postings = {gram: frozenset(ids) for gram, ids in postings.items()}
+        self._sort_keys = sort_keys or {}
+        self._sorted = {}
+        self._last = ([], None)  # 上一次查询的 (词列表, 结果集合)
+
+    def search(self, query):
+        """返回匹配记录的下标列表，保持原有顺序"""
+        terms = query.lower().split()
+        if not terms:
+            self._last = ([], None)
+            return list(range(len(self.records)))
+
+        postings = []
+        for term in terms:
+            for gram in _trigrams(term):
+                posting = self._postings.get(gram)
+                if posting is None:
+                    self._last = (terms, frozenset())
+                    return []
+                postings.append(posting)
+        # 继续输入时，新查询的每个词都包含上一次的某个词，结果只会在上一次结果中
+        last_terms, last_ids = self._last
+        if last_ids is not None and all(any(old in new for new in terms) for old in last_terms):
+            postings.append(last_ids)
+
+        if postings:
+            postings.sort(key=len)
+            candidates = set(postings[0])
+            for posting in postings[1:]:
+                if len(candidates) < 64:
+                    break
+                candidates &= posting
+            ids = sorted(candidates)
+        else:
+            ids = range(len(self.records))
+        texts = self._texts
+        if len(terms) == 1:
+            term = terms[0]
+            # 单个三字符的词，倒排索引的结果就是精确结果
+            result = list(ids) if len(term) == 3 and postings else [i for i in ids if term in texts[i]]
+        else:
+            result = [i for i in ids if all(term in texts[i] for term in terms)]
+        self._last = (terms, frozenset(result))
+        return result
+
+    def sort(self, ids, column, reverse=False):
+        """按列排序下标列表；每列的全量排序结果会缓存，之后只需按名次过滤"""
+        if column not in self._sorted:
+            key = self._sort_keys.get(column, lambda record: record.get(column, ""))
+            order = sorted(range(len(self.records)), key=lambda i: key(self.records[i]))
+            rank = [0] * len(order)
+            for position, i in enumerate(order):
+                rank[i] = position
+            self._sorted[column] = rank
+        rank = self._sorted[column]
+        return sorted(ids, key=rank.__getitem__, reverse=reverse)
+
+
+class VirtualTreeview(ttk.Frame):
+    """只显示可见行的表格
+
+    rows为显示用的值元组列表，set_items(ids)设置当前要显示的行(rows的下标)。
+    """
+
+    def __init__(self, master, columns, rows, on_sort=None, on_activate=None, **kwargs):
+        super().__init__(master, **kwargs)
+        self.rows = rows
+        self.ids = []
+        self.offset = 0
+        self.selected = None
+        self.on_activate = on_activate
+        self._visible = 20
+
+        self.tree = ttk.Treeview(self, columns=columns, show='headings', selectmode='browse', height=self._visible)
+        for col in columns:
+            self.tree.heading(col, text=col, command=(lambda c=col: on_sort(c)) if on_sort else "")
+            self.tree.column(col, width=150)
+        self.scrollbar = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self._on_scrollbar)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self._slots = []
+
+        self.tree.bind("<Configure>", self._on_resize)
+        self.tree.bind("<MouseWheel>", lambda e: self.scroll(-1 if e.delta > 0 else 1, "units"))
+        self.tree.bind("<Button-4>", lambda e: self.scroll(-1, "units"))
+        self.tree.bind("<Button-5>", lambda e: self.scroll(1, "units"))
+        self.tree.bind("<Up>", lambda e: self._move_selection(-1))
+        self.tree.bind("<Down>", lambda e: self._move_selection(1))
+        self.tree.bind("<Prior>", lambda e: self._move_selection(-self._visible))
+        self.tree.bind("<Next>", lambda e: self._move_selection(self._visible))
+        self.tree.bind("<<TreeviewSelect>>", self._on_select)
+        self.tree.bind("<Double-1>", lambda e: self.on_activate and self.on_activate())
+
+    def set_items(self, ids):
+        self.ids = ids
+        self.offset = 0
+        self.render()
+
+    def heading(self, column, text):
+        self.tree.heading(column, text=text)
+
+    def _on_resize(self, event):
+        row_height = int(ttk.Style().lookup("Treeview", "rowheight") or 20)
+        visible = max(1, (event.height - row_height) // row_height)
+        if visible != self._visible:
+            self._visible = visible
+            self.render()
+
+    def render(self):
+        """把offset开始的可见行填入复用的条目中"""
+        self.offset = max(0, min(self.offset, len(self.ids) - self._visible))
+        while len(self._slots) < self._visible:
+            self._slots.append(self.tree.insert('', tk.END, iid=f"row{len(self._slots)}"))
+        window = self.ids[self.offset:self.offset + self._visible]
+        attached = set(self.tree.get_children())
+        selected_slot = None
+        for index, slot in enumerate(self._slots):
+            if index < len(window):
+                self.tree.item(slot, values=self.rows[window[index]])
+                if slot not in attached:
+                    self.tree.move(slot, '', index)
+                if window[index] == self.selected:
+                    selected_slot = slot
+            elif slot in attached:
+                self.tree.detach(slot)
+        if selected_slot:
+            self.tree.selection_set(selected_slot)
+        else:
+            self.tree.selection_remove(self.tree.selection())
+        total = max(len(self.ids), 1)
+        self.scrollbar.set(self.offset / total, min(1.0, (self.offset + self._visible) / total))
+
+    def scroll(self, amount, what):
+        step = self._visible if what == "pages" else 1
+        self.offset += int(amount) * step
+        self.render()
+        return "break"
+
+    def _on_scrollbar(self, action, value, what=None):
+        if action == "moveto":
+            self.offset = int(float(value) * len(self.ids))
+            self.render()
+        else:
+            self.scroll(value, what)
+
+    def _on_select(self, event):
+        selection = self.tree.selection()
+        if selection:
+            slot_index = self._slots.index(selection[0])
+            if self.offset + slot_index < len(self.ids):
+                self.selected = self.ids[self.offset + slot_index]
+
+    def _move_selection(self, delta):
+        if not self.ids:
+            return "break"
+        position = self.ids.index(self.selected) if self.selected in self.ids else -1
+        position = max(0, min(len(self.ids) - 1, position + delta))
+        self.selected = self.ids[position]
+        if position < self.offset:
+            self.offset = position
+        elif position >= self.offset + self._visible:
+            self.offset = position - self._visible + 1
+        self.render()
+        return "break"
+
+    def selected_id(self):
+        """当前选中行在rows中的下标，没有选中时返回None"""
+        return self.selected
@@ -0,0 +1,285 @@
+"""导出ONNX模型并在CPU上与PyTorch对比推理性能
+
+导出的模型输入为 input_ids / attention_mask / position_ids 和每层的
+past_key_values.{i}.key / past_key_values.{i}.value，输出为 logits 和 present.{i}.key / present.{i}.value；
+batch、序列长度和缓存长度都是动态维度，首次推理传入长度为0的缓存即可。
+    python -m onnx_export --model ./output/exported_model --output ./output/onnx --benchmark
+    python -m onnx_export --model ./output/epoch_3 --base-model meta-llama/Llama-2-7b-hf --output ./output/onnx
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+
+ONNX_FILE = "model.onnx"
+DEFAULT_OPSET = 17
+
+
+def load_for_export(model_path, base_model=None, local_files_only=False, log=None):
+    """加载待导出的模型；model_path是LoRA检查点时先把适配器合并进基础模型
+
+    local_files_only: 离线模式下只从本地目录或HF缓存加载基础模型
+
+    CPU推理使用float32，fp16在onnxruntime的CPU执行器上大多没有优化实现。
+    """
+    import torch
+    from transformers import AutoModelForCausalLM
+
+    log = log or (lambda message: None)
+    if os.path.exists(os.path.join(model_path, "adapter_config.json")):
+        from peft import PeftModel
+
+        if not base_model:
+            with open(os.path.join(model_path, "adapter_config.json"), 'r', encoding='utf-8') as f:
+                base_model = json.load(f).get("base_model_name_or_path")
+        if not base_model:
+            raise ValueError("导出LoRA检查点需要指定基础模型")
+        log(f"正在加载基础模型 {base_model} 并合并适配器...\n")
+        model = AutoModelForCausalLM.from_pretrained(base_model, dtype=torch.float32,
+                                                     local_files_only=local_files_only)
+        model = PeftModel.from_pretrained(model, model_path).merge_and_unload()
+    else:
+        log(f"正在加载模型 {model_path}...\n")
+        model = AutoModelForCausalLM.from_pretrained(model_path, dtype=torch.float32)
+    model.eval()
+    model.config.use_cache = True
+    return model
+
+
+def cache_shape(config):
+    """返回 (层数, KV头数, 每头维度)"""
+    heads = config.num_attention_heads
+    kv_heads = getattr(config, "num_key_value_heads", None) or heads
+    head_dim = getattr(config, "head_dim", None) or config.hidden_size // heads
+    return config.num_hidden_layers, kv_heads, head_dim
+
+
+def io_names(num_layers):
+    """返回 (输入名列表, 输出名列表)"""
+    inputs = ["input_ids", "attention_mask", "position_ids"]
+    outputs = ["logits"]
+    for i in range(num_layers):
+        inputs += [f"past_key_values.{i}.key", f"past_key_values.{i}.value"]
+        outputs += [f"present.{i}.key", f"present.{i}.value"]
+    return inputs, outputs
+
+
+def _make_wrapper(model):
+    """把以DynamicCache传递的KV缓存展开为扁平的张量输入输出，便于导出"""
+    import torch
+    from transformers import DynamicCache
+
+    num_layers = cache_shape(model.config)[0]
+
+    class KVCacheWrapper(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask, position_ids, *past):
+            cache = DynamicCache(config=self.model.config)
+            for i in range(num_layers):
+                cache.update(past[2 * i], past[2 * i + 1], i)
+            out = self.model(
+                input_ids=input_ids, attention_mask=attention_mask, position_ids=position_ids,
+                past_key_values=cache, use_cache=True,
+            )
+            present = []
+            for layer in out.past_key_values.layers:
+                present += [layer.keys, layer.values]
+            return (out.logits, *present)
+
+    return KVCacheWrapper()
+
+
+def dummy_inputs(config, batch_size, seq_len, past_len):
+    """构造一组输入，past_len为已缓存的长度"""
+    import torch
+
+    num_layers, kv_heads, head_dim = cache_shape(config)
+    input_ids = torch.randint(0, config.vocab_size, (batch_size, seq_len))
+    attention_mask = torch.ones(batch_size, past_len + seq_len, dtype=torch.long)
+    position_ids = torch.arange(past_len, past_len + seq_len).unsqueeze(0).expand(batch_size, -1).contiguous()
+    past = [torch.zeros(batch_size, kv_heads, past_len, head_dim) for _ in range(2 * num_layers)]
+    return (input_ids, attention_mask, position_ids, *past)
+
+
+def export_onnx(model, export_path, opset=DEFAULT_OPSET, tokenizer_dir=None, log=None):
+    """导出ONNX模型，返回model.onnx路径"""
+    import torch
+
+    log = log or (lambda message: None)
+    start = time.perf_counter()
+    num_layers = cache_shape(model.config)[0]
+    inputs, outputs = io_names(num_layers)
+    dynamic_axes = {
+        "input_ids": {0: "batch", 1: "sequence"},
+        "attention_mask": {0: "batch", 1: "total_sequence"},
+        "position_ids": {0: "batch", 1: "sequence"},
+        "logits": {0: "batch", 1: "sequence"},
+    }
+    for name in inputs[3:]:
+        dynamic_axes[name] = {0: "batch", 2: "past_sequence"}
+    for name in outputs[1:]:
+        dynamic_axes[name] = {0: "batch", 2: "total_sequence"}
+
+    os.makedirs(export_path, exist_ok=True)
+    onnx_path = os.path.join(export_path, ONNX_FILE)
+    # 用非零的缓存长度追踪，避免空缓存分支被固定进计算图
+    sample = dummy_inputs(model.config, batch_size=2, seq_len=3, past_len=4)
+    log(f"正在导出ONNX模型 ({num_layers} 层, opset {opset})...\n")
+    with torch.no_grad():
+        torch.onnx.export(
+            _make_wrapper(model), sample, onnx_path,
+            input_names=inputs, output_names=outputs, dynamic_axes=dynamic_axes,
+            opset_version=opset, do_constant_folding=True, dynamo=False,
+        )
+
+    import onnx
+    onnx.checker.check_model(onnx_path)
+    model.config.save_pretrained(export_path)
+    if tokenizer_dir and os.path.isdir(tokenizer_dir):
+        for name in os.listdir(tokenizer_dir):
+            if name.startswith(("tokenizer", "special_tokens", "vocab", "merges")):
+                shutil.copy2(os.path.join(tokenizer_dir, name), os.path.join(export_path, name))
+    log(f"ONNX模型已导出到 {onnx_path}，耗时 {time.perf_counter() - start:.1f} 秒\n")
+    return onnx_path
+
+
+def verify_onnx(model, onnx_path, session=None):
+    """在同一组输入上比较ONNX与PyTorch的logits，返回最大绝对误差"""
+    import torch
+
+    session = session or create_session(onnx_path)
+    inputs, _ = io_names(cache_shape(model.config)[0])
+    sample = dummy_inputs(model.config, batch_size=1, seq_len=5, past_len=3)
+    with torch.no_grad():
+        expected = _make_wrapper(model)(*sample)[0].numpy()
+    actual = session.run(["logits"], {name: t.numpy() for name, t in zip(inputs, sample)})[0]
+    return float(abs(actual - expected).max())
+
+
+def create_session(onnx_path, threads=None):
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if threads:
+        options.intra_op_num_threads = threads
+    return ort.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+
+
+def _generate(step, config, batch_size, prompt_len, new_tokens):
+    """用step(input_ids, attention_mask, position_ids, past)做贪心解码，返回 (首token耗时, 每token解码耗时列表)"""
+    import torch
+
+    input_ids, attention_mask, position_ids, *past = dummy_inputs(config, batch_size, prompt_len, 0)
+    start = time.perf_counter()
+    logits, past = step(input_ids, attention_mask, position_ids, past)
+    prefill = time.perf_counter() - start
+    decode = []
+    length = prompt_len
+    for _ in range(new_tokens - 1):
+        next_ids = logits[:, -1:].argmax(-1)
+        attention_mask = torch.ones(batch_size, length + 1, dtype=torch.long)
+        position_ids = torch.full((batch_size, 1), length, dtype=torch.long)
+        start = time.perf_counter()
+        logits, past = step(next_ids, attention_mask, position_ids, past)
+        decode.append(time.perf_counter() - start)
+        length += 1
+    return prefill, decode
+
+
+def benchmark(model, onnx_path, batch_sizes=(1, 4), prompt_len=128, new_tokens=32, threads=None, repeats=3):
+    """在CPU上比较PyTorch与onnxruntime的推理延迟和吞吐，返回结果列表
+
+    prefill_ms: 处理整段提示的耗时; decode_ms: 单步解码耗时的中位数;
+    tokens_per_sec: 解码阶段每秒生成的token数(含batch)
+    """
+    import statistics
+
+    import torch
+
+    if threads:
+        torch.set_num_threads(threads)
+    session = create_session(onnx_path, threads)
+    inputs, _ = io_names(cache_shape(model.config)[0])
+    wrapper = _make_wrapper(model)
+
+    def torch_step(input_ids, attention_mask, position_ids, past):
+        with torch.no_grad():
+            logits, *present = wrapper(input_ids, attention_mask, position_ids, *past)
+        return logits, present
+
+    def onnx_step(input_ids, attention_mask, position_ids, past):
+        feed = {name: t.numpy() if hasattr(t, "numpy") else t
+                for name, t in zip(inputs, (input_ids, attention_mask, position_ids, *past))}
+        logits, *present = session.run(None, feed)
+        return torch.from_numpy(logits), present
+
+    results = []
+    for batch_size in batch_sizes:
+        for backend, step in (("pytorch", torch_step), ("onnxruntime", onnx_step)):
+            # 预热一次，排除首次分配内存和图优化的开销
+            _generate(step, model.config, batch_size, prompt_len, 2)
+            prefills = []
+            decodes = []
+            for _ in range(repeats):
+                prefill, decode = _generate(step, model.config, batch_size, prompt_len, new_tokens)
+                prefills.append(prefill)
+                decodes.extend(decode)
+            decode_ms = statistics.median(decodes) * 1000 if decodes else 0.0
+            results.append({
+                "backend": backend,
+                "batch_size": batch_size,
+                "prompt_len": prompt_len,
+                "prefill_ms": round(statistics.median(prefills) * 1000, 2),
+                "decode_ms": round(decode_ms, 2),
+                "tokens_per_sec": round(batch_size * 1000 / decode_ms, 1) if decode_ms else 0.0,
+            })
+    return results
+
+
+def format_results(results):
+    """把benchmark结果格式化为文本表格"""
+    lines = [f"{'后端':<12}{'batch':>6}{'prefill(ms)':>14}{'decode(ms)':>12}{'tokens/s':>10}"]
+    for row in results:
+        lines.append(f"{row['backend']:<12}{row['batch_size']:>6}{row['prefill_ms']:>14.2f}"
+                     f"{row['decode_ms']:>12.2f}{row['tokens_per_sec']:>10.1f}")
+    return "\n".join(lines) + "\n"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m onnx_export", description="导出ONNX模型并进行CPU推理基准测试")
+    parser.add_argument("--model", required=True, help="合并后的模型目录，或LoRA检查点目录(epoch_N)")
+    parser.add_argument("--base-model", help="LoRA检查点对应的基础模型，默认读取adapter_config.json")
+    parser.add_argument("--output", required=True, help="ONNX模型输出目录")
+    parser.add_argument("--opset", type=int, default=DEFAULT_OPSET)
+    parser.add_argument("--benchmark", action="store_true", help="导出后对比PyTorch与onnxruntime的CPU推理性能")
+    parser.add_argument("--batch-sizes", default="1,4")
+    parser.add_argument("--prompt-len", type=int, default=128)
+    parser.add_argument("--new-tokens", type=int, default=32)
+    parser.add_argument("--threads", type=int, default=None, help="推理线程数，默认由两个框架自行决定")
+    parser.add_argument("--json", help="把基准测试结果写入该JSON文件")
+    args = parser.parse_args(argv)
+
+    log = sys.stdout.write
+    model = load_for_export(args.model, args.base_model, log=log)
+    tokenizer_dir = os.path.join(args.model, "tokenizer")
+    onnx_path = export_onnx(model, args.output, opset=args.opset,
+                            tokenizer_dir=tokenizer_dir if os.path.isdir(tokenizer_dir) else args.model, log=log)
+    log(f"ONNX与PyTorch的logits最大误差: {verify_onnx(model, onnx_path):.2e}\n")
+    if args.benchmark:
+        batch_sizes = [int(b) for b in args.batch_sizes.split(",")]
+        results = benchmark(model, onnx_path, batch_sizes, args.prompt_len, args.new_tokens, args.threads)
+        log(format_results(results))
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
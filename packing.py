@@ -0,0 +1,159 @@
+"""序列打包: first-fit-decreasing装箱，打包在一起的样本互不可见
+
+原实现把样本首尾相接后按max_length切块，注意力会跨越样本边界。这里按长度从长到短，
+把每个样本放进第一个还能放下的箱子(容量为max_length)，每个箱子输出:
+    input_ids      箱内样本依次拼接
+    position_ids   每个样本从0开始编号
+    cu_seqlens     样本边界的累计长度 [0, l1, l1+l2, ...]
+PackedCollator 不传attention_mask，transformers据position_ids的重新编号为sdpa/eager生成块对角的因果掩码；
+flash_attention_2只在batch为1时识别打包格式，flatten=True时把整批拼成一行并给出cu_seq_lens。
+模型需关闭use_cache，否则会创建KV缓存而跳过打包格式的识别。
+"""
+import numpy as np
+
+# 每次装箱的样本数，越大填充率越高
+PACK_CHUNK_SIZE = 10000
+
+
+def first_fit_decreasing(lengths, capacity):
+    """返回箱子列表，每个箱子为样本下标列表；lengths中的值不能超过capacity"""
+    count = len(lengths)
+    if count == 0:
+        return []
+    order = sorted(range(count), key=lambda i: -lengths[i])
+    size = 1
+    while size < count:
+        size *= 2
+    # 线段树保存各箱子剩余容量的最大值，未使用的箱子容量为capacity，
+    # 从根向下总是优先走左子树即可找到第一个放得下的箱子
+    tree = [capacity] * (2 * size)
+    bins = []
+    for i in order:
+        length = lengths[i]
+        node = 1
+        while node < size:
+            node = 2 * node if tree[2 * node] >= length else 2 * node + 1
+        index = node - size
+        if index == len(bins):
+            bins.append([])
+        bins[index].append(i)
+        tree[node] -= length
+        node //= 2
+        while node:
+            tree[node] = max(tree[2 * node], tree[2 * node + 1])
+            node //= 2
+    return bins
+
+
+def _split(ids, max_length):
+    """超过max_length的样本切成多段，每段作为独立样本"""
+    return [ids[start:start + max_length] for start in range(0, len(ids), max_length)]
+
+
+def pack_examples(batch, max_length, eos_token_id):
+    """datasets.map(batched=True)使用的打包函数"""
+    sequences = []
+    for ids in batch["input_ids"]:
+        ids = list(ids)
+        if eos_token_id is not None and (not ids or ids[-1] != eos_token_id):
+            ids.append(eos_token_id)
+        sequences.extend(_split(ids, max_length))
+
+    packed = {"input_ids": [], "position_ids": [], "cu_seqlens": []}
+    for members in first_fit_decreasing([len(ids) for ids in sequences], max_length):
+        input_ids, position_ids, cu_seqlens = [], [], [0]
+        for i in members:
+            input_ids.extend(sequences[i])
+            position_ids.extend(range(len(sequences[i])))
+            cu_seqlens.append(len(input_ids))
+        packed["input_ids"].append(input_ids)
+        packed["position_ids"].append(position_ids)
+        packed["cu_seqlens"].append(cu_seqlens)
+    return packed
+
+
+def pack_dataset(tokenized, max_length, eos_token_id, num_proc=None):
+    """把分词后的数据集打包成max_length长度的序列"""
+    return tokenized.map(
+        pack_examples,
+        batched=True,
+        batch_size=PACK_CHUNK_SIZE,
+        num_proc=num_proc,
+        remove_columns=tokenized.column_names,
+        fn_kwargs={"max_length": max_length, "eos_token_id": eos_token_id},
+        desc="打包",
+    )
+
+
+def packing_stats(dataset, max_length):
+    """返回 (打包前的样本段数, 打包后的序列数, 填充率)"""
+    import pyarrow.compute as pc
+
+    table = dataset.with_format("arrow")[:]
+    tokens = int(pc.sum(pc.list_value_length(table["input_ids"])).as_py() or 0)
+    samples = int(pc.sum(pc.list_value_length(table["cu_seqlens"])).as_py() or 0) - len(dataset)
+    return samples, len(dataset), tokens / (len(dataset) * max_length) if len(dataset) else 0.0
+
+
+class PackedCollator:
+    """把打包后的序列组成批次
+
+    labels在padding和每个样本的第一个token处为-100，上一个样本的最后一个token不用于预测下一个样本的开头。
+    """
+
+    def __init__(self, pad_token_id, flatten=False):
+        self.pad_token_id = pad_token_id if pad_token_id is not None else 0
+        self.flatten = flatten
+
+    def _labels(self, ids, cu_seqlens):
+        labels = list(ids)
+        for start in cu_seqlens[:-1]:
+            labels[start] = -100
+        return labels
+
+    def __call__(self, features):
+        import torch
+
+        if self.flatten:
+            input_ids, position_ids, labels, cu_seqlens = [], [], [], [0]
+            for feature in features:
+                offset = len(input_ids)
+                input_ids.extend(feature["input_ids"])
+                position_ids.extend(feature["position_ids"])
+                labels.extend(self._labels(feature["input_ids"], feature["cu_seqlens"]))
+                cu_seqlens.extend(offset + end for end in feature["cu_seqlens"][1:])
+            cu = torch.tensor(cu_seqlens, dtype=torch.int32)
+            max_seqlen = int((cu[1:] - cu[:-1]).max())
+            return {
+                "input_ids": torch.tensor([input_ids], dtype=torch.long),
+                "position_ids": torch.tensor([position_ids], dtype=torch.long),
+                "labels": torch.tensor([labels], dtype=torch.long),
+                "cu_seq_lens_q": cu, "cu_seq_lens_k": cu,
+                "max_length_q": max_seqlen, "max_length_k": max_seqlen,
+            }
+
+        width = max(len(feature["input_ids"]) for feature in features)
+        input_ids = np.full((len(features), width), self.pad_token_id, dtype=np.int64)
+        labels = np.full((len(features), width), -100, dtype=np.int64)
+        # padding部分单独编号，自成一段，不会被真实token看到
+        position_ids = np.zeros((len(features), width), dtype=np.int64)
+        for row, feature in enumerate(features):
+            length = len(feature["input_ids"])
+            input_ids[row, :length] = feature["input_ids"]
+            labels[row, :length] = self._labels(feature["input_ids"], feature["cu_seqlens"])
+            position_ids[row, :length] = feature["position_ids"]
+            position_ids[row, length:] = np.arange(width - length)
+        return {
+            "input_ids": torch.from_numpy(input_ids),
+            "position_ids": torch.from_numpy(position_ids),
+            "labels": torch.from_numpy(labels),
+        }
+
+
+def collator_for(model, pad_token_id):
+    """按模型的注意力实现创建PackedCollator，并关闭use_cache"""
+    config = getattr(model, "config", None)
+    if config is not None:
+        config.use_cache = False
+    flatten = getattr(config, "_attn_implementation", None) == "flash_attention_2"
+    return PackedCollator(pad_token_id, flatten=flatten)
@@ -0,0 +1,135 @@
+"""训练性能分析: 用torch.profiler记录一段训练步，输出trace和算子耗时表
+
+按 wait/warmup/active 调度: 先跳过wait步(避开启动阶段)，再预热warmup步(不计入结果)，
+然后记录active步。记录结束后在输出目录写出:
+    trace_steps_<起>-<止>.json      Chrome trace，可在 chrome://tracing 或 https://ui.perfetto.dev 打开
+    operators_steps_<起>-<止>.txt   按自身耗时和自身内存排序的算子表
+只采集一次，之后立即停止profiler，不影响其余训练步的速度。CPU和GPU训练都可使用。
+"""
+import os
+import time
+
+# 算子表保留的行数
+TOP_OPERATORS = 30
+# 日志摘要中列出的算子数
+SUMMARY_OPERATORS = 5
+
+
+def _self_device_time(event):
+    value = getattr(event, "self_device_time_total", None)
+    if value is None:
+        value = getattr(event, "self_cuda_time_total", 0)
+    return value or 0
+
+
+class StepProfiler:
+    """在训练步窗口内运行torch.profiler，每个优化步结束时调用step()"""
+
+    def __init__(self, output_dir, wait=1, warmup=1, active=3, log=None):
+        self.output_dir = output_dir
+        self.wait = wait
+        self.warmup = warmup
+        self.active = active
+        self.log = log or (lambda message: None)
+        self.use_cuda = False
+        self.summary = None
+        self.trace_path = None
+        self.table_path = None
+        self._profiler = None
+        self._first_step = 0
+        self._steps = 0
+        self._record_start = None
+        self._record_end = None
+
+    @property
+    def total_steps(self):
+        return self.wait + self.warmup + self.active
+
+    def start(self, first_step=0):
+        """first_step: 开始时的global_step，用于给输出文件标注实际的步号"""
+        import torch
+        from torch.profiler import ProfilerActivity, profile, schedule
+
+        self.use_cuda = torch.cuda.is_available()
+        activities = [ProfilerActivity.CPU]
+        if self.use_cuda:
+            activities.append(ProfilerActivity.CUDA)
+        os.makedirs(self.output_dir, exist_ok=True)
+        self._first_step = first_step
+        self._steps = 0
+        self._profiler = profile(
+            activities=activities,
+            schedule=schedule(wait=self.wait, warmup=self.warmup, active=self.active, repeat=1),
+            on_trace_ready=self._on_trace_ready,
+            record_shapes=True,
+            profile_memory=True,
+        )
+        self._profiler.start()
+        self.log(f"性能分析: 跳过 {self.wait} 步、预热 {self.warmup} 步后记录 {self.active} 步\n")
+
+    def step(self):
+        if self._profiler is None:
+            return
+        self._steps += 1
+        # 记录窗口的墙钟时间，从最后一个预热步结束到最后一个记录步结束
+        if self._steps == self.wait + self.warmup:
+            self._record_start = time.perf_counter()
+        self._record_end = time.perf_counter()
+        self._profiler.step()
+        if self._steps >= self.total_steps:
+            self.stop()
+
+    def stop(self):
+        """停止profiler；记录窗口未完成时已记录的步仍会输出"""
+        if self._profiler is None:
+            return
+        profiler, self._profiler = self._profiler, None
+        profiler.stop()
+        if self.summary is None:
+            self.log(f"训练在性能分析窗口结束前停止(完成 {self._steps}/{self.total_steps} 步)，未生成结果\n")
+
+    def _on_trace_ready(self, profiler):
+        recorded = self._steps - self.wait - self.warmup
+        if recorded <= 0:
+            return
+        first = self._first_step + self.wait + self.warmup + 1
+        span = f"{first}-{first + recorded - 1}"
+        self.trace_path = os.path.join(self.output_dir, f"trace_steps_{span}.json")
+        self.table_path = os.path.join(self.output_dir, f"operators_steps_{span}.txt")
+        profiler.export_chrome_trace(self.trace_path)
+
+        averages = profiler.key_averages()
+        device = "cuda" if self.use_cuda else "cpu"
+        with open(self.table_path, 'w', encoding='utf-8') as f:
+            f.write(f"训练步 {span}，按自身{device.upper()}耗时排序\n")
+            f.write(averages.table(sort_by=f"self_{device}_time_total", row_limit=TOP_OPERATORS))
+            f.write(f"\n\n训练步 {span}，按自身{device.upper()}内存分配排序\n")
+            f.write(averages.table(sort_by=f"self_{device}_memory_usage", row_limit=TOP_OPERATORS))
+            f.write("\n")
+
+        self.summary = self._summarize(averages, recorded)
+        self.log(self.summary)
+        self.log(f"性能分析结果: {self.trace_path}\n算子表: {self.table_path}\n")
+
+    def _summarize(self, averages, recorded):
+        timer = _self_device_time if self.use_cuda else (lambda event: event.self_cpu_time_total)
+        # ProfilerStep#N 是每步的外层标记，其自身耗时是不在任何算子内的时间，不参与排名
+        events = [event for event in averages if timer(event) > 0 and not event.key.startswith("ProfilerStep")]
+        total = sum(timer(event) for event in events)
+        lines = []
+        if self._record_start is not None and self._record_end is not None and recorded:
+            per_step = (self._record_end - self._record_start) / recorded
+            lines.append(f"性能分析: 记录 {recorded} 步，平均每步 {per_step * 1000:.1f} ms\n")
+        else:
+            lines.append(f"性能分析: 记录 {recorded} 步\n")
+        if total > 0:
+            label = "GPU" if self.use_cuda else "CPU"
+            lines.append(f"自身{label}耗时最多的算子:\n")
+            for event in sorted(events, key=timer, reverse=True)[:SUMMARY_OPERATORS]:
+                lines.append(f"  {event.key}: {timer(event) / 1000:.1f} ms ({timer(event) / total:.1%}，"
+                             f"调用 {event.count} 次)\n")
+        if self.use_cuda:
+            import torch
+
+            lines.append(f"GPU峰值已分配显存: {torch.cuda.max_memory_allocated() / (1 << 30):.2f} GB\n")
+        return "".join(lines)
@@ -0,0 +1,161 @@
+"""界面启动计时、导入耗时统计和后台预加载
+
+ImportTimer  类似 python -X importtime: 记录每次导入语句新加载模块所用的时间(累计和自身)，
+             设置环境变量 FINETUNE_IMPORT_TIME=1 或以 --import-time 启动界面时开启
+Prewarm      窗口显示后在后台线程中依次导入matplotlib和训练用的库并探测设备，
+             第一次点击"开始训练"时不再等待导入；训练线程先wait()，避免与预加载同时导入同一组模块
+"""
+import builtins
+import os
+import sys
+import threading
+import time
+
+# 按顺序预加载；unsloth需在transformers、peft、trl之前导入才能完成补丁
+ML_MODULES = ("torch", "unsloth", "transformers", "peft", "trl", "datasets")
+PLOT_MODULES = ("matplotlib.figure", "matplotlib.backends.backend_tkagg")
+
+
+def import_time_enabled(argv=None):
+    argv = sys.argv if argv is None else argv
+    return "--import-time" in argv or os.environ.get("FINETUNE_IMPORT_TIME", "") not in ("", "0")
+
+
+class ImportTimer:
+    """包装 builtins.__import__，只记录加载了新模块的导入语句
+
+    通过 importlib.import_module 进行的导入不单独记录，其耗时计入外层导入语句。
+    """
+
+    def __init__(self):
+        self.records = []  # (线程名, 嵌套深度, 模块名, 累计秒数, 自身秒数)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._original = None
+
+    def install(self):
+        if self._original is None:
+            self._original = builtins.__import__
+            builtins.__import__ = self._import
+        return self
+
+    def uninstall(self):
+        if self._original is not None:
+            builtins.__import__ = self._original
+            self._original = None
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        loaded = len(sys.modules)
+        # 栈中保存子导入的累计耗时，用于计算自身耗时
+        stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            return self._original(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - start
+            children = stack.pop()
+            if len(sys.modules) != loaded:
+                if stack:
+                    stack[-1] += elapsed
+                if level and globals and globals.get("__package__"):
+                    # 相对导入记录为完整模块名
+                    name = f"{globals['__package__'].rsplit('.', level - 1)[0]}.{name}" if name else globals["__package__"]
+                with self._lock:
+                    self.records.append((threading.current_thread().name, len(stack), name, elapsed, elapsed - children))
+
+    def summary(self, top=15):
+        """按累计耗时列出顶层导入，再按自身耗时列出最慢的模块"""
+        with self._lock:
+            records = list(self.records)
+        if not records:
+            return ""
+        lines = ["导入耗时(累计):\n"]
+        for thread, depth, name, total, _ in sorted(
+                (r for r in records if r[1] == 0), key=lambda r: r[3], reverse=True)[:top]:
+            lines.append(f"  {total * 1000:8.1f} ms  {name}  [{thread}]\n")
+        lines.append("导入耗时(自身):\n")
+        for thread, depth, name, _, own in sorted(records, key=lambda r: r[4], reverse=True)[:top]:
+            lines.append(f"  {own * 1000:8.1f} ms  {name}  [{thread}]\n")
+        return "".join(lines)
+
+
+def probe_device():
+    """返回设备描述；有GPU时初始化CUDA上下文，第一个训练步不必再等待"""
+    import torch
+
+    if not torch.cuda.is_available():
+        return "CPU(未检测到CUDA)"
+    torch.cuda.init()
+    props = torch.cuda.get_device_properties(0)
+    return f"{props.name}, {props.total_memory / (1 << 30):.1f} GB, 共 {torch.cuda.device_count()} 块GPU"
+
+
+def _import(name):
+    def run():
+        try:
+            __import__(name)
+        except ImportError:
+            return "未安装"
+        return None
+    return run
+
+
+class Prewarm:
+    """在后台线程中依次执行预加载步骤
+
+    steps: [(名称, 函数)]，函数返回的字符串写入日志；ImportError以外的异常只记录，不中断后续步骤。
+    on_step: 每完成一个步骤后调用 on_step(名称)，可用于在matplotlib导入后创建图表
+    on_done: 全部步骤结束后调用
+    """
+
+    def __init__(self, steps, log=None, on_step=None, on_done=None):
+        self.steps = list(steps)
+        self.log = log or (lambda message: None)
+        self.on_step = on_step or (lambda name: None)
+        self.on_done = on_done or (lambda: None)
+        self.timings = []
+        self._done = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def for_gui(cls, log=None, on_step=None, on_done=None):
+        steps = [(name, _import(name)) for name in PLOT_MODULES + ML_MODULES]
+        steps.append(("设备", probe_device))
+        return cls(steps, log=log, on_step=on_step, on_done=on_done)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="prewarm", daemon=True)
+        self._thread.start()
+        return self
+
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """等待预加载结束，未启动时立即返回"""
+        if self._thread is None:
+            return True
+        return self._done.wait(timeout)
+
+    def _run(self):
+        start = time.perf_counter()
+        try:
+            for name, step in self.steps:
+                step_start = time.perf_counter()
+                try:
+                    note = step()
+                except Exception as e:
+                    note = f"失败: {e}"
+                elapsed = time.perf_counter() - step_start
+                self.timings.append((name, elapsed))
+                if note:
+                    self.log(f"预加载 {name}: {note}\n")
+                self.on_step(name)
+        finally:
+            self._done.set()
+        parts = ", ".join(f"{name} {seconds:.1f}s" for name, seconds in self.timings if seconds >= 0.05)
+        self.log(f"后台预加载完成，耗时 {time.perf_counter() - start:.1f} 秒({parts})\n")
+        self.on_done()
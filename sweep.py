@@ -0,0 +1,339 @@
+"""超参数搜索: 异步逐次减半(ASHA)提前淘汰
+
+在搜索空间中随机采样 --trials 组配置，依次训练。每组配置都按 --max-steps 的完整预算设置
+(学习率调度按完整步数计算，提前停止不改变前面各步的学习率)，训练到梯级步数
+min_steps、min_steps*eta、min_steps*eta^2 ... 时，用最近 --window 步训练loss的均值与此前所有
+到达同一梯级的配置比较: 排在前 1/eta(向上取整)的继续训练到下一梯级，其余立即停止。
+每个配置到达梯级时立即判断，不等待同一批的其他配置；代价是最先运行的几组在样本很少时容易通过。
+
+结果写入输出目录:
+    trials.jsonl        每组配置结束后追加一行(参数、各梯级loss、状态、训练步数)，
+                        中断后重新运行或增大 --trials 时跳过已完成的配置
+    leaderboard.json    按到达的梯级和loss排序的排行榜
+    best_config.json    最佳配置的完整训练配置，可直接用于 python -m train_engine --config 或任务队列
+    trial_<n>/          每组配置的保存目录和训练日志；试验不写中间检查点，
+                        只有最佳配置保留训练完成后的 final_model
+
+用法:
+    python -m sweep --config training_config.json --trials 20 --min-steps 20 --max-steps 540
+    python -m sweep --config training_config.json --space space.json --eta 3 --output ./sweep
+
+搜索空间为JSON，每个配置项取 choice / uniform / log_uniform 之一，默认:
+    {"learning_rate": {"log_uniform": [1e-5, 5e-4]}, "lora_rank": {"choice": [8, 16, 32, 64]},
+     "weight_decay": {"uniform": [0.0, 0.1]}, "lr_scheduler": {"choice": ["linear", "cosine", "constant"]}}
+"""
+import argparse
+import gc
+import hashlib
+import json
+import math
+import os
+import random
+import shutil
+import sys
+import time
+from collections import deque
+
+from log_bus import LogBus
+from train_engine import DEFAULT_CONFIG, FINAL_MODEL_DIR, TrainingEngine, load_config, normalize_config, parse_overrides
+
+DEFAULT_SPACE = {
+    "learning_rate": {"log_uniform": [1e-5, 5e-4]},
+    "lora_rank": {"choice": [8, 16, 32, 64]},
+    "weight_decay": {"uniform": [0.0, 0.1]},
+    "lr_scheduler": {"choice": ["linear", "cosine", "constant"]},
+}
+SPACE_KINDS = ("choice", "uniform", "log_uniform")
+# 搜索时固定的配置项: 每组配置从头训练，不写中间检查点(只在训练完成后保存最终模型)，
+# 不开启性能分析和指标端口
+TRIAL_OVERRIDES = {"auto_resume": False, "save_checkpoints": False, "profile": False, "metrics_port": "0"}
+
+
+def _print_log(message):
+    sys.stdout.write(message)
+    sys.stdout.flush()
+
+
+def check_space(space):
+    """检查搜索空间格式，参数无效时抛出ValueError"""
+    if not isinstance(space, dict) or not space:
+        raise ValueError("搜索空间必须是非空的JSON对象")
+    for key, spec in space.items():
+        if key not in DEFAULT_CONFIG:
+            raise ValueError(f"未知的配置项: {key}")
+        if not isinstance(spec, dict) or len(spec) != 1 or next(iter(spec)) not in SPACE_KINDS:
+            raise ValueError(f"{key}: 取值范围必须是 choice、uniform 或 log_uniform 之一")
+        kind, values = next(iter(spec.items()))
+        if not isinstance(values, list) or not values:
+            raise ValueError(f"{key}: {kind} 需要一个非空列表")
+        if kind != "choice":
+            if len(values) != 2 or not values[0] <= values[1]:
+                raise ValueError(f"{key}: {kind} 需要 [下限, 上限]")
+            if kind == "log_uniform" and values[0] <= 0:
+                raise ValueError(f"{key}: log_uniform 的下限必须大于0")
+    return space
+
+
+def sample(space, rng):
+    """按搜索空间随机取一组参数，连续值保留3位有效数字"""
+    params = {}
+    for key, spec in space.items():
+        kind, values = next(iter(spec.items()))
+        if kind == "choice":
+            params[key] = rng.choice(values)
+        elif kind == "uniform":
+            params[key] = float(f"{rng.uniform(values[0], values[1]):.3g}")
+        else:
+            low, high = math.log(values[0]), math.log(values[1])
+            params[key] = float(f"{math.exp(rng.uniform(low, high)):.3g}")
+    return params
+
+
+def rung_steps(min_steps, max_steps, eta):
+    """梯级步数: min_steps * eta^k，最后一级为max_steps"""
+    steps = []
+    step = min_steps
+    while step < max_steps:
+        steps.append(step)
+        step *= eta
+    steps.append(max_steps)
+    return steps
+
+
+class SuccessiveHalving:
+    """记录每个梯级上已到达配置的loss，判断新到达的配置能否继续"""
+
+    def __init__(self, rungs, eta):
+        self.rungs = rungs
+        self.eta = eta
+        self.records = {step: [] for step in rungs}
+
+    def report(self, step, value):
+        """记录loss，返回是否继续训练；最后一级只记录"""
+        values = self.records[step]
+        values.append(value)
+        if step == self.rungs[-1]:
+            return True
+        keep = math.ceil(len(values) / self.eta)
+        return value <= sorted(values)[keep - 1]
+
+
+def sweep_id(config, space, args):
+    """搜索设置的标识，输出目录中已有的结果只在设置相同时复用"""
+    base = {key: config[key] for key in sorted(config) if key not in space and key != "save_path"}
+    # 不含配置数: 配置按同一个随机序列依次采样，增大--trials后重新运行会接着搜索
+    parts = [base, space, args.min_steps, args.max_steps, args.eta, args.window, args.seed]
+    return hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:16]
+
+
+def load_finished(path, identifier):
+    """读取已完成的配置，按试验编号返回"""
+    finished = {}
+    if not os.path.exists(path):
+        return finished
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            trial = json.loads(line)
+            if trial.get("sweep") != identifier:
+                raise ValueError(f"{path} 属于另一组搜索设置，请换一个输出目录")
+            finished[trial["trial"]] = trial
+    return finished
+
+
+def run_trial(config, pruner, window, echo=None):
+    """训练一组配置，到达梯级时交给pruner判断，返回试验记录"""
+    recent = deque(maxlen=window)
+    rungs = {}
+    state = {"step": 0, "pruned": False}
+    engine = None
+
+    def on_metrics(step, loss, lr):
+        state["step"] = step
+        recent.append(loss if math.isfinite(loss) else float('inf'))
+        if step in pruner.records and step not in rungs:
+            value = sum(recent) / len(recent)
+            rungs[step] = value
+            if not pruner.report(step, value):
+                state["pruned"] = True
+                engine.stop()
+
+    log_bus = LogBus(echo=echo, use_queue=False)
+    start = time.perf_counter()
+    try:
+        engine = TrainingEngine(config, log=log_bus.write, on_metrics=on_metrics)
+        log_bus.open_run_log(engine.config["save_path"])
+        result = engine.run()
+        status = "pruned" if state["pruned"] else result["status"]
+        error = None
+    except Exception as e:
+        status, error = "failed", str(e)
+        log_bus.write(f"训练出错: {error}\n")
+    finally:
+        log_bus.close_run_log()
+        engine = None
+        gc.collect()
+        try:
+            import torch
+
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        except ImportError:
+            pass
+    return {
+        "status": status,
+        "rungs": {str(step): value for step, value in rungs.items()},
+        "steps": state["step"],
+        "seconds": round(time.perf_counter() - start, 1),
+        "error": error,
+    }
+
+
+def leaderboard(trials, rungs):
+    """到达的梯级越高越靠前，同一梯级按该梯级的loss排序；失败的配置排在最后"""
+    def key(trial):
+        reached = [step for step in rungs if str(step) in trial["rungs"]]
+        if trial["status"] == "failed" or not reached:
+            return (1, 0, float('inf'), trial["trial"])
+        return (0, -len(reached), trial["rungs"][str(reached[-1])], trial["trial"])
+    return sorted(trials, key=key)
+
+
+def format_leaderboard(board, space, rungs):
+    names = list(space)
+    columns = [f"{'#':>3}", f"{'试验':>4}"] + [f"{name:>14}" for name in names] + \
+        [f"{f'loss@{step}':>11}" for step in rungs] + [f"{'步数':>6}", " 状态"]
+    lines = [" ".join(columns)]
+    for rank, trial in enumerate(board, 1):
+        columns = [f"{rank:>3}", f"{trial['trial']:>4}"] + [f"{str(trial['params'][name]):>14}" for name in names]
+        columns += [f"{trial['rungs'][str(step)]:>11.4f}" if str(step) in trial["rungs"] else f"{'-':>11}"
+                    for step in rungs]
+        columns += [f"{trial['steps']:>6}", f" {trial['status']}"]
+        lines.append(" ".join(columns))
+    return "\n".join(lines)
+
+
+def sweep(config, space, args, log=None, echo=None):
+    """运行搜索，返回 (排行榜, 最佳配置)"""
+    log = log or _print_log
+    rungs = rung_steps(args.min_steps, args.max_steps, args.eta)
+    output = os.path.abspath(args.output)
+    os.makedirs(output, exist_ok=True)
+    identifier = sweep_id(config, space, args)
+    trials_path = os.path.join(output, "trials.jsonl")
+    finished = load_finished(trials_path, identifier)
+
+    rng = random.Random(args.seed)
+    candidates = [sample(space, rng) for _ in range(args.trials)]
+    pruner = SuccessiveHalving(rungs, args.eta)
+    log(f"超参数搜索: {args.trials} 组配置，梯级 {rungs}，每级保留前 1/{args.eta}\n")
+    if finished:
+        log(f"复用 {len(finished)} 组已完成的配置: {trials_path}\n")
+
+    trials = []
+    for index, params in enumerate(candidates, 1):
+        if index in finished:
+            trial = finished[index]
+            # 按原来的顺序恢复各梯级的记录，后续配置的判断与未中断时相同
+            for step in rungs:
+                if str(step) in trial["rungs"]:
+                    pruner.report(step, trial["rungs"][str(step)])
+            trials.append(trial)
+            continue
+        trial_config = dict(config)
+        trial_config.update(TRIAL_OVERRIDES)
+        trial_config.update({key: str(value) for key, value in params.items()})
+        trial_config["max_steps"] = str(args.max_steps)
+        trial_config["save_path"] = os.path.join(output, f"trial_{index:03d}")
+        log(f"[{index}/{args.trials}] " + ", ".join(f"{key}={value}" for key, value in params.items()) + "\n")
+
+        record = run_trial(trial_config, pruner, args.window, echo=echo)
+        trial = {"sweep": identifier, "trial": index, "params": params, "save_path": trial_config["save_path"]}
+        trial.update(record)
+        with open(trials_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(trial, ensure_ascii=False) + "\n")
+        trials.append(trial)
+
+        losses = ", ".join(f"{step}步 {value:.4f}" for step, value in trial["rungs"].items())
+        message = f"    {trial['status']}，训练 {trial['steps']} 步，{trial['seconds']:.0f} 秒" + (f"，loss: {losses}" if losses else "")
+        if trial["error"]:
+            message += f"，错误: {trial['error']}"
+        log(message + "\n")
+
+    board = leaderboard(trials, rungs)
+    trained = sum(trial["steps"] for trial in trials)
+    full = args.max_steps * len(trials)
+    log(format_leaderboard(board, space, rungs) + "\n")
+    log(f"共训练 {trained} 步，完整训练全部配置需要 {full} 步，节省 {1 - trained / full:.0%}\n")
+
+    best = None
+    if board and board[0]["status"] != "failed" and board[0]["rungs"]:
+        best = dict(config)
+        best.update({key: str(value) for key, value in board[0]["params"].items()})
+        best["max_steps"] = str(args.max_steps)
+        with open(os.path.join(output, "best_config.json"), 'w', encoding='utf-8') as f:
+            json.dump(best, f, indent=2, ensure_ascii=False)
+        log(f"最佳配置: 试验 {board[0]['trial']}(模型保存在 {board[0]['save_path']})，"
+            f"配置已写入 {os.path.join(output, 'best_config.json')}\n")
+        # 只保留最佳配置的最终模型
+        for trial in board[1:]:
+            shutil.rmtree(os.path.join(trial["save_path"], FINAL_MODEL_DIR), ignore_errors=True)
+    with open(os.path.join(output, "leaderboard.json"), 'w', encoding='utf-8') as f:
+        json.dump({"rungs": rungs, "eta": args.eta, "trials": board}, f, indent=2, ensure_ascii=False)
+    return board, best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m sweep", description="超参数搜索(ASHA提前淘汰)")
+    parser.add_argument("--config", help="基础配置文件(与GUI导出的training_config.json格式相同)")
+    parser.add_argument("--data", help="训练数据文件，覆盖配置中的data_path")
+    parser.add_argument("--set", action="append", metavar="KEY=VALUE", help="覆盖基础配置项，可重复使用")
+    parser.add_argument("--space", help="搜索空间JSON文件，默认搜索学习率、LoRA rank、权重衰减和学习率调度")
+    parser.add_argument("--output", default="./sweep", help="输出目录")
+    parser.add_argument("--trials", type=int, default=20, help="采样的配置数")
+    parser.add_argument("--min-steps", type=int, default=20, help="第一级的训练步数")
+    parser.add_argument("--max-steps", type=int, default=540, help="完整训练的步数")
+    parser.add_argument("--eta", type=int, default=3, help="每级保留前 1/eta，下一级步数为上一级的eta倍")
+    parser.add_argument("--window", type=int, default=10, help="取梯级前多少步训练loss的均值")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="同时输出每组配置的训练日志")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.trials <= 0 or args.min_steps <= 0 or args.window <= 0:
+            raise ValueError("--trials、--min-steps和--window必须大于0")
+        if args.eta < 2:
+            raise ValueError("--eta必须不小于2")
+        if args.max_steps < args.min_steps:
+            raise ValueError("--max-steps不能小于--min-steps")
+        config = load_config(args.config) if args.config else dict(DEFAULT_CONFIG)
+        config.update(parse_overrides(args.set))
+        if args.data:
+            config["data_path"] = args.data
+        if args.space:
+            with open(args.space, 'r', encoding='utf-8') as f:
+                space = json.load(f)
+        else:
+            space = DEFAULT_SPACE
+        check_space(space)
+        if not normalize_config(config)["use_lora"]:
+            space = {key: spec for key, spec in space.items() if key != "lora_rank"}
+        # 用采样到的一组参数检查搜索空间的取值
+        normalize_config(dict(config, **sample(space, random.Random(args.seed))))
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    try:
+        board, best = sweep(config, space, args, echo=sys.stdout if args.verbose else None)
+    except ValueError as e:
+        parser.error(str(e))
+    except KeyboardInterrupt:
+        _print_log("搜索被用户中断，已完成的配置保存在 trials.jsonl 中，重新运行会继续\n")
+        return 130
+    return 0 if best is not None else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,34 @@
+import json
+
+import pytest
+
+from data_stream import detect_format, iter_records
+
+RECORDS = [
+    {"instruction": "你好" * 50, "output": "世界"},
+    {"instruction": "a, ]} \"[", "output": ""},
+    {"instruction": "x" * 300, "output": "y", "nested": [1, {"k": "v"}]},
+]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 64, 1 << 20])
+def test_json_array_is_parsed_across_chunk_boundaries(tmp_path, chunk_size):
+    path = tmp_path / "data.json"
+    # BOM、缩进和多字节字符都可能落在块边界上
+    path.write_bytes(b"\xef\xbb\xbf" + json.dumps(RECORDS, ensure_ascii=False, indent=2).encode("utf-8"))
+    assert detect_format(str(path)) == "json"
+    assert list(iter_records(str(path), chunk_size=chunk_size)) == RECORDS
+
+
+def test_empty_json_array(tmp_path):
+    path = tmp_path / "empty.json"
+    path.write_text(" [ ] ", encoding="utf-8")
+    assert list(iter_records(str(path))) == []
+
+
+@pytest.mark.parametrize("text", ['[{"a": 1}, {"a": 2}', '[{"a": 1}, x]', '[{"a": 1}, {"a": ]'])
+def test_malformed_json_array_raises(tmp_path, text):
+    path = tmp_path / "bad.json"
+    path.write_text(text, encoding="utf-8")
+    with pytest.raises(ValueError):
+        list(iter_records(str(path), chunk_size=4))
@@ -0,0 +1,22 @@
+import numpy as np
+import pytest
+
+from dedup import deduplicate
+
+datasets = pytest.importorskip("datasets")
+
+
+def test_near_duplicates_are_removed():
+    rng = np.random.default_rng(0)
+    base = rng.integers(0, 50000, size=200).tolist()
+    near = list(base)
+    near[100] = 50001  # 只改一个token，Jaccard相似度约0.95
+    rows = [rng.integers(0, 50000, size=200).tolist() for _ in range(5)]
+    dataset = datasets.Dataset.from_dict({"input_ids": [base] + rows[:2] + [near] + rows[2:] + [list(base)]})
+
+    deduped, stats = deduplicate(dataset, threshold=0.8)
+
+    # 保留下标最小的一条，近似重复和完全重复都被删除
+    assert stats["removed"] == 2
+    assert stats["saved_tokens"] == 400
+    assert deduped["input_ids"] == [base] + rows
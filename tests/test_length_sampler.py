@@ -0,0 +1,29 @@
+import numpy as np
+
+from length_sampler import TokenBudgetBatchSampler
+
+
+def _check(sampler, lengths, max_tokens):
+    batches = sampler.batches()
+    assert sorted(i for batch in batches for i in batch) == list(range(len(lengths)))
+    for batch in batches:
+        # 批内按最长样本补齐，单条超出预算的样本单独成批
+        assert len(batch) == 1 or len(batch) * max(lengths[i] for i in batch) <= max_tokens
+
+
+def test_token_budget_never_exceeded():
+    lengths = np.random.default_rng(0).integers(1, 300, size=1000).tolist() + [500]
+    for shuffle in (True, False):
+        sampler = TokenBudgetBatchSampler(lengths, max_tokens=400, shuffle=shuffle, seed=3, bucket_size=64)
+        _check(sampler, lengths, 400)
+
+
+def test_epochs_reshuffle_and_cover_every_index():
+    lengths = list(range(1, 201))
+    sampler = TokenBudgetBatchSampler(lengths, max_tokens=256, seed=1)
+    first = [list(batch) for batch in sampler]
+    sampler.set_epoch(1)
+    second = [list(batch) for batch in sampler]
+    assert first != second
+    _check(sampler, lengths, 256)
+    assert len(sampler) == len(second)
@@ -0,0 +1,56 @@
+import json
+import os
+
+import pytest
+
+from model_index import ModelIndex
+
+torch = pytest.importorskip("torch")
+safetensors_torch = pytest.importorskip("safetensors.torch")
+
+
+def _write_json(path, data):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+
+
+def _base_model(path):
+    os.makedirs(path)
+    _write_json(os.path.join(path, "config.json"), {"architectures": ["LlamaForCausalLM"], "model_type": "llama"})
+    safetensors_torch.save_file({
+        "model.embed_tokens.weight": torch.zeros(16, 4),
+        "lm_head.weight": torch.zeros(16, 4),
+    }, os.path.join(path, "model.safetensors"))
+
+
+def test_adapter_only_export_is_indexed(tmp_path):
+    base = str(tmp_path / "base")
+    _base_model(base)
+    root = tmp_path / "models"
+    export = root / "output" / "exported_model"
+    epoch = root / "output" / "epoch_2"
+    for path in (export, epoch):
+        os.makedirs(path)
+        _write_json(os.path.join(path, "adapter_config.json"), {"base_model_name_or_path": base, "r": 8})
+    _write_json(os.path.join(export, "training_config.json"), {"base_model": base, "lora_rank": "8"})
+
+    records = {record["name"]: record for record in ModelIndex(str(root)).refresh(save=False)}
+
+    assert set(records) == {"exported_model", "epoch_2"}
+    for record in records.values():
+        assert record["base_model"] == base
+        assert record["architecture"] == "LlamaForCausalLM"
+        assert record["params"] == 128
+    assert records["exported_model"]["train_config"]["lora_rank"] == "8"
+
+
+def test_adapter_with_missing_base_model(tmp_path):
+    export = tmp_path / "exported_model"
+    os.makedirs(export)
+    _write_json(os.path.join(export, "adapter_config.json"), {"base_model_name_or_path": str(tmp_path / "gone")})
+
+    records = ModelIndex(str(tmp_path)).refresh(save=False)
+
+    assert len(records) == 1
+    assert records[0]["architecture"] == "未知"
+    assert records[0]["params"] is None
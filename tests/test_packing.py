@@ -0,0 +1,25 @@
+from packing import first_fit_decreasing, pack_examples
+
+
+def test_first_fit_decreasing_respects_capacity():
+    lengths = [7, 5, 4, 3, 3, 2, 1, 8]
+    bins = first_fit_decreasing(lengths, 8)
+    assert sorted(i for members in bins for i in members) == list(range(len(lengths)))
+    assert all(sum(lengths[i] for i in members) <= 8 for members in bins)
+    assert len(bins) == 5
+    assert first_fit_decreasing([], 8) == []
+
+
+def test_pack_examples_marks_sample_boundaries():
+    batch = {"input_ids": [[1, 2, 3], [4, 5], [6, 7, 8, 9, 10, 11]]}
+    packed = pack_examples(batch, max_length=6, eos_token_id=0)
+    for input_ids, position_ids, cu_seqlens in zip(packed["input_ids"], packed["position_ids"], packed["cu_seqlens"]):
+        assert len(input_ids) <= 6
+        assert cu_seqlens[0] == 0 and cu_seqlens[-1] == len(input_ids)
+        # 每个样本的位置编号从0重新开始
+        for start, end in zip(cu_seqlens[:-1], cu_seqlens[1:]):
+            assert position_ids[start:end] == list(range(end - start))
+    # 超过max_length的样本切成多段，不丢token；每个原始样本末尾补一个eos
+    tokens = [t for ids in packed["input_ids"] for t in ids]
+    assert sorted(t for t in tokens if t) == list(range(1, 12))
+    assert tokens.count(0) == 3
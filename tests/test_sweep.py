@@ -0,0 +1,25 @@
+from sweep import SuccessiveHalving, rung_steps
+
+
+def test_rung_steps():
+    assert rung_steps(20, 540, 3) == [20, 60, 180, 540]
+    assert rung_steps(20, 500, 3) == [20, 60, 180, 500]
+    assert rung_steps(100, 100, 3) == [100]
+
+
+def test_successive_halving_keeps_top_fraction():
+    pruner = SuccessiveHalving([10, 30], eta=3)
+    # 每个梯级保留已到达配置中的前 ceil(n/eta) 名
+    assert pruner.report(10, 2.0)
+    assert not pruner.report(10, 3.0)
+    assert pruner.report(10, 1.0)
+    assert not pruner.report(10, 2.5)
+    assert pruner.report(10, 1.5)
+    assert pruner.records[10] == [2.0, 3.0, 1.0, 2.5, 1.5]
+
+
+def test_last_rung_only_records():
+    pruner = SuccessiveHalving([10, 30], eta=3)
+    assert pruner.report(30, 1.0)
+    assert pruner.report(30, 5.0)
+    assert pruner.records[30] == [1.0, 5.0]
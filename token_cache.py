@@ -0,0 +1,198 @@
+"""分词结果的磁盘缓存，按数据内容、tokenizer、最大长度、打包方式、模板和去重阈值复用
+
+缓存条目是datasets的save_to_disk目录，加载时以内存映射方式读取；
+总大小超过上限时按最近使用时间淘汰。
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+# 缓存格式版本，分词或打包逻辑变化时递增使旧缓存失效
+CACHE_VERSION = 2
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "unsloth_gui", "tokenized")
+
+_LAST_USED_FILE = ".last_used"
+_HASH_INDEX_FILE = "file_hashes.json"
+_lock = threading.Lock()
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    """计算文件内容的SHA-256"""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def tokenizer_fingerprint(tokenizer):
+    """根据词表、特殊token和对话模板标识tokenizer"""
+    h = hashlib.sha256()
+    h.update(type(tokenizer).__name__.encode('utf-8'))
+    backend = getattr(tokenizer, "backend_tokenizer", None)
+    if backend is not None:
+        h.update(backend.to_str().encode('utf-8'))
+    else:
+        h.update(json.dumps(tokenizer.get_vocab(), sort_keys=True).encode('utf-8'))
+    h.update(json.dumps(tokenizer.special_tokens_map, sort_keys=True, default=str).encode('utf-8'))
+    h.update(str(getattr(tokenizer, "chat_template", None)).encode('utf-8'))
+    h.update(str(getattr(tokenizer, "padding_side", None)).encode('utf-8'))
+    return h.hexdigest()
+
+
+def _dir_size(path):
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, name))
+            except OSError:
+                pass
+    return total
+
+
+class TokenizationCache:
+    """内容寻址的分词缓存目录"""
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=20 * (1 << 30)):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def data_hash(self, path):
+        """返回数据文件的内容哈希，文件未变化(大小和修改时间相同)时复用上次结果"""
+        stat = os.stat(path)
+        stamp = f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}"
+        index_path = os.path.join(self.cache_dir, _HASH_INDEX_FILE)
+        with _lock:
+            try:
+                with open(index_path, 'r', encoding='utf-8') as f:
+                    index = json.load(f)
+            except (OSError, ValueError):
+                index = {}
+            if stamp in index:
+                return index[stamp]
+        digest = file_sha256(path)
+        with _lock:
+            index[stamp] = digest
+            tmp_path = index_path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(index, f)
+            os.replace(tmp_path, index_path)
+        return digest
+
+    def make_key(self, data_hash, tokenizer, max_length, packing, template, dedup_threshold=0):
+        """组合缓存键，dedup_threshold为0表示不去重"""
+        parts = {
+            "version": CACHE_VERSION,
+            "data": data_hash,
+            "tokenizer": tokenizer_fingerprint(tokenizer),
+            "max_length": int(max_length),
+            "packing": bool(packing),
+            "template": template,
+        }
+        if dedup_threshold:
+            parts["dedup"] = float(dedup_threshold)
+        return hashlib.sha256(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()[:32]
+
+    def entry_path(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def _touch(self, path):
+        with open(os.path.join(path, _LAST_USED_FILE), 'w') as f:
+            f.write(str(time.time()))
+
+    def load(self, key):
+        """命中时返回内存映射的数据集，否则返回None"""
+        from datasets import load_from_disk
+
+        path = self.entry_path(key)
+        if not os.path.isdir(path) or not os.path.exists(os.path.join(path, "dataset_info.json")):
+            return None
+        self._touch(path)
+        return load_from_disk(path)
+
+    def store(self, key, dataset):
+        """写入缓存并按大小淘汰旧条目，返回从缓存重新加载的数据集"""
+        from datasets import load_from_disk
+
+        path = self.entry_path(key)
+        tmp_path = path + ".tmp"
+        if os.path.exists(tmp_path):
+            shutil.rmtree(tmp_path)
+        dataset.save_to_disk(tmp_path)
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.replace(tmp_path, path)
+        self._touch(path)
+        self.evict(keep=key)
+        return load_from_disk(path)
+
+    def entries(self):
+        """列出缓存条目 (最近使用时间, 大小, 路径)"""
+        result = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if not os.path.isdir(path) or name.endswith(".tmp"):
+                continue
+            marker = os.path.join(path, _LAST_USED_FILE)
+            last_used = os.path.getmtime(marker) if os.path.exists(marker) else os.path.getmtime(path)
+            result.append((last_used, _dir_size(path), path))
+        return result
+
+    def evict(self, keep=None):
+        """按最近最少使用淘汰条目，直到总大小不超过上限，返回被删除的条目数"""
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        keep_path = self.entry_path(keep) if keep else None
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep_path:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            removed += 1
+        return removed
+
+
+def tokenize_texts(dataset, tokenizer, max_length=None, num_proc=None):
+    """批量分词 "text" 列，max_length为None时不截断"""
+    def tokenize(batch):
+        return tokenizer(batch["text"], truncation=max_length is not None, max_length=max_length)
+
+    return dataset.map(
+        tokenize,
+        batched=True,
+        num_proc=num_proc,
+        remove_columns=dataset.column_names,
+        desc="分词",
+    )
+
+
+def tokenize_dataset(dataset, tokenizer, max_length, packing=False, num_proc=1, dedup_threshold=0, log=None):
+    """批量分词，打包时用first-fit-decreasing把样本装入max_length长度的序列(见packing.py)
+
+    dedup_threshold大于0时在打包前删除Jaccard相似度不低于该值的近似重复样本(见dedup.py)
+    """
+    num_proc = num_proc if num_proc and num_proc > 1 else None
+    # 打包时不截断，超长样本由打包切分
+    tokenized = tokenize_texts(dataset, tokenizer, None if packing else max_length, num_proc=num_proc)
+    if dedup_threshold:
+        from dedup import deduplicate, format_stats
+
+        tokenized, stats = deduplicate(tokenized, dedup_threshold, num_proc=num_proc, log=log)
+        if log is not None:
+            log(format_stats(stats) + "\n")
+    if packing:
+        from packing import pack_dataset
+
+        tokenized = pack_dataset(tokenized, max_length, tokenizer.eos_token_id, num_proc=num_proc)
+    return tokenized
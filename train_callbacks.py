@@ -0,0 +1,236 @@
+"""训练回调，在单次trainer.train()中处理进度、早停和模型保存
+
+本模块在导入时加载transformers，只应在训练开始时由train_engine延迟导入。
+"""
+import math
+import os
+import time
+
+from transformers import TrainerCallback
+
+from train_engine import FINAL_MODEL_DIR, write_engine_state
+
+
+class EpochCallback(TrainerCallback):
+    """按epoch汇总loss，负责进度汇报、早停、最佳模型和每个epoch的保存"""
+
+    def __init__(self, engine, patience=3):
+        self.engine = engine
+        self.patience = patience  # 早停耐心值
+        self.no_improve = 0  # 未改善次数
+        self.trainer = None
+        self.interrupted = False
+        self.paused = False
+        self.early_stopped = False
+        self.last_checkpoint = None
+        self._epoch_loss_sum = 0.0
+        self._epoch_loss_count = 0
+        self._last_lr = None
+        self._first_step_logged = False
+
+    def save(self, path):
+        """快照模型权重，由后台线程写入path(tokenizer以硬链接共享)"""
+        stall = self.engine.checkpoint_writer.submit(self.trainer.model, path)
+        self.engine.log(f"已创建检查点快照，训练暂停 {stall * 1000:.0f} ms\n")
+
+    def total_epochs(self, state):
+        """实际训练的轮数，设置了max_steps时由Trainer按步数换算"""
+        return state.num_train_epochs or self.engine.config["epochs"]
+
+    def on_epoch_begin(self, args, state, control, **kwargs):
+        self._epoch_loss_sum = 0.0
+        self._epoch_loss_count = 0
+        epoch = int(math.floor(state.epoch or 0)) + 1
+        self.engine.current_epoch = epoch
+        self.engine.log(f"\n开始训练 Epoch {epoch}/{self.total_epochs(state)}\n")
+
+    def on_log(self, args, state, control, logs=None, **kwargs):
+        if not logs:
+            return
+        if "learning_rate" in logs:
+            self._last_lr = logs["learning_rate"]
+        if "loss" in logs:
+            self._epoch_loss_sum += logs["loss"]
+            self._epoch_loss_count += 1
+            # 每个记录步都汇报loss和学习率，供曲线实时更新
+            self.engine.on_metrics(state.global_step, logs["loss"], logs.get("learning_rate"))
+            if not self.engine.active and not self.paused:
+                # on_metrics中请求的停止(如超参搜索剪枝)在本步生效，不再多训练一步
+                self.interrupted = True
+                control.should_training_stop = True
+                return control
+
+    def on_step_end(self, args, state, control, **kwargs):
+        if not self._first_step_logged:
+            # 包含导入、模型加载和数据准备，用于衡量启动开销
+            self._first_step_logged = True
+            self.engine.log(f"第一个训练步完成，距开始训练 {time.perf_counter() - self.engine.started_at:.1f} 秒\n")
+        if state.max_steps:
+            self.engine.on_progress(state.global_step / state.max_steps * 100)
+        if self.engine.pause_requested:
+            # 在当前step边界保存完整检查点(权重、优化器、调度器、随机数状态和进度)后停止
+            self.paused = True
+            control.should_save = True
+            control.should_training_stop = True
+        elif not self.engine.active:
+            self.interrupted = True
+            control.should_training_stop = True
+        return control
+
+    def on_save(self, args, state, control, **kwargs):
+        checkpoint = os.path.join(args.output_dir, f"checkpoint-{state.global_step}")
+        if not os.path.isdir(checkpoint):
+            return
+        # 记录早停状态和配置标识，继续训练时据此恢复
+        write_engine_state(checkpoint, {
+            "fingerprint": self.engine.fingerprint,
+            "global_step": state.global_step,
+            "max_steps": state.max_steps,
+            "best_loss": self.engine.best_loss,
+            "no_improve": self.no_improve,
+        })
+        self.last_checkpoint = checkpoint
+
+    def on_epoch_end(self, args, state, control, **kwargs):
+        if self.interrupted or self.paused:
+            return control
+        engine = self.engine
+        epochs = self.total_epochs(state)
+        epoch = engine.current_epoch
+        if not self._epoch_loss_count:
+            return control
+        loss = self._epoch_loss_sum / self._epoch_loss_count
+        lr = self._last_lr if self._last_lr is not None else engine.config["learning_rate"]
+        engine.log(f"Epoch {epoch}/{epochs}, Loss: {loss:.4f}, LR: {lr:.2e}\n")
+
+        save_checkpoints = engine.config["save_checkpoints"]
+        # 早停检查
+        if loss < engine.best_loss:
+            engine.best_loss = loss
+            self.no_improve = 0
+            # 保存最佳模型
+            if save_checkpoints:
+                best_model_path = os.path.join(engine.config["save_path"], "best_model")
+                self.save(best_model_path)
+                engine.log(f"发现更好的模型，正在保存到 {best_model_path}\n")
+        else:
+            self.no_improve += 1
+            if self.no_improve >= self.patience:
+                engine.log(f"训练loss连续{self.patience}个epoch未改善，触发早停机制\n")
+                self.early_stopped = True
+                control.should_training_stop = True
+                return control
+
+        # 保存当前epoch的模型
+        if save_checkpoints:
+            save_path = os.path.join(engine.config["save_path"], f"epoch_{epoch}")
+            self.save(save_path)
+            engine.log(f"Epoch {epoch} 完成，模型正在保存到 {save_path}\n")
+        return control
+
+    def on_train_end(self, args, state, control, **kwargs):
+        if self.engine.config["save_checkpoints"] or self.interrupted or self.paused:
+            return
+        # 不保存中间检查点时(如超参数搜索的试验)，只在训练正常结束后保存一次最终模型
+        save_path = os.path.join(self.engine.config["save_path"], FINAL_MODEL_DIR)
+        self.save(save_path)
+        self.engine.log(f"训练结束，最终模型正在保存到 {save_path}\n")
+
+
+class MetricsCallback(TrainerCallback):
+    """逐步记录loss、学习率、吞吐、等待数据/计算耗时和内存，交给metrics.MetricsExporter导出
+
+    等待数据的时间通过包装trainer.get_batch_samples测量(每个优化步取一次全部梯度累积的批次)，
+    步耗时为相邻两次on_step_end的间隔，其余部分计为计算耗时。
+    """
+
+    def __init__(self, trainer, exporter):
+        self.exporter = exporter
+        self._data_wait = 0.0
+        self._tokens = []
+        self._samples = 0
+        self._last_end = None
+        self._pending = None
+        original = trainer.get_batch_samples
+
+        def get_batch_samples(*args, **kwargs):
+            start = time.perf_counter()
+            batch_samples, num_items_in_batch = original(*args, **kwargs)
+            self._data_wait += time.perf_counter() - start
+            for batch in batch_samples:
+                self._count(batch)
+            return batch_samples, num_items_in_batch
+
+        trainer.get_batch_samples = get_batch_samples
+
+    def _count(self, batch):
+        """计入参与loss计算的token数(labels不为-100)和序列数"""
+        labels = batch.get("labels")
+        input_ids = batch.get("input_ids")
+        if labels is not None:
+            # 保持为张量，避免每个批次都与GPU同步
+            self._tokens.append((labels != -100).sum())
+        elif batch.get("attention_mask") is not None:
+            self._tokens.append(batch["attention_mask"].sum())
+        elif input_ids is not None:
+            self._tokens.append(input_ids.numel())
+        if input_ids is not None:
+            self._samples += input_ids.shape[0]
+
+    def _emit(self):
+        if self._pending is not None:
+            self.exporter.record(self._pending)
+            self._pending = None
+
+    def on_train_begin(self, args, state, control, **kwargs):
+        self._last_end = time.perf_counter()
+
+    def on_step_end(self, args, state, control, **kwargs):
+        self._emit()
+        now = time.perf_counter()
+        step_seconds = now - self._last_end
+        self._last_end = now
+        tokens = int(sum(int(count) for count in self._tokens))
+        data_wait = min(self._data_wait, step_seconds)
+        self._pending = {
+            "global_step": state.global_step,
+            "epoch": state.epoch,
+            "tokens": tokens,
+            "samples": self._samples,
+            "step_duration_seconds": step_seconds,
+            "step_data_wait_seconds": data_wait,
+            "step_compute_seconds": step_seconds - data_wait,
+            "tokens_per_second": tokens / step_seconds if step_seconds > 0 else None,
+            "samples_per_second": self._samples / step_seconds if step_seconds > 0 else None,
+        }
+        self._data_wait = 0.0
+        self._tokens = []
+        self._samples = 0
+
+    def on_log(self, args, state, control, logs=None, **kwargs):
+        # 日志在on_step_end之后产生，补上同一步的loss和学习率后再导出
+        if self._pending is None or not logs or "loss" not in logs:
+            return
+        self._pending.update(
+            loss=logs["loss"], learning_rate=logs.get("learning_rate"), grad_norm=logs.get("grad_norm"),
+        )
+        self._emit()
+
+    def on_train_end(self, args, state, control, **kwargs):
+        self._emit()
+
+
+class ProfilerCallback(TrainerCallback):
+    """在训练开始时启动profiling.StepProfiler，每个优化步结束时推进其调度"""
+
+    def __init__(self, profiler):
+        self.profiler = profiler
+
+    def on_train_begin(self, args, state, control, **kwargs):
+        self.profiler.start(state.global_step)
+
+    def on_step_end(self, args, state, control, **kwargs):
+        self.profiler.step()
+
+    def on_train_end(self, args, state, control, **kwargs):
+        self.profiler.stop()
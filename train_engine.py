@@ -0,0 +1,689 @@
+"""无界面训练引擎，GUI、命令行和脚本共用同一套训练逻辑
+
+用法:
+    python -m train_engine --config config.json --data train.json --output ./output
+    python -m train_engine --config config.json --set learning_rate=1e-4 --set epochs=1
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sys
+import time
+
+from formatting import TEMPLATES, ensure_chat_template, resolve_template
+from log_bus import LogBus
+from model_registry import model_key, module_nbytes, registry, tokenizer_key
+from token_cache import DEFAULT_CACHE_DIR, TokenizationCache, tokenize_dataset
+
+# 与导出的config.json保持一致的配置项，另外包含高级设置和网络设置
+DEFAULT_CONFIG = {
+    "base_model": "meta-llama/Llama-2-7b-hf",
+    "data_path": "",
+    "template": "auto",
+    "save_path": "./output",
+    "learning_rate": "2e-5",
+    "batch_size": "4",
+    "epochs": "3",
+    "max_steps": "0",
+    "max_length": "512",
+    "use_lora": True,
+    "lora_rank": "8",
+    "use_fp16": True,
+    "use_4bit": False,
+    "use_8bit": False,
+    "gradient_accumulation_steps": "4",
+    "optimizer": "adamw_8bit",
+    "lr_scheduler": "linear",
+    "weight_decay": "0.01",
+    "num_proc": "2",
+    "use_packing": False,
+    "dedup": False,
+    "dedup_threshold": "0.85",
+    "group_by_length": True,
+    "token_budget": "0",
+    "length_shuffle": True,
+    "proxy": "",
+    "timeout": "30",
+    "max_retries": "3",
+    "offline_mode": False,
+    "local_model_dir": "",
+    "cache_dir": "",
+    "cache_max_gb": "20",
+    "auto_resume": True,
+    "save_checkpoints": True,
+    "keep_last_checkpoints": "2",
+    "model_cache_gb": "0",
+    "export_mode": "adapter",
+    "metrics_jsonl": True,
+    "metrics_port": "0",
+    "metrics_host": "127.0.0.1",
+    "profile": False,
+    "profile_wait": "5",
+    "profile_warmup": "1",
+    "profile_active": "3",
+}
+
+# save_checkpoints关闭时训练结束后保存最终模型的目录
+FINAL_MODEL_DIR = "final_model"
+
+# 训练和导出共用的LoRA目标模块
+LORA_TARGET_MODULES = ["q_proj", "k_proj", "v_proj", "o_proj", "gate_proj", "up_proj", "down_proj"]
+
+_BOOL_KEYS = {
+    "use_lora", "use_fp16", "use_4bit", "use_8bit", "use_packing", "dedup", "group_by_length", "length_shuffle",
+    "offline_mode", "auto_resume", "save_checkpoints", "metrics_jsonl", "profile",
+}
+
+# 影响训练结果的配置项，用于判断检查点是否属于同一次训练
+_RUN_KEYS = (
+    "base_model", "data_path", "template", "learning_rate", "batch_size", "epochs", "max_steps", "max_length",
+    "use_lora", "lora_rank", "use_4bit", "use_8bit", "gradient_accumulation_steps",
+    "optimizer", "lr_scheduler", "weight_decay", "use_packing", "dedup", "dedup_threshold",
+    "group_by_length", "token_budget", "length_shuffle",
+)
+
+# 检查点目录中保存引擎自身状态(早停计数等)的文件
+ENGINE_STATE_FILE = "engine_state.json"
+
+
+def _to_bool(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    return bool(value)
+
+
+def load_config(path):
+    """读取config.json并补全缺省项"""
+    with open(path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    merged = dict(DEFAULT_CONFIG)
+    merged.update(config)
+    return merged
+
+
+def normalize_config(config):
+    """校验配置并转换为训练所需的类型，参数无效时抛出ValueError"""
+    cfg = dict(DEFAULT_CONFIG)
+    cfg.update(config)
+    for key in _BOOL_KEYS:
+        cfg[key] = _to_bool(cfg[key])
+
+    cfg["base_model"] = str(cfg["base_model"]).strip()
+    if not cfg["base_model"]:
+        raise ValueError("请输入基础模型名称")
+    if not cfg["data_path"]:
+        raise ValueError("请选择训练数据文件")
+    if not os.path.exists(cfg["data_path"]):
+        raise ValueError("训练数据文件不存在")
+    if cfg["template"] not in TEMPLATES:
+        raise ValueError("数据模板必须是auto、text、alpaca或chat")
+
+    cfg["learning_rate"] = float(cfg["learning_rate"])
+    if cfg["learning_rate"] <= 0 or cfg["learning_rate"] >= 1:
+        raise ValueError("学习率必须在0到1之间")
+    cfg["batch_size"] = int(cfg["batch_size"])
+    if cfg["batch_size"] <= 0:
+        raise ValueError("Batch Size必须大于0")
+    cfg["epochs"] = int(cfg["epochs"])
+    if cfg["epochs"] <= 0:
+        raise ValueError("训练轮数必须大于0")
+    # 0表示按训练轮数训练；大于0时训练到该步数为止，学习率调度也按该步数计算
+    cfg["max_steps"] = int(cfg["max_steps"] or 0)
+    if cfg["max_steps"] < 0:
+        raise ValueError("最大步数不能为负数")
+    cfg["max_length"] = int(cfg["max_length"])
+    if cfg["max_length"] <= 0:
+        raise ValueError("最大长度必须大于0")
+    cfg["lora_rank"] = int(cfg["lora_rank"])
+    if cfg["use_lora"] and cfg["lora_rank"] <= 0:
+        raise ValueError("LoRA rank必须大于0")
+    cfg["gradient_accumulation_steps"] = int(cfg["gradient_accumulation_steps"])
+    if cfg["gradient_accumulation_steps"] <= 0:
+        raise ValueError("梯度累积步数必须大于0")
+    cfg["weight_decay"] = float(cfg["weight_decay"])
+    cfg["num_proc"] = max(1, int(cfg["num_proc"]))
+    cfg["dedup_threshold"] = float(cfg["dedup_threshold"])
+    if cfg["dedup"] and not 0 < cfg["dedup_threshold"] <= 1:
+        raise ValueError("去重相似度阈值必须在0到1之间")
+    # 0表示按 batch_size * max_length 计算，与固定批次的最坏情况占用相同
+    cfg["token_budget"] = int(cfg["token_budget"])
+    if cfg["token_budget"] < 0:
+        raise ValueError("token预算不能为负数")
+    if 0 < cfg["token_budget"] < cfg["max_length"]:
+        raise ValueError("token预算不能小于最大长度")
+    cfg["keep_last_checkpoints"] = int(cfg["keep_last_checkpoints"])
+    if cfg["keep_last_checkpoints"] <= 0:
+        raise ValueError("保留的检查点数量必须大于0")
+    cfg["model_cache_gb"] = float(cfg["model_cache_gb"])
+    if cfg["export_mode"] not in ("adapter", "merged", "onnx"):
+        raise ValueError("导出方式必须是adapter、merged或onnx")
+    # 0表示不启动指标HTTP端点
+    cfg["metrics_port"] = int(cfg["metrics_port"] or 0)
+    if not 0 <= cfg["metrics_port"] <= 65535:
+        raise ValueError("指标端口必须在0到65535之间")
+    for key in ("profile_wait", "profile_warmup", "profile_active"):
+        cfg[key] = int(cfg[key])
+        if cfg[key] < 0:
+            raise ValueError("性能分析的步数不能为负数")
+    if cfg["profile"] and cfg["profile_active"] <= 0:
+        raise ValueError("性能分析记录的步数必须大于0")
+    cfg["cache_dir"] = cfg["cache_dir"] or DEFAULT_CACHE_DIR
+    cfg["cache_max_gb"] = float(cfg["cache_max_gb"])
+    if cfg["cache_max_gb"] <= 0:
+        raise ValueError("分词缓存上限必须大于0")
+
+    # 网络参数无效时使用默认值，与原GUI行为一致
+    try:
+        cfg["timeout"] = int(cfg["timeout"])
+        cfg["max_retries"] = int(cfg["max_retries"])
+    except (TypeError, ValueError):
+        cfg["timeout"] = int(DEFAULT_CONFIG["timeout"])
+        cfg["max_retries"] = int(DEFAULT_CONFIG["max_retries"])
+    cfg["max_retries"] = max(1, cfg["max_retries"])
+    return cfg
+
+
+def run_fingerprint(config):
+    """根据影响训练结果的配置项生成标识"""
+    parts = {key: config[key] for key in _RUN_KEYS}
+    parts["data_path"] = os.path.abspath(parts["data_path"])
+    return hashlib.sha1(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+def read_engine_state(checkpoint):
+    try:
+        with open(os.path.join(checkpoint, ENGINE_STATE_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_engine_state(checkpoint, state):
+    with open(os.path.join(checkpoint, ENGINE_STATE_FILE), 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2)
+
+
+def _checkpoint_step(path):
+    try:
+        return int(os.path.basename(path).rsplit("-", 1)[1])
+    except (IndexError, ValueError):
+        return -1
+
+
+def find_resume_checkpoint(save_path, fingerprint):
+    """查找可以继续训练的最新检查点
+
+    只接受由相同训练配置写出、保存完整且尚未训练结束的 checkpoint-* 目录。
+    """
+    candidates = sorted(glob.glob(os.path.join(save_path, "checkpoint-*")), key=_checkpoint_step, reverse=True)
+    for path in candidates:
+        if not os.path.exists(os.path.join(path, "trainer_state.json")):
+            continue
+        state = read_engine_state(path)
+        if not state or state.get("fingerprint") != fingerprint:
+            continue
+        # 同一次训练中最新的检查点已经训练结束时不再继续
+        if state.get("global_step", 0) >= state.get("max_steps", 0):
+            return None
+        return path
+    return None
+
+
+def precision_of(config):
+    """返回 (dtype名称, 量化方式)，用于在注册表中区分同一模型的不同加载方式"""
+    if config["use_4bit"]:
+        return "float16", "4bit"
+    if config["use_8bit"]:
+        return "float16", "8bit"
+    return ("float16" if config["use_fp16"] else "float32"), "none"
+
+
+def resolve_model_path(config):
+    """实际加载的模型路径，离线模式下为本地模型目录中的同名目录"""
+    if config["offline_mode"]:
+        return os.path.join(config["local_model_dir"], os.path.basename(config["base_model"]))
+    return config["base_model"]
+
+
+def registry_key(config):
+    """当前配置对应的模型注册表键"""
+    return model_key(resolve_model_path(config), *precision_of(config), config["max_length"])
+
+
+def _print_log(message):
+    sys.stdout.write(message)
+    sys.stdout.flush()
+
+
+class TrainingEngine:
+    """训练引擎，不依赖tkinter/matplotlib，通过回调向调用方汇报进度"""
+
+    def __init__(self, config, log=None, on_progress=None, on_metrics=None):
+        self.config = normalize_config(config)
+        self.log = log or _print_log
+        self.on_progress = on_progress or (lambda value: None)
+        self.on_metrics = on_metrics or (lambda step, loss, lr: None)
+        self.active = False
+        self.pause_requested = False
+        self.best_loss = float('inf')
+        self.current_epoch = 0
+        self.fingerprint = run_fingerprint(self.config)
+        self.checkpoint_writer = None
+
+    def stop(self):
+        """请求停止训练"""
+        self.active = False
+
+    def pause(self):
+        """请求在下一个step边界保存完整检查点后暂停"""
+        self.pause_requested = True
+
+    def apply_network_settings(self):
+        """设置代理、超时和重试次数"""
+        cfg = self.config
+        if cfg["proxy"]:
+            os.environ["HTTP_PROXY"] = cfg["proxy"]
+            os.environ["HTTPS_PROXY"] = cfg["proxy"]
+            self.log(f"已设置代理: {cfg['proxy']}\n")
+
+        import requests
+        requests.adapters.DEFAULT_RETRIES = cfg["max_retries"]
+        requests.DEFAULT_TIMEOUT = cfg["timeout"]
+        self.log(f"已设置连接超时: {cfg['timeout']}秒, 重试次数: {cfg['max_retries']}\n")
+
+    def load_model(self):
+        """加载模型和tokenizer，注册表中已有可复用的基础模型时跳过加载"""
+        from unsloth import FastLanguageModel
+        import torch
+
+        cfg = self.config
+        self.log("正在加载模型和tokenizer...\n")
+
+        # 设置量化参数
+        load_kwargs = {
+            "model_name": cfg["base_model"],
+            "max_seq_length": cfg["max_length"],
+        }
+        if cfg["use_4bit"]:
+            load_kwargs.update({
+                "load_in_4bit": True,
+                "bnb_4bit_quant_type": "nf4",
+                "bnb_4bit_compute_dtype": torch.float16,
+            })
+            self.log("启用4-bit量化训练...\n")
+        elif cfg["use_8bit"]:
+            load_kwargs.update({"load_in_8bit": True})
+            self.log("启用8-bit量化训练...\n")
+        else:
+            load_kwargs.update({"dtype": torch.float16 if cfg["use_fp16"] else torch.float32})
+
+        if cfg["offline_mode"]:
+            self.log("使用离线模式加载本地模型...\n")
+            local_model_path = resolve_model_path(cfg)
+            if not os.path.exists(local_model_path):
+                self.log(f"错误: 本地模型路径 {local_model_path} 不存在\n")
+                self.log("请确保模型已下载到本地模型目录，或取消勾选离线模式\n")
+                raise FileNotFoundError(f"本地模型不存在: {local_model_path}")
+            load_kwargs["model_name"] = local_model_path
+
+        key = registry_key(cfg)
+        entry = registry.get(key)
+        if entry is not None and cfg["use_lora"] and entry["lora"]:
+            # 上次LoRA训练只修改了适配器，卸下适配器即得到未改动的基础模型
+            self.log("复用已加载的基础模型，跳过加载\n")
+            model = entry["model"].unload()
+            tokenizer = entry["tokenizer"]
+            registry.release(key)
+        else:
+            if entry is not None:
+                registry.release(key)
+            model, tokenizer = self._load_pretrained(load_kwargs)
+
+        # 配置LoRA
+        if cfg["use_lora"]:
+            model = FastLanguageModel.get_peft_model(
+                model,
+                r=cfg["lora_rank"],
+                target_modules=LORA_TARGET_MODULES,
+                bias="none",
+                task_type="CAUSAL_LM"
+            )
+            self.log("已启用LoRA配置\n")
+
+        # 登记到注册表，训练结束后导出可直接使用内存中的模型
+        registry.put(key, {"model": model, "tokenizer": tokenizer, "lora": cfg["use_lora"]}, module_nbytes(model))
+        registry.put(tokenizer_key(load_kwargs["model_name"]), tokenizer)
+        return model, tokenizer
+
+    def _load_pretrained(self, load_kwargs):
+        """调用FastLanguageModel.from_pretrained，失败时按次数重试"""
+        from unsloth import FastLanguageModel
+
+        max_attempts = self.config["max_retries"]
+        for attempt in range(1, max_attempts + 1):
+            try:
+                model, tokenizer = FastLanguageModel.from_pretrained(**load_kwargs)
+                break
+            except FileNotFoundError:
+                raise
+            except Exception as e:
+                if attempt >= max_attempts:
+                    self.log(f"加载失败，已达到最大重试次数: {str(e)}\n")
+                    raise
+                wait_time = attempt * 5
+                self.log(f"加载失败 (尝试 {attempt}/{max_attempts}): {str(e)}\n")
+                self.log(f"等待 {wait_time} 秒后重试...\n")
+                time.sleep(wait_time)
+
+        self.log("模型加载成功!\n")
+        return model, tokenizer
+
+    def load_records(self, template):
+        """流式读取模板需要的字段，返回以内存映射方式加载的数据集"""
+        from formatting import load_records
+
+        cache_dir = os.path.join(self.config["save_path"], ".data_cache")
+        return load_records(self.config["data_path"], cache_dir, template, log=self.log)
+
+    def build_dataset(self, tokenizer=None, template=None):
+        """读取训练数据并按模板整理成text列"""
+        from formatting import format_dataset
+
+        cfg = self.config
+        template = template or resolve_template(cfg["data_path"], cfg["template"])
+        return format_dataset(self.load_records(template), template, tokenizer, num_proc=cfg["num_proc"], log=self.log)
+
+    def prepare_dataset(self, tokenizer):
+        """返回分词(及打包)后的数据集，数据、tokenizer和参数未变时直接复用缓存"""
+        cfg = self.config
+        template = resolve_template(cfg["data_path"], cfg["template"])
+        if cfg["template"] == "auto":
+            self.log(f"数据模板: {template}\n")
+        if template == "chat":
+            # 缓存键包含对话模板，需在计算缓存键之前设置
+            ensure_chat_template(tokenizer, self.log)
+        cache = TokenizationCache(cfg["cache_dir"], int(cfg["cache_max_gb"] * (1 << 30)))
+        self.log("正在检查分词缓存...\n")
+        key = cache.make_key(
+            cache.data_hash(cfg["data_path"]),
+            tokenizer,
+            cfg["max_length"],
+            cfg["use_packing"],
+            template=template,
+            dedup_threshold=cfg["dedup_threshold"] if cfg["dedup"] else 0,
+        )
+        dataset = cache.load(key)
+        if dataset is not None:
+            self.log(f"命中分词缓存，跳过分词: {cache.entry_path(key)}\n")
+        else:
+            dataset = self.build_dataset(tokenizer, template)
+            self.log("正在分词...\n")
+            tokenized = tokenize_dataset(
+                dataset, tokenizer, cfg["max_length"], packing=cfg["use_packing"], num_proc=cfg["num_proc"],
+                dedup_threshold=cfg["dedup_threshold"] if cfg["dedup"] else 0, log=self.log,
+            )
+            dataset = cache.store(key, tokenized)
+            self.log(f"分词结果已缓存: {cache.entry_path(key)}\n")
+        if cfg["use_packing"]:
+            from packing import packing_stats
+
+            samples, sequences, fill = packing_stats(dataset, cfg["max_length"])
+            self.log(f"打包: {samples} 个样本装入 {sequences} 个序列，填充率 {fill:.1%}\n")
+        return dataset
+
+    def build_trainer(self, model, tokenizer, dataset):
+        """构建SFTTrainer"""
+        from transformers import TrainingArguments
+        from unsloth import is_bfloat16_supported
+        from trl import SFTTrainer
+
+        cfg = self.config
+        quantized = cfg["use_4bit"] or cfg["use_8bit"]
+        training_args = TrainingArguments(
+            per_device_train_batch_size=cfg["batch_size"],
+            gradient_accumulation_steps=cfg["gradient_accumulation_steps"],
+            learning_rate=cfg["learning_rate"],
+            num_train_epochs=cfg["epochs"],
+            max_steps=cfg["max_steps"] or -1,
+            fp16=not is_bfloat16_supported() and not quantized,
+            bf16=is_bfloat16_supported() and not quantized,
+            logging_steps=1,
+            optim=cfg["optimizer"],
+            weight_decay=cfg["weight_decay"],
+            lr_scheduler_type=cfg["lr_scheduler"],
+            output_dir=cfg["save_path"],
+            # 不保存检查点时仍可暂停: 暂停由回调设置should_save，与保存策略无关
+            save_strategy="steps" if cfg["save_checkpoints"] else "no",
+            save_steps=100,
+            save_total_limit=cfg["keep_last_checkpoints"],
+            report_to="none",
+            remove_unused_columns=False,
+        )
+        # 数据集已在prepare_dataset中分词和打包，跳过SFTTrainer自身的预处理
+        trainer = SFTTrainer(
+            model=model,
+            tokenizer=tokenizer,
+            train_dataset=dataset,
+            max_seq_length=cfg["max_length"],
+            packing=False,
+            dataset_kwargs={"skip_prepare_dataset": True},
+            args=training_args,
+        )
+        if cfg["use_packing"]:
+            # 打包的样本之间互不可见: 按position_ids生成块对角掩码，样本开头不计算loss
+            from packing import collator_for
+
+            trainer.data_collator = collator_for(model, tokenizer.pad_token_id)
+        elif cfg["group_by_length"]:
+            # 打包后的序列长度已接近max_length，只在不打包时按长度分组
+            from length_sampler import use_token_budget_batches
+
+            use_token_budget_batches(
+                trainer, cfg["token_budget"] or cfg["batch_size"] * cfg["max_length"],
+                shuffle=cfg["length_shuffle"], seed=training_args.seed, log=self.log,
+            )
+        return trainer
+
+    def log_memory_plan(self):
+        """根据模型文件头估算训练显存并写入日志，估算失败不影响训练
+
+        返回 (估算结果, 可用显存, 设备名称, 是否可能不足)，无法估算时返回None
+        """
+        from memory_planner import check_training_memory, format_bytes, format_plan
+
+        cfg = self.config
+        try:
+            plan, available, device, maybe_oom = check_training_memory(
+                cfg, resolve_model_path(cfg), LORA_TARGET_MODULES,
+                local_files_only=cfg["offline_mode"], timeout=cfg["timeout"],
+            )
+        except Exception as e:
+            self.log(f"无法估算显存占用: {str(e)}\n")
+            return None
+        self.log(format_plan(plan) + "\n")
+        if maybe_oom:
+            self.log(f"警告: 预计需要 {format_bytes(plan['total'])}，超过{device}的 {format_bytes(available)}，"
+                     f"可能出现显存不足\n")
+        return plan, available, device, maybe_oom
+
+    def run(self, resume_from_checkpoint=None, log_memory=True):
+        """执行完整训练流程，返回训练结果摘要
+
+        resume_from_checkpoint: 从指定检查点继续；为None且开启auto_resume时
+        自动查找save_path下属于本次配置的最新检查点
+        log_memory: 是否估算显存并写入日志，调用方已调用log_memory_plan时传False
+        """
+        cfg = self.config
+        self.active = True
+        self.pause_requested = False
+        self.started_at = time.perf_counter()
+        if cfg["model_cache_gb"] > 0:
+            registry.set_budget(int(cfg["model_cache_gb"] * (1 << 30)))
+        try:
+            self.log("正在初始化训练...\n")
+            os.makedirs(cfg["save_path"], exist_ok=True)
+            self.apply_network_settings()
+            if log_memory:
+                self.log_memory_plan()
+
+            model, tokenizer = self.load_model()
+            dataset = self.prepare_dataset(tokenizer)
+            trainer = self.build_trainer(model, tokenizer, dataset)
+
+            from checkpoint_io import AsyncCheckpointWriter
+            from metrics import MetricsExporter
+            from train_callbacks import EpochCallback, MetricsCallback, ProfilerCallback
+
+            # 只调用一次train()，由TrainingArguments的num_train_epochs控制轮数，
+            # 每个epoch的进度、早停和保存交给回调处理
+            self.best_loss = float('inf')
+            callback = EpochCallback(self, patience=3)
+            callback.trainer = trainer
+            trainer.add_callback(callback)
+
+            if resume_from_checkpoint is None and cfg["auto_resume"]:
+                resume_from_checkpoint = find_resume_checkpoint(cfg["save_path"], self.fingerprint)
+            if resume_from_checkpoint:
+                state = read_engine_state(resume_from_checkpoint) or {}
+                self.best_loss = state.get("best_loss", float('inf'))
+                callback.no_improve = state.get("no_improve", 0)
+                self.log(f"从检查点继续训练: {resume_from_checkpoint}\n")
+            self.checkpoint_writer = AsyncCheckpointWriter(
+                cfg["save_path"], tokenizer, keep_last=cfg["keep_last_checkpoints"], log=self.log
+            )
+            exporter = MetricsExporter(
+                os.path.join(cfg["save_path"], "metrics.jsonl") if cfg["metrics_jsonl"] else None,
+                port=cfg["metrics_port"],
+                host=cfg["metrics_host"],
+                labels={"run": self.fingerprint, "model": cfg["base_model"]},
+                log=self.log,
+            ).start()
+            trainer.add_callback(MetricsCallback(trainer, exporter))
+            profiler = None
+            if cfg["profile"]:
+                from profiling import StepProfiler
+
+                profiler = StepProfiler(
+                    os.path.join(cfg["save_path"], "profile"),
+                    wait=cfg["profile_wait"], warmup=cfg["profile_warmup"], active=cfg["profile_active"],
+                    log=self.log,
+                )
+                trainer.add_callback(ProfilerCallback(profiler))
+            trained = False
+            try:
+                trainer.train(resume_from_checkpoint=resume_from_checkpoint)
+                trained = True
+            finally:
+                if profiler is not None:
+                    # 训练异常退出时不会触发on_train_end
+                    profiler.stop()
+                exporter.close()
+                # 等待后台写入完成，保证返回时epoch_N和best_model已经落盘
+                self.log("正在等待检查点写入完成...\n")
+                try:
+                    self.checkpoint_writer.close()
+                except Exception as e:
+                    self.log(f"检查点写入失败: {str(e)}\n")
+                    # 训练本身出错时保留原始异常，不用写入错误覆盖它
+                    if trained:
+                        raise
+            summary = exporter.summary()
+            if summary:
+                self.log(summary + "\n")
+            stalls = self.checkpoint_writer.stall_seconds
+            if stalls:
+                self.log(f"检查点快照 {len(stalls)} 次，训练暂停平均 {sum(stalls) / len(stalls) * 1000:.0f} ms，"
+                         f"最长 {max(stalls) * 1000:.0f} ms\n")
+
+            result = {
+                "best_loss": self.best_loss,
+                "epochs_completed": self.current_epoch,
+                "checkpoint": callback.last_checkpoint,
+            }
+            if callback.paused:
+                self.log(f"训练已暂停，检查点已保存到 {callback.last_checkpoint}\n")
+                result["status"] = "paused"
+            elif callback.interrupted:
+                self.log("训练被用户中断\n")
+                result["status"] = "stopped"
+            else:
+                self.log("\n训练完成！\n")
+                self.log(f"最佳loss: {self.best_loss:.4f}\n")
+                self.on_progress(100)
+                result["status"] = "completed"
+            return result
+        finally:
+            self.active = False
+
+
+def parse_overrides(items):
+    """解析 --set key=value 形式的覆盖项"""
+    overrides = {}
+    for item in items or []:
+        if "=" not in item:
+            raise ValueError(f"无效的覆盖项: {item}，应为 key=value")
+        key, value = item.split("=", 1)
+        key = key.strip()
+        if key not in DEFAULT_CONFIG:
+            raise ValueError(f"未知的配置项: {key}")
+        overrides[key] = value.strip()
+    return overrides
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m train_engine",
+        description="Unsloth 模型微调工具 - 无界面训练",
+    )
+    parser.add_argument("--config", help="配置文件路径(与GUI导出的training_config.json格式相同)")
+    parser.add_argument("--data", help="训练数据文件，覆盖配置中的data_path")
+    parser.add_argument("--output", help="模型保存目录，覆盖配置中的save_path")
+    parser.add_argument("--set", action="append", metavar="KEY=VALUE", help="覆盖任意配置项，可重复使用")
+    args = parser.parse_args(argv)
+
+    try:
+        config = load_config(args.config) if args.config else dict(DEFAULT_CONFIG)
+        config.update(parse_overrides(args.set))
+        if args.data:
+            config["data_path"] = args.data
+        if args.output:
+            config["save_path"] = args.output
+        log_bus = LogBus(echo=sys.stdout, use_queue=False)
+        engine = TrainingEngine(config, log=log_bus.write)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    log_bus.write(f"本次训练日志文件: {log_bus.open_run_log(engine.config['save_path'])}\n")
+    # 收到SIGTERM(如任务队列取消任务)时在当前step结束后停止，而不是直接退出；
+    # 收到SIGUSR1(任务队列退出、稍后重新运行)时保存完整检查点后暂停，重新运行时从该检查点继续
+    import signal
+
+    def on_terminate(signum, frame):
+        log_bus.write("收到终止信号，将在当前step结束后停止\n")
+        engine.stop()
+
+    def on_requeue(signum, frame):
+        log_bus.write("收到暂停信号，将在当前step结束后保存检查点并退出\n")
+        engine.pause()
+
+    signal.signal(signal.SIGTERM, on_terminate)
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, on_requeue)
+    try:
+        result = engine.run()
+    except KeyboardInterrupt:
+        log_bus.write("训练被用户中断\n")
+        return 130
+    except Exception as e:
+        log_bus.write(f"训练出错: {str(e)}\n")
+        return 1
+    finally:
+        log_bus.close_run_log()
+    _print_log(json.dumps(result, ensure_ascii=False) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
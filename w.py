@@ -1,24 +1,23 @@
+import time
+_START = time.perf_counter()  # 用于统计界面启动耗时
+from startup import ImportTimer, Prewarm, import_time_enabled
+# 需在其余导入之前安装，才能统计到界面本身的导入
+IMPORT_TIMER = ImportTimer().install() if import_time_enabled() else None
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import json
 import os
-from threading import Thread
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import time
-import matplotlib.font_manager as fm
-import requests
+import sys
+from threading import Event, Thread
 import warnings
 from tkinter import font as tkfont
-import sv_ttk  # 导入Sun Valley主题包，需要先安装: pip install sv-ttk
-
-# 设置requests超时时间和重试次数
-requests.adapters.DEFAULT_RETRIES = 3
-requests.DEFAULT_TIMEOUT = 30
-
-# 设置matplotlib中文字体
-plt.rcParams['font.sans-serif'] = ['SimHei']
-plt.rcParams['axes.unicode_minus'] = False
+from log_bus import LogBus
+from model_registry import get_tokenizer, registry
+from train_engine import TrainingEngine, _to_bool, normalize_config, resolve_model_path
+from model_index import ModelIndex
+from model_search import SearchIndex, VirtualTreeview, parse_param_count
+from memory_planner import format_bytes, format_params, format_plan
+from export_engine import export_adapter, export_full, export_merged, find_latest_checkpoint, is_adapter_checkpoint
 
 class FineTuningGUI:
     def __init__(self, root):
@@ -32,8 +31,8 @@ class FineTuningGUI:
         self.title_font = tkfont.Font(family='Microsoft YaHei UI', size=11, weight='bold')
         
         # 应用Sun Valley主题
-        sv_ttk.set_theme("light")
         self.theme_mode = tk.StringVar(value="light")
+        self.apply_theme("light")
         
         # 创建主框架
         self.main_frame = ttk.Frame(self.root, padding="10")
@@ -146,7 +145,7 @@ class FineTuningGUI:
         data_entry.grid(row=0, column=1, sticky=tk.W+tk.E, padx=5, pady=5)
         data_btn = ttk.Button(data_frame, text="选择文件", command=self.select_data, width=10)
         data_btn.grid(row=0, column=2, padx=5, pady=5)
-        self.create_tooltip(data_entry, "选择用于微调模型的训练数据文件，通常为JSON格式")
+        self.create_tooltip(data_entry, "选择用于微调模型的训练数据文件，支持JSON、JSONL、CSV/TSV和Parquet")
 
         # 模型保存路径
         ttk.Label(data_frame, text="保存路径:").grid(row=1, column=0, sticky=tk.W, padx=5, pady=5)
@@ -157,6 +156,14 @@ class FineTuningGUI:
         save_btn.grid(row=1, column=2, padx=5, pady=5)
         self.create_tooltip(save_entry, "设置微调后模型的保存目录")
 
+        # 数据模板
+        ttk.Label(data_frame, text="数据模板:").grid(row=2, column=0, sticky=tk.W, padx=5, pady=5)
+        self.template_var = tk.StringVar(value="auto")
+        template_combo = ttk.Combobox(data_frame, textvariable=self.template_var, width=12, state="readonly")
+        template_combo["values"] = ("auto", "text", "alpaca", "chat")
+        template_combo.grid(row=2, column=1, sticky=tk.W, padx=5, pady=5)
+        self.create_tooltip(template_combo, "text使用text字段；alpaca拼接instruction/input/output；chat用模型的对话模板渲染messages或conversations；auto按字段自动选择")
+
         # 训练参数设置
         self.create_training_params()
         
@@ -192,6 +199,10 @@ class FineTuningGUI:
         log_scrollbar = ttk.Scrollbar(log_frame, orient="vertical", command=self.log_text.yview)
         log_scrollbar.grid(row=0, column=1, sticky=tk.N+tk.S)
         self.log_text.configure(yscrollcommand=log_scrollbar.set)
+        
+        # 日志统一经由队列在主线程中批量写入文本框
+        self.log_bus = LogBus(max_lines=5000)
+        self.log_bus.attach(self.root, self.log_text)
 
         # 右侧面板（训练可视化）
         self.right_panel = ttk.Frame(self.main_frame)
@@ -199,6 +210,34 @@ class FineTuningGUI:
         self.setup_visualization()
 
         self.training_active = False
+        self.engine = None
+        self.paused_checkpoint = None
+
+        # 窗口显示后开始后台预加载
+        self.prewarm = None
+        self.root.bind("<Map>", self.on_window_shown, add="+")
+
+    def on_window_shown(self, event):
+        if event.widget is not self.root or self.prewarm is not None:
+            return
+        self.log(f"界面启动耗时 {time.perf_counter() - _START:.2f} 秒\n")
+        self.prewarm = Prewarm.for_gui(log=self.log, on_step=self.on_prewarm_step, on_done=self.on_prewarm_done)
+        # 留出一次重绘的时间再开始，避免导入占用GIL时窗口还没画完
+        self.root.after(100, self.prewarm.start)
+
+    def on_prewarm_step(self, name):
+        if name == "matplotlib.backends.backend_tkagg" and name in sys.modules:
+            self.log_bus.post(self.create_chart)
+
+    def on_prewarm_done(self):
+        if IMPORT_TIMER is not None:
+            self.log(IMPORT_TIMER.summary())
+
+    def wait_prewarm(self):
+        """后台线程开始训练、调优或导出前调用，等待预加载结束"""
+        if self.prewarm is not None and not self.prewarm.done():
+            self.log("正在等待后台预加载完成...\n")
+            self.prewarm.wait()
 
     def create_training_params(self):
         params_frame = ttk.LabelFrame(self.basic_tab, text="训练参数", padding="8")
@@ -238,46 +277,117 @@ class FineTuningGUI:
     def validate_inputs(self):
         """验证输入参数的有效性"""
         try:
-            if not self.model_var.get().strip():
-                raise ValueError("请输入基础模型名称")
-                
-            if not self.data_path.get():
-                raise ValueError("请选择训练数据文件")
-                
-            if not os.path.exists(self.data_path.get()):
-                raise ValueError("训练数据文件不存在")
-                
-            # 验证数值参数
-            lr = float(self.lr_var.get())
-            if lr <= 0 or lr >= 1:
-                raise ValueError("学习率必须在0到1之间")
-                
-            batch_size = int(self.batch_size_var.get())
-            if batch_size <= 0:
-                raise ValueError("Batch Size必须大于0")
-                
-            epochs = int(self.epochs_var.get())
-            if epochs <= 0:
-                raise ValueError("训练轮数必须大于0")
-                
-            max_length = int(self.max_length_var.get())
-            if max_length <= 0:
-                raise ValueError("最大长度必须大于0")
-                
-            if self.use_lora.get():
-                lora_rank = int(self.lora_rank.get())
-                if lora_rank <= 0:
-                    raise ValueError("LoRA rank必须大于0")
-                    
-            grad_accum = int(self.grad_accum.get())
-            if grad_accum <= 0:
-                raise ValueError("梯度累积步数必须大于0")
-                
-            return True
-            
+            normalize_config(self.collect_config())
         except ValueError as e:
             messagebox.showerror("参数错误", str(e))
             return False
+        return True
+
+    def check_memory(self, engine):
+        """估算训练显存，可能放不下时由用户决定是否继续，在训练线程中调用
+
+        估算可能需要从Hub读取配置和文件头，不能放在界面线程；询问对话框通过log_bus在界面线程显示。
+        估算结果由训练引擎写入日志；无法估算时(如模型不是safetensors格式)不阻止训练。
+        """
+        estimate = engine.log_memory_plan()
+        if estimate is None:
+            return True
+        plan, available, device, maybe_oom = estimate
+        if not maybe_oom:
+            return True
+        answer = {"continue": False}
+        answered = Event()
+
+        def ask():
+            try:
+                answer["continue"] = messagebox.askyesno(
+                    "显存可能不足",
+                    f"预计需要 {format_bytes(plan['total'])}，{device}只有 {format_bytes(available)}。\n"
+                    f"{format_plan(plan)}\n\n"
+                    "可以减小批次大小或最大长度，或开启4-bit量化。是否仍然开始训练？",
+                )
+            finally:
+                answered.set()
+        self.log_bus.post(ask)
+        answered.wait()
+        return answer["continue"]
+
+    def collect_config(self):
+        """收集界面上的全部设置，格式与导出的training_config.json一致"""
+        return {
+            "base_model": self.model_var.get().strip(),
+            "data_path": self.data_path.get(),
+            "template": self.template_var.get(),
+            "save_path": self.save_path.get(),
+            "learning_rate": self.lr_var.get(),
+            "batch_size": self.batch_size_var.get(),
+            "epochs": self.epochs_var.get(),
+            "max_length": self.max_length_var.get(),
+            "use_lora": self.use_lora.get(),
+            "lora_rank": self.lora_rank.get(),
+            "use_fp16": self.use_fp16.get(),
+            "use_4bit": self.use_4bit.get(),
+            "use_8bit": self.use_8bit.get(),
+            "gradient_accumulation_steps": self.grad_accum.get(),
+            "optimizer": self.optimizer_var.get(),
+            "lr_scheduler": self.lr_scheduler.get(),
+            "weight_decay": self.weight_decay.get(),
+            "num_proc": self.num_proc.get(),
+            "use_packing": self.use_packing.get(),
+            "dedup": self.dedup.get(),
+            "dedup_threshold": self.dedup_threshold.get(),
+            "group_by_length": self.group_by_length.get(),
+            "token_budget": self.token_budget.get(),
+            "length_shuffle": self.length_shuffle.get(),
+            "proxy": self.proxy.get(),
+            "timeout": self.timeout.get(),
+            "max_retries": self.max_retries.get(),
+            "offline_mode": self.offline_mode.get(),
+            "local_model_dir": self.local_model_dir.get(),
+            "export_mode": self.export_mode.get(),
+            "metrics_port": self.metrics_port.get(),
+            "profile": self.profile.get(),
+            "profile_active": self.profile_active.get(),
+        }
+
+    def apply_config(self, config):
+        """将配置写回界面，只更新配置中存在的项"""
+        config_vars = {
+            "base_model": self.model_var,
+            "template": self.template_var,
+            "learning_rate": self.lr_var,
+            "batch_size": self.batch_size_var,
+            "epochs": self.epochs_var,
+            "max_length": self.max_length_var,
+            "use_lora": self.use_lora,
+            "lora_rank": self.lora_rank,
+            "use_fp16": self.use_fp16,
+            "use_4bit": self.use_4bit,
+            "use_8bit": self.use_8bit,
+            "gradient_accumulation_steps": self.grad_accum,
+            "optimizer": self.optimizer_var,
+            "lr_scheduler": self.lr_scheduler,
+            "weight_decay": self.weight_decay,
+            "num_proc": self.num_proc,
+            "use_packing": self.use_packing,
+            "dedup": self.dedup,
+            "dedup_threshold": self.dedup_threshold,
+            "group_by_length": self.group_by_length,
+            "token_budget": self.token_budget,
+            "length_shuffle": self.length_shuffle,
+            "export_mode": self.export_mode,
+            "metrics_port": self.metrics_port,
+            "profile": self.profile,
+            "profile_active": self.profile_active,
+        }
+        for key, var in config_vars.items():
+            if key in config:
+                var.set(config[key])
+
+    def log(self, message):
+        """向训练日志追加一条消息，可在任意线程调用"""
+        self.log_bus.write(message)
+
     def create_toolbar(self):
         """创建顶部工具栏"""
         toolbar = ttk.Frame(self.root)
@@ -309,10 +419,19 @@ class FineTuningGUI:
         # 将主框架移到第三行
         self.main_frame.grid(row=2, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
     
+    def apply_theme(self, theme):
+        """应用Sun Valley主题，需要先安装: pip install sv-ttk；未安装时使用ttk默认主题"""
+        try:
+            import sv_ttk
+        except ImportError:
+            return False
+        sv_ttk.set_theme(theme)
+        return True
+
     def toggle_theme(self):
         """切换主题模式"""
-        theme = self.theme_mode.get()
-        sv_ttk.set_theme(theme)
+        if not self.apply_theme(self.theme_mode.get()):
+            messagebox.showwarning("提示", "未安装sv-ttk，无法切换主题: pip install sv-ttk")
         
     def create_tooltip(self, widget, text):
         """为控件创建工具提示"""
@@ -405,6 +524,78 @@ class FineTuningGUI:
         packing_check.grid(row=3, column=2, columnspan=2, sticky=tk.W, padx=5, pady=5)
         self.create_tooltip(packing_check, "将多个短序列打包成一个长序列，提高训练效率")
         
+        # 量化选项
+        self.use_4bit = tk.BooleanVar(value=False)
+        use_4bit_check = ttk.Checkbutton(adv_frame, text="4-bit量化", variable=self.use_4bit)
+        use_4bit_check.grid(row=4, column=0, sticky=tk.W, padx=5, pady=5)
+        self.create_tooltip(use_4bit_check, "以4-bit(NF4)加载基础模型，大幅减少显存占用")
+        
+        self.use_8bit = tk.BooleanVar(value=False)
+        use_8bit_check = ttk.Checkbutton(adv_frame, text="8-bit量化", variable=self.use_8bit)
+        use_8bit_check.grid(row=4, column=1, sticky=tk.W, padx=5, pady=5)
+        self.create_tooltip(use_8bit_check, "以8-bit加载基础模型，4-bit优先")
+        
+        # 已加载模型的内存管理
+        release_btn = ttk.Button(adv_frame, text="释放已加载模型", command=self.release_models)
+        release_btn.grid(row=4, column=2, columnspan=2, sticky=tk.W, padx=5, pady=5)
+        self.create_tooltip(release_btn, "训练、导出和导入会复用已加载的模型和tokenizer，点击释放其占用的内存/显存")
+        
+        # 导出方式
+        ttk.Label(adv_frame, text="导出方式:").grid(row=5, column=0, sticky=tk.W, padx=5, pady=5)
+        self.export_mode = tk.StringVar(value="adapter")
+        export_mode_combo = ttk.Combobox(adv_frame, textvariable=self.export_mode, width=12, state="readonly")
+        export_mode_combo["values"] = ("adapter", "merged", "onnx")
+        export_mode_combo.grid(row=5, column=1, sticky=tk.W, padx=5, pady=5)
+        self.create_tooltip(export_mode_combo, "adapter只导出LoRA适配器，不加载基础模型；merged将适配器合并进基础模型权重，逐层流式写出分片safetensors；onnx导出带KV缓存的ONNX模型，用于CPU推理")
+
+        # 按长度分组组批
+        self.group_by_length = tk.BooleanVar(value=True)
+        group_check = ttk.Checkbutton(adv_frame, text="按长度分组组批", variable=self.group_by_length)
+        group_check.grid(row=6, column=0, sticky=tk.W, padx=5, pady=5)
+        self.create_tooltip(group_check, "不打包时把长度相近的样本放在同一批，按token预算决定每批样本数，减少padding")
+
+        self.length_shuffle = tk.BooleanVar(value=True)
+        shuffle_check = ttk.Checkbutton(adv_frame, text="桶内随机打乱", variable=self.length_shuffle)
+        shuffle_check.grid(row=6, column=1, sticky=tk.W, padx=5, pady=5)
+        self.create_tooltip(shuffle_check, "每个epoch随机分桶并打乱批次顺序；关闭时全部样本按长度排序，padding最少")
+
+        ttk.Label(adv_frame, text="Token预算:").grid(row=6, column=2, sticky=tk.W, padx=5, pady=5)
+        self.token_budget = tk.StringVar(value="0")
+        token_budget_entry = ttk.Entry(adv_frame, textvariable=self.token_budget, width=10)
+        token_budget_entry.grid(row=6, column=3, sticky=tk.W, padx=5, pady=5)
+        self.create_tooltip(token_budget_entry, "每批最多的token数(含padding)，0表示Batch Size × 最大长度")
+
+        # 近似去重
+        self.dedup = tk.BooleanVar(value=False)
+        dedup_check = ttk.Checkbutton(adv_frame, text="近似去重", variable=self.dedup)
+        dedup_check.grid(row=7, column=0, sticky=tk.W, padx=5, pady=5)
+        self.create_tooltip(dedup_check, "分词后用MinHash/LSH删除近似重复的样本，只保留第一条，日志中显示节省的token数")
+
+        ttk.Label(adv_frame, text="去重相似度阈值:").grid(row=7, column=2, sticky=tk.W, padx=5, pady=5)
+        self.dedup_threshold = tk.StringVar(value="0.85")
+        dedup_threshold_entry = ttk.Entry(adv_frame, textvariable=self.dedup_threshold, width=10)
+        dedup_threshold_entry.grid(row=7, column=3, sticky=tk.W, padx=5, pady=5)
+        self.create_tooltip(dedup_threshold_entry, "两条样本token 5-gram集合的Jaccard相似度不低于该值时视为重复")
+
+        # 训练指标
+        ttk.Label(adv_frame, text="指标端口:").grid(row=8, column=0, sticky=tk.W, padx=5, pady=5)
+        self.metrics_port = tk.StringVar(value="0")
+        metrics_port_entry = ttk.Entry(adv_frame, textvariable=self.metrics_port, width=10)
+        metrics_port_entry.grid(row=8, column=1, sticky=tk.W, padx=5, pady=5)
+        self.create_tooltip(metrics_port_entry, "在 http://127.0.0.1:端口/metrics 以OpenMetrics格式提供每步的loss、吞吐、等待数据耗时和内存，0表示不启动；每步指标同时写入保存路径下的metrics.jsonl")
+
+        # 性能分析
+        self.profile = tk.BooleanVar(value=False)
+        profile_check = ttk.Checkbutton(adv_frame, text="性能分析", variable=self.profile)
+        profile_check.grid(row=9, column=0, sticky=tk.W, padx=5, pady=5)
+        self.create_tooltip(profile_check, "跳过前5步、预热1步后用torch.profiler记录若干训练步，在保存路径的profile目录下生成Chrome trace和算子耗时表，日志中显示耗时最多的算子")
+
+        ttk.Label(adv_frame, text="分析步数:").grid(row=9, column=2, sticky=tk.W, padx=5, pady=5)
+        self.profile_active = tk.StringVar(value="3")
+        profile_active_entry = ttk.Entry(adv_frame, textvariable=self.profile_active, width=10)
+        profile_active_entry.grid(row=9, column=3, sticky=tk.W, padx=5, pady=5)
+        self.create_tooltip(profile_active_entry, "记录的训练步数，步数越多trace文件越大")
+        
 
         
         # 网络设置选项 - 移动到网络设置选项卡
@@ -468,9 +659,9 @@ class FineTuningGUI:
         start_btn.grid(row=0, column=0, padx=5, pady=5)
         self.create_tooltip(start_btn, "开始模型微调训练过程")
         
-        pause_btn = ttk.Button(btn_frame, text="暂停训练", command=self.pause_training, width=12)
-        pause_btn.grid(row=0, column=1, padx=5, pady=5)
-        self.create_tooltip(pause_btn, "暂停当前训练过程")
+        self.pause_btn = ttk.Button(btn_frame, text="暂停训练", command=self.pause_training, width=12)
+        self.pause_btn.grid(row=0, column=1, padx=5, pady=5)
+        self.create_tooltip(self.pause_btn, "保存检查点并暂停训练，再次点击从检查点继续")
         
         stop_btn = ttk.Button(btn_frame, text="停止训练", command=self.stop_training, width=12)
         stop_btn.grid(row=0, column=2, padx=5, pady=5)
@@ -484,20 +675,57 @@ class FineTuningGUI:
         import_btn.grid(row=0, column=4, padx=5, pady=5)
         self.create_tooltip(import_btn, "导入已有的模型配置和权重")
 
+        autotune_btn = ttk.Button(btn_frame, text="自动调优", command=self.start_autotune, width=12)
+        autotune_btn.grid(row=1, column=0, padx=5, pady=5)
+        self.create_tooltip(autotune_btn, "在数据样本上试训练，自动选择Batch Size、梯度累积、打包和分词进程数，"
+                                          "结果写回界面和config.json")
+
     def setup_visualization(self):
-        self.fig, (self.ax1, self.ax2) = plt.subplots(2, 1, figsize=(6, 8))
+        """matplotlib由后台预加载导入后再创建图表，不阻塞窗口显示"""
+        self.live_plot = None
+        self.chart_placeholder = ttk.Label(self.right_panel, text="正在加载训练曲线...")
+        self.chart_placeholder.pack(expand=True)
+
+    def create_chart(self):
+        """创建训练曲线，只能在Tk主线程中调用；已创建时直接返回"""
+        if self.live_plot is not None:
+            return
+        import matplotlib
+        import matplotlib.font_manager as fm
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        from matplotlib.figure import Figure
+        from live_plot import LivePlot
+
+        # 设置matplotlib中文字体
+        matplotlib.rcParams['font.sans-serif'] = ['SimHei']
+        matplotlib.rcParams['axes.unicode_minus'] = False
+
+        self.chart_placeholder.destroy()
+        self.fig = Figure(figsize=(6, 8))
+        self.ax1, self.ax2 = self.fig.subplots(2, 1)
         self.canvas = FigureCanvasTkAgg(self.fig, master=self.right_panel)
         self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
         
-        self.ax1.set_title('训练损失')
-        self.ax2.set_title('学习率')
-        self.train_losses = []
-        self.learning_rates = []
+        # 使用支持中文的字体，只创建一次
+        font_props = fm.FontProperties(family='SimHei')
+        self.ax1.set_title('训练损失', fontproperties=font_props)
+        self.ax2.set_title('学习率', fontproperties=font_props)
+        self.ax2.set_xlabel('step')
+        
+        # 曲线增量更新，由Tk主线程定时刷新
+        self.live_plot = LivePlot(self.canvas, (self.ax1, self.ax2))
+        self.root.after(250, self.refresh_visualization)
 
     def select_data(self):
         filename = filedialog.askopenfilename(
             title="选择训练数据",
-            filetypes=[("JSON files", "*.json"), ("All files", "*.*")]
+            filetypes=[
+                ("训练数据", "*.json *.jsonl *.ndjson *.csv *.tsv *.parquet"),
+                ("JSON files", "*.json *.jsonl"),
+                ("CSV files", "*.csv *.tsv"),
+                ("Parquet files", "*.parquet"),
+                ("All files", "*.*"),
+            ]
         )
         if filename:
             self.data_path.set(filename)
@@ -507,35 +735,76 @@ class FineTuningGUI:
         if directory:
             self.save_path.set(directory)
 
-    def update_visualization(self, loss, lr):
-        self.train_losses.append(loss)
-        self.learning_rates.append(lr)
-        
-        self.ax1.clear()
-        self.ax2.clear()
-        
-        self.ax1.plot(self.train_losses)
-        # 使用支持中文的字体
-        font_props = matplotlib.font_manager.FontProperties(family='SimHei')
-        self.ax1.set_title('训练损失', fontproperties=font_props)
-        
-        self.ax2.plot(self.learning_rates)
-        self.ax2.set_title('学习率', fontproperties=font_props)
-        self.canvas.draw()
-        self.root.update()
+    def update_visualization(self, step, loss, lr):
+        """记录一个训练步的loss和学习率，可在训练线程中调用"""
+        self.live_plot.append(step, loss, lr)
+    def refresh_visualization(self):
+        """在Tk主线程中按固定间隔重绘曲线，没有新数据时不绘制"""
+        self.live_plot.refresh()
+        self.root.after(250, self.refresh_visualization)
     def start_training(self):
         if not self.training_active:
             if self.validate_inputs():
                 self.training_active = True
+                # 预加载尚未导入matplotlib时在此创建图表
+                self.create_chart()
+                self.live_plot.reset()
                 Thread(target=self.training_process, daemon=True).start()
     def pause_training(self):
         if self.training_active:
+            if self.engine:
+                self.engine.pause()
+            self.log("正在保存检查点，将在当前step结束后暂停...\n")
+        elif self.paused_checkpoint:
+            self.resume_training()
+    def resume_training(self):
+        """从暂停时保存的检查点继续训练"""
+        if self.validate_inputs():
+            checkpoint = self.paused_checkpoint
+            self.paused_checkpoint = None
+            self.pause_btn.config(text="暂停训练")
+            self.training_active = True
+            self.create_chart()
+            Thread(target=self.training_process, args=(checkpoint,), daemon=True).start()
+    def start_autotune(self):
+        """在后台试训练并把吞吐最高的设置写回界面和config.json"""
+        if self.training_active:
+            messagebox.showerror("错误", "训练进行中，不能自动调优")
+            return
+        try:
+            config = normalize_config(self.collect_config())
+        except ValueError as e:
+            messagebox.showerror("参数错误", str(e))
+            return
+        # 调优与训练共用停止按钮，期间不能开始训练
+        self.training_active = True
+        Thread(target=self.autotune_process, args=(config,), daemon=True).start()
+    def autotune_process(self, config):
+        self.wait_prewarm()
+        from autotune import autotune, update_config_file
+
+        try:
+            result = autotune(config, log=self.log, should_stop=lambda: not self.training_active)
+            best = result["best"]
+            self.log_bus.post(self.apply_config, best)
+            config_path = update_config_file(os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.json"), best)
+            self.log(f"调优结果已写入 {config_path}\n")
+            self.log_bus.post(messagebox.showinfo, "自动调优完成",
+                              f"Batch Size: {best['batch_size']}\n梯度累积: {best['gradient_accumulation_steps']}\n"
+                              f"数据打包: {'是' if best['use_packing'] else '否'}\n分词进程数: {best['num_proc']}")
+        except Exception as e:
+            self.log(f"自动调优失败: {str(e)}\n")
+            self.log_bus.post(messagebox.showerror, "错误", f"自动调优失败: {str(e)}")
+        finally:
             self.training_active = False
-            self.log_text.insert(tk.END, "训练已暂停\n")
     def stop_training(self):
         self.training_active = False
+        if self.engine:
+            self.engine.stop()
+        self.paused_checkpoint = None
+        self.pause_btn.config(text="暂停训练")
         self.progress['value'] = 0
-        self.log_text.insert(tk.END, "训练已停止\n")
+        self.log("训练已停止\n")
     def import_model(self):
         """导入已有的模型"""
         try:
@@ -544,98 +813,88 @@ class FineTuningGUI:
             if not model_dir:
                 return
                 
-            # 检查是否存在配置文件
-            config_path = os.path.join(model_dir, "config.json")
+            # 检查是否存在配置文件，旧版本导出的训练配置保存在config.json中
+            config_path = os.path.join(model_dir, "training_config.json")
+            if not os.path.exists(config_path):
+                config_path = os.path.join(model_dir, "config.json")
             if not os.path.exists(config_path):
-                raise FileNotFoundError(f"在所选目录中找不到config.json文件")
+                raise FileNotFoundError(f"在所选目录中找不到training_config.json或config.json文件")
                 
             # 读取配置文件
             with open(config_path, 'r', encoding='utf-8') as f:
                 config = json.load(f)
                 
-            self.log_text.insert(tk.END, f"正在导入模型配置...\n")
+            self.log(f"正在导入模型配置...\n")
             
             # 更新界面参数
-            if "base_model" in config:
-                self.model_var.set(config["base_model"])
-            if "learning_rate" in config:
-                self.lr_var.set(config["learning_rate"])
-            if "batch_size" in config:
-                self.batch_size_var.set(config["batch_size"])
-            if "epochs" in config:
-                self.epochs_var.set(config["epochs"])
-            if "max_length" in config:
-                self.max_length_var.set(config["max_length"])
-            if "use_lora" in config:
-                self.use_lora.set(config["use_lora"])
-            if "lora_rank" in config:
-                self.lora_rank.set(config["lora_rank"])
-            if "use_fp16" in config:
-                self.use_fp16.set(config["use_fp16"])
-            if "gradient_accumulation_steps" in config:
-                self.grad_accum.set(config["gradient_accumulation_steps"])
+            self.apply_config(config)
                 
             # 验证模型文件是否存在
-            from transformers import AutoTokenizer
             try:
                 # 尝试加载tokenizer以验证模型
                 tokenizer_path = os.path.join(model_dir, "tokenizer")
+                if not os.path.exists(tokenizer_path) and os.path.exists(os.path.join(model_dir, "tokenizer_config.json")):
+                    tokenizer_path = model_dir
                 if os.path.exists(tokenizer_path):
-                    AutoTokenizer.from_pretrained(tokenizer_path)
-                    self.log_text.insert(tk.END, "成功验证tokenizer\n")
+                    get_tokenizer(tokenizer_path)
+                    self.log("成功验证tokenizer\n")
             except Exception as e:
-                self.log_text.insert(tk.END, f"警告: tokenizer验证失败: {str(e)}\n")
+                self.log(f"警告: tokenizer验证失败: {str(e)}\n")
                 
             # 设置保存路径为导入模型的父目录
             parent_dir = os.path.dirname(model_dir)
             self.save_path.set(parent_dir)
             
-            self.log_text.insert(tk.END, "模型导入成功！可以开始训练或导出模型。\n")
+            self.log("模型导入成功！可以开始训练或导出模型。\n")
             messagebox.showinfo("成功", "模型配置已成功导入！")
             
         except Exception as e:
-            self.log_text.insert(tk.END, f"导入失败: {str(e)}\n")
+            self.log(f"导入失败: {str(e)}\n")
             messagebox.showerror("错误", f"导入失败: {str(e)}")
             
     def scan_local_models(self):
         """扫描本地模型目录并更新模型列表"""
+        model_dir = self.local_model_dir.get()
+        if not model_dir or not os.path.exists(model_dir):
+            messagebox.showerror("错误", "请选择有效的本地模型目录")
+            return
+
+        self.log(f"正在扫描本地模型目录: {model_dir}...\n")
+        # 网络共享目录上扫描可能较慢，在后台线程中进行
+        Thread(target=self.scan_models_process, args=(model_dir,), daemon=True).start()
+
+    def scan_models_process(self, model_dir):
         try:
-            model_dir = self.local_model_dir.get()
-            if not model_dir or not os.path.exists(model_dir):
-                messagebox.showerror("错误", "请选择有效的本地模型目录")
+            index = ModelIndex(model_dir, log=self.log)
+            records = index.refresh()
+            stats = index.stats
+            self.log(f"扫描完成: {stats['models']} 个模型, {stats['directories']} 个目录, "
+                     f"重新读取 {stats['parsed']} 个配置, 耗时 {stats['seconds']:.2f} 秒\n")
+            if not records:
+                self.log("未找到有效的模型文件夹\n")
                 return
+            self.log_bus.post(self.show_model_picker, records)
+        except Exception as e:
+            self.log(f"扫描模型目录失败: {str(e)}\n")
+            self.log_bus.post(messagebox.showerror, "错误", f"扫描模型目录失败: {str(e)}")
 
-            self.log_text.insert(tk.END, f"正在扫描本地模型目录: {model_dir}...\n")
-            
-            # 扫描目录下的所有子文件夹
+    def show_model_picker(self, records):
+        """显示模型选择对话框，records为ModelIndex的记录"""
+        try:
             model_folders = []
-            for item in os.listdir(model_dir):
-                item_path = os.path.join(model_dir, item)
-                if os.path.isdir(item_path):
-                    # 检查是否包含模型文件
-                    config_path = os.path.join(item_path, "config.json")
-                    if os.path.exists(config_path):
-                        try:
-                            with open(config_path, 'r', encoding='utf-8') as f:
-                                config = json.load(f)
-                                # 获取模型信息
-                                model_info = {
-                                    'path': item_path,
-                                    'name': item,
-                                    'config': config,
-                                    'base_model': config.get('base_model', '未知'),
-                                    'params': self._get_model_params(config),
-                                    'architecture': config.get('architectures', ['未知'])[0],
-                                    'last_modified': time.strftime('%Y-%m-%d %H:%M:%S',
-                                                                   time.localtime(os.path.getmtime(item_path)))
-                                }
-                                model_folders.append(model_info)
-                        except Exception as e:
-                            self.log_text.insert(tk.END, f"读取模型 {item} 配置失败: {str(e)}\n")
-
-            if not model_folders:
-                self.log_text.insert(tk.END, "未找到有效的模型文件夹\n")
-                return
+            for record in records:
+                # 没有训练配置的模型(如Hub缓存中的模型)直接作为基础模型使用
+                config = dict(record["train_config"] or {})
+                config.setdefault("base_model", record["path"])
+                model_folders.append({
+                    'path': record["path"],
+                    'name': record["name"],
+                    'config': config,
+                    'base_model': record["base_model"],
+                    'params': format_params(record.get("params")),
+                    'architecture': record["architecture"],
+                    'last_modified': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record["last_modified"])),
+                })
 
             # 创建模型选择对话框
             model_window = tk.Toplevel(self.root)
@@ -652,49 +911,46 @@ class FineTuningGUI:
             search_entry = ttk.Entry(search_frame, textvariable=search_var, width=40)
             search_entry.pack(side=tk.LEFT, padx=5)
             
-            # 创建表格显示模型信息
+            # 创建表格显示模型信息，只为可见行创建条目
             columns = ('名称', '基础模型', '参数量', '架构', '最后修改时间')
-            tree = ttk.Treeview(model_window, columns=columns, show='headings', height=15)
-            
-            # 设置列标题
-            for col in columns:
-                tree.heading(col, text=col)
-                tree.column(col, width=150)
+            fields = ('name', 'base_model', 'params', 'architecture', 'last_modified')
+            rows = [tuple(model[field] for field in fields) for model in model_folders]
+            index = SearchIndex(model_folders, sort_keys={
+                'params': lambda model: parse_param_count(model['params']),
+                'last_modified': lambda model: model['last_modified'],
+            })
+            sort_state = {'column': None, 'reverse': False}
+            pending = {'after': None}
             
-            # 添加滚动条
-            scrollbar = ttk.Scrollbar(model_window, orient=tk.VERTICAL, command=tree.yview)
-            scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-            tree.configure(yscrollcommand=scrollbar.set)
-            tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+            def refresh_rows():
+                ids = index.search(search_var.get())
+                if sort_state['column']:
+                    ids = index.sort(ids, fields[columns.index(sort_state['column'])], sort_state['reverse'])
+                tree.set_items(ids)
             
-            # 存储模型信息的字典
-            model_info_dict = {}
-            
-            def update_tree(search_text=''):
-                tree.delete(*tree.get_children())
-                for model in model_folders:
-                    if search_text.lower() in model['name'].lower() or \
-                       search_text.lower() in model['base_model'].lower():
-                        item = tree.insert('', tk.END, values=(
-                            model['name'],
-                            model['base_model'],
-                            model['params'],
-                            model['architecture'],
-                            model['last_modified']
-                        ))
-                        model_info_dict[item] = model
+            def on_sort(column):
+                if sort_state['column'] == column:
+                    sort_state['reverse'] = not sort_state['reverse']
+                else:
+                    sort_state['column'], sort_state['reverse'] = column, False
+                for col in columns:
+                    arrow = (' ▼' if sort_state['reverse'] else ' ▲') if col == column else ''
+                    tree.heading(col, text=col + arrow)
+                refresh_rows()
             
             def on_search(*args):
-                update_tree(search_var.get())
+                # 输入停顿后再查询，连续输入时不重复刷新
+                if pending['after']:
+                    model_window.after_cancel(pending['after'])
+                pending['after'] = model_window.after(150, refresh_rows)
             
-            search_var.trace('w', on_search)
+            search_var.trace_add('write', on_search)
             
             def select_model():
-                selection = tree.selection()
-                if selection:
-                    item = selection[0]
-                    if item in model_info_dict:
-                        selected_model = model_info_dict[item]
+                selected = tree.selected_id()
+                if selected is not None:
+                    if selected < len(model_folders):
+                        selected_model = model_folders[selected]
                         config = selected_model['config']
                         
                         # 更新界面参数
@@ -710,377 +966,126 @@ class FineTuningGUI:
                                         break
                         
                         # 更新其他训练参数
-                        if "learning_rate" in config:
-                            self.lr_var.set(config["learning_rate"])
-                        if "batch_size" in config:
-                            self.batch_size_var.set(config["batch_size"])
-                        if "epochs" in config:
-                            self.epochs_var.set(config["epochs"])
-                        if "max_length" in config:
-                            self.max_length_var.set(config["max_length"])
-                        if "use_lora" in config:
-                            self.use_lora.set(config["use_lora"])
-                        if "lora_rank" in config:
-                            self.lora_rank.set(config["lora_rank"])
+                        self.apply_config({k: v for k, v in config.items() if k != "base_model"})
                         
-                        self.log_text.insert(tk.END, f"已加载模型配置: {selected_model['path']}\n")
+                        self.log(f"已加载模型配置: {selected_model['path']}\n")
                         model_window.destroy()
                     else:
                         messagebox.showerror("错误", "无法加载所选模型的配置信息")
                 else:
                     messagebox.showerror("错误", "请先选择一个模型")
             
+            tree = VirtualTreeview(model_window, columns, rows, on_sort=on_sort, on_activate=select_model)
+            
             # 添加按钮框架
             button_frame = ttk.Frame(model_window)
-            button_frame.pack(pady=10)
+            button_frame.pack(side=tk.BOTTOM, pady=10)
+            tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
             
             ttk.Button(button_frame, text="选择模型", command=select_model).pack(side=tk.LEFT, padx=10)
             ttk.Button(button_frame, text="取消", command=model_window.destroy).pack(side=tk.LEFT, padx=10)
             
             # 初始显示所有模型
-            update_tree()
+            refresh_rows()
             
             # 等待窗口关闭
             self.root.wait_window(model_window)
             
         except Exception as e:
-            self.log_text.insert(tk.END, f"扫描模型目录失败: {str(e)}\n")
-            messagebox.showerror("错误", f"扫描模型目录失败: {str(e)}")
+            self.log(f"打开模型列表失败: {str(e)}\n")
+            messagebox.showerror("错误", f"打开模型列表失败: {str(e)}")
     
-    def _get_model_params(self, config):
-        """从模型配置中获取参数量"""
-        try:
-            # 尝试从不同的配置字段中获取参数量信息
-            if 'n_parameters' in config:
-                params = config['n_parameters']
-            elif 'num_parameters' in config:
-                params = config['num_parameters']
-            else:
-                # 估算参数量
-                hidden_size = config.get('hidden_size', 0)
-                num_layers = config.get('num_hidden_layers', 0)
-                vocab_size = config.get('vocab_size', 0)
-                if hidden_size and num_layers and vocab_size:
-                    # 简单估算，实际参数量可能与此不同
-                    params = hidden_size * hidden_size * num_layers * 4 + hidden_size * vocab_size
-                else:
-                    return "未知"
-            
-            # 格式化参数量显示
-            if params >= 1e9:
-                return f"{params/1e9:.1f}B"
-            elif params >= 1e6:
-                return f"{params/1e6:.1f}M"
-            else:
-                return f"{params:,}"
-        except Exception:
-            return "未知"
     def export_model(self):
         if not self.save_path.get():
             messagebox.showerror("错误", "请选择保存路径")
             return
-            
+        # 合并导出需要读写完整权重，放到后台线程避免界面卡住
+        Thread(target=self.export_process, args=(self.collect_config(),), daemon=True).start()
+
+    def export_process(self, config):
+        self.wait_prewarm()
         try:
-            export_path = os.path.join(self.save_path.get(), "exported_model")
-            os.makedirs(export_path, exist_ok=True)
+            export_path = os.path.join(config["save_path"], "exported_model")
+            latest_model_path = find_latest_checkpoint(config["save_path"])
+            if latest_model_path is None:
+                raise FileNotFoundError(f"找不到训练好的模型: {config['save_path']}")
             
-            self.log_text.insert(tk.END, f"正在导出模型到 {export_path}...\n")
-            
-            # 保存训练配置
-            config = {
-                "base_model": self.model_var.get(),
-                "learning_rate": self.lr_var.get(),
-                "batch_size": self.batch_size_var.get(),
-                "epochs": self.epochs_var.get(),
-                "max_length": self.max_length_var.get(),
-                "use_lora": self.use_lora.get(),
-                "lora_rank": self.lora_rank.get(),
-                "use_fp16": self.use_fp16.get(),
-                "gradient_accumulation_steps": self.grad_accum.get()
-            }
+            self.log(f"正在导出模型 {latest_model_path} 到 {export_path}...\n")
+            if config["export_mode"] == "onnx":
+                from onnx_export import export_onnx, load_for_export, verify_onnx
+                # 与训练相同: 离线模式下基础模型来自本地模型目录，不访问Hub
+                offline = _to_bool(config["offline_mode"])
+                model = load_for_export(latest_model_path, resolve_model_path(dict(config, offline_mode=offline)),
+                                        local_files_only=offline, log=self.log)
+                tokenizer_dir = os.path.join(latest_model_path, "tokenizer")
+                onnx_path = export_onnx(model, export_path,
+                                        tokenizer_dir=tokenizer_dir if os.path.isdir(tokenizer_dir) else latest_model_path,
+                                        log=self.log)
+                self.log(f"ONNX与PyTorch的logits最大误差: {verify_onnx(model, onnx_path):.2e}\n")
+                self.log(f"CPU推理性能对比: python -m onnx_export --model {latest_model_path} --output {export_path} --benchmark\n")
+            elif not is_adapter_checkpoint(latest_model_path):
+                export_full(latest_model_path, export_path, log=self.log)
+            elif config["export_mode"] == "merged":
+                # 与训练相同: 离线模式下基础模型来自本地模型目录，不访问Hub
+                offline = _to_bool(config["offline_mode"])
+                export_merged(
+                    resolve_model_path(dict(config, offline_mode=offline)), latest_model_path, export_path,
+                    local_files_only=offline, log=self.log,
+                )
+            else:
+                export_adapter(latest_model_path, export_path, log=self.log)
             
-            with open(os.path.join(export_path, "config.json"), 'w', encoding='utf-8') as f:
+            # 保存训练配置，可直接用于 python -m train_engine --config
+            with open(os.path.join(export_path, "training_config.json"), 'w', encoding='utf-8') as f:
                 json.dump(config, f, indent=2, ensure_ascii=False)
             
-            # 实际的模型保存代码
-            from transformers import AutoTokenizer
-            from unsloth import FastLanguageModel
-            import torch
-            from peft import get_peft_model, LoraConfig
-            
-            # 加载最新的模型
-            model_name = self.model_var.get()
-            max_length = int(self.max_length_var.get())
-            
-            # 加载tokenizer
-            self.log_text.insert(tk.END, "正在加载tokenizer...\n")
-            tokenizer = AutoTokenizer.from_pretrained(model_name)
-            
-            # 加载最新保存的模型
-            latest_epoch = int(self.epochs_var.get())
-            latest_model_path = os.path.join(self.save_path.get(), f"epoch_{latest_epoch}")
-            
-            if os.path.exists(latest_model_path):
-                self.log_text.insert(tk.END, f"正在加载最新模型: {latest_model_path}...\n")
-                
-                # 加载模型
-                if self.use_lora.get():
-                    # 加载基础模型
-                    base_model = FastLanguageModel.from_pretrained(
-                        model_name=model_name,
-                        max_seq_length=max_length,
-                        dtype=torch.float16 if self.use_fp16.get() else torch.float32
-                    )
-                    
-                    # 配置LoRA
-                    lora_config = LoraConfig(
-                        r=int(self.lora_rank.get()),
-                        target_modules=["q_proj", "k_proj", "v_proj", "o_proj"],
-                        bias="none",
-                        task_type="CAUSAL_LM"
-                    )
-                    
-                    # 加载LoRA权重
-                    model = get_peft_model(base_model, lora_config)
-                    model.load_adapter(latest_model_path)
-                else:
-                    # 直接加载完整模型
-                    model = FastLanguageModel.from_pretrained(
-                        model_name=latest_model_path,
-                        max_seq_length=max_length,
-                        dtype=torch.float16 if self.use_fp16.get() else torch.float32
-                    )
-                
-                # 保存模型到导出目录
-                self.log_text.insert(tk.END, "正在保存模型...\n")
-                model.save_pretrained(export_path)
-                tokenizer.save_pretrained(export_path)
-                
-                self.log_text.insert(tk.END, "模型导出完成！\n")
-                messagebox.showinfo("成功", "模型导出完成！")
-            else:
-                raise FileNotFoundError(f"找不到训练好的模型: {latest_model_path}")
+            self.log("模型导出完成！\n")
+            self.log_bus.post(messagebox.showinfo, "成功", "模型导出完成！")
             
         except Exception as e:
-            self.log_text.insert(tk.END, f"导出失败: {str(e)}\n")
-            messagebox.showerror("错误", f"导出失败: {str(e)}")
-    def training_process(self):
+            self.log(f"导出失败: {str(e)}\n")
+            self.log_bus.post(messagebox.showerror, "错误", f"导出失败: {str(e)}")
+    def training_process(self, resume_from_checkpoint=None):
+        self.wait_prewarm()
         try:
-            self.log_text.insert(tk.END, "正在初始化训练...\n")
-            
-            # 验证输入参数
-            if not self.data_path.get():
-                raise ValueError("请选择训练数据文件")
-            if not os.path.exists(self.data_path.get()):
-                raise ValueError("训练数据文件不存在")
-                
-            # 创建保存目录
-            os.makedirs(self.save_path.get(), exist_ok=True)
-            
-            # 加载训练数据
-            with open(self.data_path.get(), 'r', encoding='utf-8') as f:
-                training_data = json.load(f)
-            
-            # 设置网络参数
-            if self.proxy.get():
-                os.environ["HTTP_PROXY"] = self.proxy.get()
-                os.environ["HTTPS_PROXY"] = self.proxy.get()
-                self.log_text.insert(tk.END, f"已设置代理: {self.proxy.get()}\n")
-            
-            # 设置请求超时和重试
-            try:
-                timeout = int(self.timeout.get())
-                retries = int(self.max_retries.get())
-                requests.adapters.DEFAULT_RETRIES = retries
-                requests.DEFAULT_TIMEOUT = timeout
-                self.log_text.insert(tk.END, f"已设置连接超时: {timeout}秒, 重试次数: {retries}\n")
-            except ValueError:
-                self.log_text.insert(tk.END, "超时或重试次数设置无效，使用默认值\n")
-            
-            # 导入必要的库
-            from transformers import AutoTokenizer, TrainingArguments
-            from unsloth import FastLanguageModel, is_bfloat16_supported
-            from trl import SFTTrainer
-            import torch
-            from datasets import Dataset
-            import bitsandbytes as bnb
-            
-            # 获取训练参数
-            model_name = self.model_var.get()
-            learning_rate = float(self.lr_var.get())
-            batch_size = int(self.batch_size_var.get())
-            epochs = int(self.epochs_var.get())
-            max_length = int(self.max_length_var.get())
-            grad_accum_steps = int(self.grad_accum.get())
-            
-            # 初始化模型和tokenizer
-            self.log_text.insert(tk.END, "正在加载模型和tokenizer...\n")
-            
-            # 添加错误处理和重试机制
-            max_attempts = retries
-            attempt = 0
-            success = False
-            
-            # 设置量化参数
-            load_kwargs = {
-                "model_name": model_name,
-                "max_seq_length": max_length,
-            }
-            
-            if self.use_4bit.get():
-                load_kwargs.update({
-                    "load_in_4bit": True,
-                    "bnb_4bit_quant_type": "nf4",
-                    "bnb_4bit_compute_dtype": torch.float16,
-                })
-                self.log_text.insert(tk.END, "启用4-bit量化训练...\n")
-            elif self.use_8bit.get():
-                load_kwargs.update({"load_in_8bit": True})
-                self.log_text.insert(tk.END, "启用8-bit量化训练...\n")
-            else:
-                load_kwargs.update({"dtype": torch.float16 if self.use_fp16.get() else torch.float32})
-            
-            while attempt < max_attempts and not success:
-                try:
-                    attempt += 1
-                    if self.offline_mode.get():
-                        self.log_text.insert(tk.END, "使用离线模式加载本地模型...\n")
-                        local_model_path = os.path.join(self.local_model_dir.get(), os.path.basename(model_name))
-                        if os.path.exists(local_model_path):
-                            load_kwargs["model_name"] = local_model_path
-                            model, tokenizer = FastLanguageModel.from_pretrained(**load_kwargs)
-                        else:
-                            self.log_text.insert(tk.END, f"错误: 本地模型路径 {local_model_path} 不存在\n")
-                            self.log_text.insert(tk.END, "请确保模型已下载到本地模型目录，或取消勾选离线模式\n")
-                            raise FileNotFoundError(f"本地模型不存在: {local_model_path}")
-                    else:
-                        model, tokenizer = FastLanguageModel.from_pretrained(**load_kwargs)
-                    success = True
-                except Exception as e:
-                    if attempt < max_attempts:
-                        wait_time = attempt * 5
-                        self.log_text.insert(tk.END, f"加载失败 (尝试 {attempt}/{max_attempts}): {str(e)}\n")
-                        self.log_text.insert(tk.END, f"等待 {wait_time} 秒后重试...\n")
-                        self.root.update()
-                        time.sleep(wait_time)
-                    else:
-                        self.log_text.insert(tk.END, f"加载失败，已达到最大重试次数: {str(e)}\n")
-                        raise
-            
-            if not success:
-                raise Exception("模型加载失败，请检查网络连接或使用离线模式")
-                
-            self.log_text.insert(tk.END, "模型加载成功!\n")
-            
-            # 配置LoRA
-            if self.use_lora.get():
-                model = FastLanguageModel.get_peft_model(
-                    model,
-                    r=int(self.lora_rank.get()),
-                    target_modules=["q_proj", "k_proj", "v_proj", "o_proj", "gate_proj", "up_proj", "down_proj"],
-                    bias="none",
-                    task_type="CAUSAL_LM"
-                )
-                self.log_text.insert(tk.END, "已启用LoRA配置\n")
-            
-            # 准备数据集
-            dataset = Dataset.from_list([{"text": item["text"]} for item in training_data])
-            
-            # 配置训练参数
-            training_args = TrainingArguments(
-                per_device_train_batch_size=batch_size,
-                gradient_accumulation_steps=grad_accum_steps,
-                learning_rate=learning_rate,
-                num_train_epochs=epochs,
-                fp16=not is_bfloat16_supported() and not (self.use_4bit.get() or self.use_8bit.get()),
-                bf16=is_bfloat16_supported() and not (self.use_4bit.get() or self.use_8bit.get()),
-                logging_steps=1,
-                optim=self.optimizer_var.get(),
-                weight_decay=float(self.weight_decay.get()),
-                lr_scheduler_type=self.lr_scheduler.get(),
-                output_dir=self.save_path.get(),
-                save_strategy="steps",
-                save_steps=100,
-                report_to="none",
-                remove_unused_columns=False,
-            )
-            
-            # 初始化SFTTrainer
-            trainer = SFTTrainer(
-                model=model,
-                tokenizer=tokenizer,
-                train_dataset=dataset,
-                dataset_text_field="text",
-                max_seq_length=max_length,
-                dataset_num_proc=int(self.num_proc.get()),
-                packing=self.use_packing.get(),
-                args=training_args,
+            run_log = self.log_bus.open_run_log(self.save_path.get() or ".")
+            self.log(f"本次训练日志文件: {run_log}\n")
+            self.engine = TrainingEngine(
+                self.collect_config(),
+                log=self.log,
+                on_progress=self.set_progress,
+                on_metrics=self.update_visualization,
             )
-            
-            # 训练循环
-            try:
-                self.best_loss = float('inf')
-                patience = 3  # 早停耐心值
-                no_improve = 0  # 未改善次数
-                
-                for epoch in range(epochs):
-                    if not self.training_active:
-                        raise InterruptedError("训练被用户中断")
-                    
-                    self.current_epoch = epoch + 1
-                    self.log_text.insert(tk.END, f"\n开始训练 Epoch {self.current_epoch}/{epochs}\n")
-                    
-                    # 训练一个epoch
-                    train_results = trainer.train()
-                    
-                    # 更新进度条和可视化
-                    progress = (self.current_epoch / epochs) * 100
-                    self.progress['value'] = progress
-                    
-                    # 更新日志和可视化
-                    loss = train_results.training_loss
-                    self.log_text.insert(tk.END, f"Epoch {self.current_epoch}/{epochs}, Loss: {loss:.4f}\n")
-                    self.log_text.see(tk.END)
-                    self.update_visualization(loss, learning_rate)
-                    self.root.update()
-                    
-                    # 早停检查
-                    if loss < self.best_loss:
-                        self.best_loss = loss
-                        no_improve = 0
-                        # 保存最佳模型
-                        best_model_path = os.path.join(self.save_path.get(), "best_model")
-                        trainer.save_model(best_model_path)
-                        tokenizer.save_pretrained(os.path.join(best_model_path, "tokenizer"))
-                        self.log_text.insert(tk.END, f"发现更好的模型，已保存到 {best_model_path}\n")
-                    else:
-                        no_improve += 1
-                        if no_improve >= patience:
-                            self.log_text.insert(tk.END, f"训练loss连续{patience}个epoch未改善，触发早停机制\n")
-                            break
-                    
-                    # 保存当前epoch的模型
-                    save_path = os.path.join(self.save_path.get(), f"epoch_{self.current_epoch}")
-                    trainer.save_model(save_path)
-                    tokenizer.save_pretrained(os.path.join(save_path, "tokenizer"))
-                    
-                    self.log_text.insert(tk.END, f"Epoch {self.current_epoch} 完成，模型已保存到 {save_path}\n")
-                    self.log_text.see(tk.END)
-                
-                self.log_text.insert(tk.END, "\n训练完成！\n")
-                self.log_text.insert(tk.END, f"最佳loss: {self.best_loss:.4f}\n")
-                self.progress['value'] = 100
-                
-            except Exception as e:
-                if not isinstance(e, InterruptedError):
-                    raise e
+            if not self.check_memory(self.engine):
+                self.log("已取消训练\n")
+                if resume_from_checkpoint:
+                    # 保留暂停时的检查点，之后仍可继续
+                    self.paused_checkpoint = resume_from_checkpoint
+                    self.log_bus.post(self.pause_btn.config, {"text": "继续训练"})
+                return
+            result = self.engine.run(resume_from_checkpoint, log_memory=False)
+            if result["status"] == "paused":
+                self.paused_checkpoint = result["checkpoint"]
+                self.log_bus.post(self.pause_btn.config, {"text": "继续训练"})
             
         except Exception as e:
-            self.log_text.insert(tk.END, f"训练出错: {str(e)}\n")
-            messagebox.showerror("错误", f"训练出错: {str(e)}")
+            self.log(f"训练出错: {str(e)}\n")
+            self.log_bus.post(messagebox.showerror, "错误", f"训练出错: {str(e)}")
             raise
         finally:
             self.training_active = False
+            self.log_bus.close_run_log()
+    def set_progress(self, value):
+        """更新进度条，可在训练线程中调用"""
+        self.log_bus.post(self.progress.config, {"value": value})
+    def release_models(self):
+        """释放注册表中缓存的模型和tokenizer"""
+        if self.training_active:
+            messagebox.showerror("错误", "训练进行中，不能释放模型")
+            return
+        freed = registry.total_bytes
+        registry.clear()
+        self.log(f"已释放已加载的模型，约 {freed / (1 << 30):.2f} GB\n")
     def update_model_options(self, event=None):
         """根据选择的模型系列更新模型大小选项"""
         family = self.model_family.get()
@@ -1098,7 +1103,7 @@ class FineTuningGUI:
         directory = filedialog.askdirectory(title="选择本地模型目录")
         if directory:
             self.local_model_dir.set(directory)
-            self.log_text.insert(tk.END, f"已设置本地模型目录: {directory}\n")
+            self.log(f"已设置本地模型目录: {directory}\n")
     
     def update_model_name(self, event=None):
         """根据选择的模型系列和大小更新完整模型名称"""